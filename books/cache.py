@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+
+CATALOG_VERSION_KEY = "books:catalog:version"
+
+
+def get_catalog_cache():
+    """
+    The CATALOG_CACHE every worker shares. A missing one is an error:
+    with a per-process version a write on one worker would leave the
+    others serving stale pages and ETags.
+    """
+    try:
+        return caches[settings.CATALOG_CACHE]
+    except InvalidCacheBackendError:
+        raise ImproperlyConfigured(
+            f"The '{settings.CATALOG_CACHE}' cache is not configured; "
+            "set CATALOG_CACHE_URL or CACHE_URL to a Redis URL."
+        )
+
+
+def get_catalog_version() -> int:
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1, so a version key evicted
+        # from the cache never reuses a number that still has pages.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1_000_000, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _incr_catalog_version() -> None:
+    try:
+        get_catalog_cache().incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def bump_catalog_version() -> None:
+    """
+    Invalidate every cached catalog response.
+    Bumped again after commit, so pages cached from the old rows
+    while the transaction was still open are dropped as well.
+    """
+    _incr_catalog_version()
+    transaction.on_commit(_incr_catalog_version)
+
+
+def catalog_cache_key(request, version: int) -> str:
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"books:catalog:{version}:{path}"
+
+
+def catalog_etag(request, version: int) -> str:
+    """Strong ETag of one catalog URL in one representation."""
+    representation = (
+        f"{version}:{request.get_full_path()}:"
+        f"{request.META.get('HTTP_ACCEPT', '')}"
+    )
+    return quote_etag(hashlib.md5(representation.encode()).hexdigest())
+
+
+def cached_catalog_response(request, handler, *args, **kwargs):
+    """
+    Answer conditional GETs with 304 before any query or serialization,
+    else serve handler's response data from cache for the current version.
+    Only the ETag is validated: Last-Modified has one-second granularity
+    and would miss a change made in the second of a cached read.
+    """
+    version = get_catalog_version()
+    etag = catalog_etag(request, version)
+
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    cache = get_catalog_cache()
+    key = catalog_cache_key(request, version)
+    data = cache.get(key)
+
+    if data is not None:
+        response = Response(data)
+    else:
+        response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Accept"])
+    return response
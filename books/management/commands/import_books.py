@@ -0,0 +1,58 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importers import BookImporter, read_rows
+from books.models import BookImportJob
+from books.tasks import import_books
+
+
+class Command(BaseCommand):
+    """Import books from a CSV or JSONL supplier feed, upserting on ISBN"""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Feed format, detected from the file extension by default",
+        )
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="run_async",
+            help="Upload the file and run the import as a Celery job",
+        )
+
+    def handle(self, *args, **options) -> None:
+        path = options["path"]
+        file_format = options["format"] or BookImportJob.detect_format(path)
+        if file_format is None:
+            raise CommandError("Cannot detect the feed format, use --format.")
+
+        if options["run_async"]:
+            job = BookImportJob()
+            with open(path, "rb") as source:
+                job.source.save(f"feed.{file_format}", File(source))
+            import_books.delay(job.id)
+            self.stdout.write(f"Import job {job.id} queued.")
+            return
+
+        importer = BookImporter(
+            batch_size=options["batch_size"],
+            on_progress=self.report_progress,
+        )
+        with open(path, "rb") as source:
+            importer.run(read_rows(source, file_format))
+
+        for error in importer.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{importer.imported_rows} books imported, "
+                f"{importer.failed_rows} rows rejected."
+            )
+        )
+
+    def report_progress(self, importer: BookImporter) -> None:
+        self.stdout.write(f"{importer.processed_rows} rows processed...")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from books.models import BookFacetCount
+
+
+class Command(BaseCommand):
+    """Recount the catalog facet counters from the books table"""
+
+    def handle(self, *args, **options) -> None:
+        BookFacetCount.objects.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {BookFacetCount.objects.count()} facet counters"
+            )
+        )
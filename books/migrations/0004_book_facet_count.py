@@ -0,0 +1,68 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_facets(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    BookFacetCount = apps.get_model("books", "BookFacetCount")
+    db_alias = schema_editor.connection.alias
+    books = Book.objects.using(db_alias)
+
+    counters = [
+        BookFacetCount(facet=field, value=value, count=count)
+        for field in ("cover", "author")
+        for value, count in books.values_list(field)
+        .annotate(count=Count("id"))
+        .order_by()
+    ]
+    counters.append(
+        BookFacetCount(
+            facet="availability",
+            value="available",
+            count=books.filter(inventory__gt=0).count(),
+        )
+    )
+    BookFacetCount.objects.using(db_alias).bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_book_isbn_bookimportjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookFacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("facet", models.CharField(max_length=20)),
+                ("value", models.CharField(max_length=50)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["facet", "-count"], name="book_facet_count_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="bookfacetcount",
+            constraint=models.UniqueConstraint(
+                fields=("facet", "value"), name="unique_book_facet_value"
+            ),
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_facet_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookPopularity",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="books.book",
+                    ),
+                ),
+                ("week_borrows", models.PositiveIntegerField(default=0)),
+                ("month_borrows", models.PositiveIntegerField(default=0)),
+                ("total_borrows", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "book popularity",
+            },
+        ),
+        migrations.CreateModel(
+            name="BookSimilarity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.PositiveIntegerField()),
+                ("position", models.PositiveSmallIntegerField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similarities",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "similar_book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "book similarities",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="booksimilarity",
+            constraint=models.UniqueConstraint(
+                fields=("book", "position"), name="unique_book_similarity_position"
+            ),
+        ),
+    ]
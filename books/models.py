@@ -1,6 +1,133 @@
+import os
+from collections import Counter
 from decimal import Decimal
-from django.db import models
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Greatest
 from django.core.validators import MinValueValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramWordSimilarity,
+)
+
+from books.cache import bump_catalog_version
+
+
+SEARCH_CONFIG = "english"
+
+
+class BookQuerySet(models.QuerySet):
+
+    def _adjust_inventory(
+        self,
+        counts: dict[int, int],
+        sign: int
+    ) -> dict[int, int]:
+        book_ids = list(counts)
+        cases = " ".join("WHEN %s THEN %s" for _ in book_ids)
+        case_params = [
+            param
+            for book_id in book_ids
+            for param in (book_id, counts[book_id])
+        ]
+        placeholders = ", ".join("%s" for _ in book_ids)
+        operator = "-" if sign < 0 else "+"
+        # Only taking copies needs the guard; the inventory CHECK
+        # constraint would reject it anyway, but with an error.
+        guard = (
+            f"AND inventory >= CASE id {cases} END" if sign < 0 else ""
+        )
+        sql = (
+            f"UPDATE {Book._meta.db_table} "
+            f"SET inventory = inventory {operator} CASE id {cases} END "
+            f"WHERE id IN ({placeholders}) {guard} "
+            f"RETURNING id, inventory"
+        )
+        params = case_params + book_ids
+        if sign < 0:
+            params += case_params
+
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            inventory = dict(cursor.fetchall())
+
+        if inventory:
+            bump_catalog_version()
+            # A book leaves "available" when its last copy goes out
+            # and comes back when the first copy is returned.
+            changed = sum(
+                1 for book_id, left in inventory.items()
+                if left == (0 if sign < 0 else counts[book_id])
+            )
+            BookFacetCount.objects.add(
+                {(BookFacetCount.AVAILABILITY, BookFacetCount.AVAILABLE):
+                    sign * changed}
+            )
+        return inventory
+
+    def checkout_copies(self, counts: dict[int, int]) -> dict[int, int]:
+        """
+        Take counts[book_id] copies of each book in a single
+        UPDATE ... WHERE inventory >= n RETURNING statement.
+        Returns the new inventory of the books that had enough copies;
+        the others are left out and unchanged, so the caller decides
+        whether to roll back the whole checkout.
+        """
+        return self._adjust_inventory(counts, -1)
+
+    def return_copies(self, counts: dict[int, int]) -> dict[int, int]:
+        """Put copies back in one statement, returning new inventory."""
+        return self._adjust_inventory(counts, 1)
+
+    def search(self, text: str) -> "BookQuerySet":
+        """
+        Match books by full-text query on title/author or by
+        trigram word similarity, so typos and prefixes still hit.
+        """
+        query = SearchQuery(
+            text,
+            config=SEARCH_CONFIG,
+            search_type="websearch"
+        )
+        return self.filter(
+            Q(search_vector=query)
+            | Q(title__trigram_word_similar=text)
+            | Q(author__trigram_word_similar=text)
+        )
+
+    def ranked_search(self, text: str) -> "BookQuerySet":
+        """Search ordered by the best of text rank and similarity."""
+        query = SearchQuery(
+            text,
+            config=SEARCH_CONFIG,
+            search_type="websearch"
+        )
+        return self.search(text).annotate(
+            rank=Greatest(
+                SearchRank(models.F("search_vector"), query),
+                TrigramWordSimilarity(text, "title"),
+                TrigramWordSimilarity(text, "author"),
+            )
+        ).order_by("-rank", "id")
+
+    def popular(self) -> "BookQuerySet":
+        """Most borrowed this month first, never-borrowed books last."""
+        return self.order_by(
+            models.F("popularity__month_borrows").desc(nulls_last=True),
+            models.F("popularity__week_borrows").desc(nulls_last=True),
+            models.F("popularity__total_borrows").desc(nulls_last=True),
+            "id",
+        )
+
+    def similar_to(self, book_id: int) -> "BookQuerySet":
+        """The precomputed "also borrowed" neighbours of a book."""
+        return self.filter(similar_to__book_id=book_id).order_by(
+            "similar_to__position"
+        )
 
 
 class Book(models.Model):
@@ -21,6 +148,265 @@ class Book(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(Decimal("0.01"))]
     )
+    isbn = models.CharField(
+        max_length=13,
+        unique=True,
+        null=True,
+        blank=True
+    )
+    # Maintained by the books_book_search_vector_update trigger,
+    # so bulk writes and raw SQL stay in sync as well as save().
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=["search_vector"],
+                name="book_search_vector_idx"
+            ),
+            GinIndex(
+                fields=["title"],
+                opclasses=["gin_trgm_ops"],
+                name="book_title_trgm_idx"
+            ),
+            GinIndex(
+                fields=["author"],
+                opclasses=["gin_trgm_ops"],
+                name="book_author_trgm_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.title}: daily fee is ${self.daily_fee}"
+
+    @staticmethod
+    def facet_values(
+        cover: str,
+        author: str,
+        inventory: int
+    ) -> list[tuple[str, str]]:
+        """The (facet, value) buckets a book with these fields counts in"""
+        values = [
+            (BookFacetCount.COVER, cover),
+            (BookFacetCount.AUTHOR, author),
+        ]
+        if int(inventory) > 0:
+            values.append(
+                (BookFacetCount.AVAILABILITY, BookFacetCount.AVAILABLE)
+            )
+        return values
+
+
+class BookFacetCountQuerySet(models.QuerySet):
+
+    def add(self, deltas: dict[tuple[str, str], int]) -> None:
+        """
+        Add deltas to the (facet, value) counters with one
+        INSERT ... ON CONFLICT DO UPDATE SET count = count + delta,
+        so concurrent writers never lose an update.
+        """
+        # Sorted rows lock counters in the same order in every writer.
+        rows = sorted(
+            (facet, value, delta)
+            for (facet, value), delta in deltas.items()
+            if delta
+        )
+        if not rows:
+            return
+
+        table = BookFacetCount._meta.db_table
+        placeholders = ", ".join("(%s, %s, %s)" for _ in rows)
+        sql = (
+            f"INSERT INTO {table} (facet, value, count) "
+            f"VALUES {placeholders} "
+            f"ON CONFLICT (facet, value) "
+            f"DO UPDATE SET count = {table}.count + EXCLUDED.count"
+        )
+        params = [param for row in rows for param in row]
+
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def rebuild(self) -> None:
+        """
+        Recount every facet from the books table. The counters are
+        locked against add() while the books are counted, so a delta
+        is either already in the books read or applied on top.
+        """
+        table = self.model._meta.db_table
+        books = Book.objects.using(self.db)
+
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+
+            counts = Counter()
+            for field in ("cover", "author"):
+                for value, count in (
+                    books.values_list(field).annotate(count=Count("id"))
+                    .order_by()
+                ):
+                    counts[(field, value)] = count
+            counts[(self.model.AVAILABILITY, self.model.AVAILABLE)] = (
+                books.filter(inventory__gt=0).count()
+            )
+
+            self.all().delete()
+            self.bulk_create(
+                self.model(facet=facet, value=value, count=count)
+                for (facet, value), count in counts.items()
+            )
+
+    def panel(self, author_limit: int | None = None) -> dict:
+        """Non-empty counters grouped by facet, top authors first."""
+        author_limit = author_limit or settings.FACET_AUTHOR_LIMIT
+        counters = self.filter(count__gt=0)
+        panel = {
+            self.model.COVER: {},
+            self.model.AVAILABILITY: {self.model.AVAILABLE: 0},
+            self.model.AUTHOR: [],
+        }
+
+        for facet, value, count in counters.exclude(
+            facet=self.model.AUTHOR
+        ).values_list("facet", "value", "count"):
+            panel[facet][value] = count
+
+        panel[self.model.AUTHOR] = [
+            {"value": value, "count": count}
+            for value, count in counters.filter(
+                facet=self.model.AUTHOR
+            ).order_by("-count", "value").values_list(
+                "value", "count"
+            )[:author_limit]
+        ]
+        return panel
+
+
+class BookFacetCount(models.Model):
+    """
+    Number of books per cover, per author and available now.
+    Kept up to date by the Book signals and inventory updates,
+    so facet panels never have to GROUP BY the books table.
+    """
+    COVER = "cover"
+    AUTHOR = "author"
+    AVAILABILITY = "availability"
+    AVAILABLE = "available"
+
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    objects = BookFacetCountQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "value"],
+                name="unique_book_facet_value"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["facet", "-count"],
+                name="book_facet_count_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.facet}={self.value}: {self.count}"
+
+
+class BookPopularity(models.Model):
+    """Borrow counts per book over sliding windows, rebuilt periodically"""
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity"
+    )
+    week_borrows = models.PositiveIntegerField(default=0)
+    month_borrows = models.PositiveIntegerField(default=0)
+    total_borrows = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "book popularity"
+
+    def __str__(self) -> str:
+        return f"Book {self.book_id}: {self.month_borrows} borrows this month"
+
+
+class BookSimilarity(models.Model):
+    """
+    One of a book's top-K "also borrowed" neighbours: `score` readers
+    borrowed both books, `position` is the neighbour's rank from 1.
+    """
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="similarities"
+    )
+    similar_book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="similar_to"
+    )
+    score = models.PositiveIntegerField()
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name_plural = "book similarities"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "position"],
+                name="unique_book_similarity_position"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"Book {self.book_id} ~ book {self.similar_book_id}: "
+            f"{self.score}"
+        )
+
+
+class BookImportJob(models.Model):
+
+    class StatusChoices(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        RUNNING = "RUNNING", "Running"
+        COMPLETED = "COMPLETED", "Completed"
+        FAILED = "FAILED", "Failed"
+
+    FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+    source = models.FileField(upload_to="imports/books/")
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.PENDING
+    )
+    processed_rows = models.PositiveIntegerField(default=0)
+    imported_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="book_imports"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Book import {self.id}: {self.status}"
+
+    @staticmethod
+    def detect_format(name: str) -> str | None:
+        extension = os.path.splitext(name)[1].lower()
+        return BookImportJob.FORMATS.get(extension)
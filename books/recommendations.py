@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from books.cache import bump_catalog_version
+from books.models import BookPopularity, BookSimilarity
+from borrowings.models import ArchivedBorrowing, Borrowing
+
+
+POPULARITY_WINDOWS = {"week_borrows": 7, "month_borrows": 30}
+
+
+def rebuild_popularity() -> int:
+    """
+    Recount borrows per book for every window in one GROUP BY
+    and replace the popularity table. Returns the number of rows.
+    """
+    today = timezone.localdate()
+    windows = {
+        field: Count(
+            "id",
+            filter=Q(borrow_date__gt=today - timedelta(days=days))
+        )
+        for field, days in POPULARITY_WINDOWS.items()
+    }
+    rows = (
+        Borrowing.objects.order_by()
+        .values("book_id")
+        .annotate(total_borrows=Count("id"), **windows)
+    )
+
+    popularity = {row["book_id"]: row for row in rows.iterator()}
+    # Archived loans are older than any window but still count in total.
+    for book_id, archived in (
+        ArchivedBorrowing.objects.order_by()
+        .values_list("book_id")
+        .annotate(Count("id"))
+    ):
+        row = popularity.setdefault(
+            book_id,
+            {"book_id": book_id, "total_borrows": 0}
+        )
+        row["total_borrows"] += archived
+
+    with transaction.atomic():
+        BookPopularity.objects.all().delete()
+        popularity = BookPopularity.objects.bulk_create(
+            BookPopularity(**row) for row in popularity.values()
+        )
+        bump_catalog_version()
+    return len(popularity)
+
+
+def rebuild_similarities(limit: int | None = None) -> int:
+    """
+    Build the book-to-book co-borrowing counts from distinct
+    (user, book) pairs, archived loans included, and keep each book's
+    top `limit` neighbours.
+
+    The sparse co-occurrence matrix is never materialised outside the
+    database: one self-join over the pairs yields its non-zero cells
+    and ROW_NUMBER() picks the top-K per row, all in a single
+    INSERT ... SELECT. Returns the number of neighbour rows stored.
+    """
+    limit = limit or settings.BOOK_SIMILAR_LIMIT
+    similarity_table = BookSimilarity._meta.db_table
+    borrowing_table = Borrowing._meta.db_table
+    archive_table = ArchivedBorrowing._meta.db_table
+
+    sql = f"""
+        WITH pairs AS (
+            SELECT user_id, book_id FROM {borrowing_table}
+            UNION
+            SELECT user_id, book_id FROM {archive_table}
+        ),
+        cooccurrence AS (
+            SELECT borrowed.book_id AS book_id,
+                   also_borrowed.book_id AS similar_book_id,
+                   COUNT(*) AS score
+            FROM pairs borrowed
+            JOIN pairs also_borrowed
+              ON borrowed.user_id = also_borrowed.user_id
+             AND borrowed.book_id <> also_borrowed.book_id
+            GROUP BY borrowed.book_id, also_borrowed.book_id
+        ),
+        ranked AS (
+            SELECT book_id, similar_book_id, score,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY book_id
+                       ORDER BY score DESC, similar_book_id
+                   ) AS position
+            FROM cooccurrence
+        )
+        INSERT INTO {similarity_table}
+            (book_id, similar_book_id, score, position)
+        SELECT book_id, similar_book_id, score, position
+        FROM ranked
+        WHERE position <= %s
+    """
+
+    with transaction.atomic():
+        BookSimilarity.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [limit])
+        bump_catalog_version()
+    return BookSimilarity.objects.count()
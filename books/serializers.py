@@ -1,9 +1,10 @@
 from rest_framework import serializers
 
-from books.models import Book
+from books.models import Book, BookImportJob
+from library_service.serializers import DynamicFieldsMixin
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = (
@@ -12,6 +13,66 @@ class BookSerializer(serializers.ModelSerializer):
             "author",
             "cover",
             "inventory",
-            "daily_fee"
+            "daily_fee",
+            "isbn",
         )
 
+
+class BookImportRowSerializer(serializers.ModelSerializer):
+    """
+    Validates one feed row. The ISBN uniqueness check is left out:
+    rows with a known ISBN update the existing book.
+    """
+
+    class Meta:
+        model = Book
+        fields = (
+            "title",
+            "author",
+            "cover",
+            "inventory",
+            "daily_fee",
+            "isbn",
+        )
+        extra_kwargs = {
+            "isbn": {
+                "required": True,
+                "allow_null": False,
+                "allow_blank": False,
+                "validators": [],
+            }
+        }
+
+
+class BookImportJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = BookImportJob
+        fields = (
+            "id",
+            "source",
+            "status",
+            "processed_rows",
+            "imported_rows",
+            "failed_rows",
+            "errors",
+            "created_at",
+            "finished_at",
+        )
+        read_only_fields = (
+            "status",
+            "processed_rows",
+            "imported_rows",
+            "failed_rows",
+            "errors",
+            "created_at",
+            "finished_at",
+        )
+        extra_kwargs = {"source": {"write_only": True}}
+
+    def validate_source(self, source):
+        if BookImportJob.detect_format(source.name) is None:
+            raise serializers.ValidationError(
+                "Only .csv and .jsonl files can be imported."
+            )
+        return source
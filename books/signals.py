@@ -0,0 +1,52 @@
+from collections import Counter
+
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from books.cache import bump_catalog_version
+from books.models import Book, BookFacetCount
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalog_cache(sender, **kwargs) -> None:
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_delete, sender=Book)
+def remember_facet_values(sender, instance, **kwargs) -> None:
+    """
+    Read the stored facet values to diff against afterwards;
+    the instance may hold an inventory changed since it was loaded.
+    """
+    instance._stored_facet_values = []
+    if instance.pk is None or instance._state.adding:
+        return
+
+    stored = Book.objects.filter(pk=instance.pk).values(
+        "cover", "author", "inventory"
+    ).first()
+    if stored:
+        instance._stored_facet_values = Book.facet_values(**stored)
+
+
+@receiver(post_save, sender=Book)
+def update_facet_counts(sender, instance, **kwargs) -> None:
+    deltas = Counter(
+        Book.facet_values(instance.cover, instance.author, instance.inventory)
+    )
+    deltas.subtract(getattr(instance, "_stored_facet_values", []))
+    BookFacetCount.objects.add(deltas)
+
+
+@receiver(post_delete, sender=Book)
+def release_facet_counts(sender, instance, **kwargs) -> None:
+    deltas = Counter()
+    deltas.subtract(getattr(instance, "_stored_facet_values", []))
+    BookFacetCount.objects.add(deltas)
@@ -0,0 +1,24 @@
+from celery import shared_task
+
+from books.importers import run_import_job
+from books.models import BookImportJob
+from books.recommendations import rebuild_popularity, rebuild_similarities
+
+
+@shared_task
+def import_books(job_id: int) -> str:
+    job = run_import_job(BookImportJob.objects.get(pk=job_id))
+    return (
+        f"{job.imported_rows} books imported, "
+        f"{job.failed_rows} rows rejected."
+    )
+
+
+@shared_task
+def rebuild_recommendations() -> str:
+    popular = rebuild_popularity()
+    similar = rebuild_similarities()
+    return (
+        f"Popularity rebuilt for {popular} books, "
+        f"{similar} similar books stored."
+    )
@@ -1,8 +1,9 @@
 from rest_framework.routers import DefaultRouter
-from books.views import BookViewSet
+from books.views import BookImportJobViewSet, BookViewSet
 
 
 router = DefaultRouter()
+router.register("imports", BookImportJobViewSet)
 router.register("", BookViewSet)
 
 
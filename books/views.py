@@ -1,13 +1,80 @@
-from rest_framework import viewsets
-from books.models import Book
-from books.serializers import BookSerializer
+from django.db import transaction
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiParameter,
+    OpenApiTypes
+)
+from books.cache import cached_catalog_response
+from books.models import Book, BookFacetCount, BookImportJob
+from books.serializers import BookImportJobSerializer, BookSerializer
+from books.tasks import import_books
+from library_service.mixins import FastListMixin
+from library_service.serializers import FIELDS_PARAMETER
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 
 
-class BookViewSet(viewsets.ModelViewSet):
+SEARCH_PARAMETER = OpenApiParameter(
+    name="search",
+    description="Full-text / fuzzy search on title and author",
+    type=OpenApiTypes.STR,
+    required=False,
+)
+
+ORDERING_PARAMETER = OpenApiParameter(
+    name="ordering",
+    description="Set to 'popular' to list the most borrowed books first",
+    type=OpenApiTypes.STR,
+    enum=["popular"],
+    required=False,
+)
+
+
+class BookViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
 
+    @property
+    def keyset_ordering(self):
+        """Ranked and popular results cannot be keyset-paginated"""
+        if self.action == "search" or self.requested_ordering == "popular":
+            return None
+        return "id"
+
+    @property
+    def requested_ordering(self):
+        return self.request.query_params.get("ordering")
+
+    def get_queryset(self):
+        """Filter books by the 'search' query parameter"""
+        queryset = self.queryset
+        search = self.request.query_params.get("search")
+
+        if search and self.action == "search":
+            queryset = queryset.ranked_search(search)
+        elif search:
+            queryset = queryset.search(search)
+
+        if self.action == "list" and self.requested_ordering == "popular":
+            queryset = queryset.popular()
+        elif self.action == "similar":
+            book_id = str(self.kwargs["pk"])
+            # A non-numeric id has no neighbours; _similar answers 404.
+            queryset = (
+                queryset.similar_to(int(book_id)) if book_id.isdigit()
+                else queryset.none()
+            )
+
+        if self.action in ["list", "retrieve", "search", "similar"]:
+            queryset = self.get_serializer().prune_queryset(queryset)
+
+        return queryset
+
     def get_permissions(self):
         if self.action in ["create", "update", "partial_update", "destroy"]:
             permission_classes = [
@@ -23,13 +90,66 @@ class BookViewSet(viewsets.ModelViewSet):
             ]
         return [permission() for permission in permission_classes]
 
+    @extend_schema(
+        parameters=[SEARCH_PARAMETER, ORDERING_PARAMETER, FIELDS_PARAMETER]
+    )
     def list(self, request, *args, **kwargs):
         """ A list of books for all users."""
-        return super().list(request, *args, **kwargs)
+        return cached_catalog_response(
+            request, super().list, *args, **kwargs
+        )
+
+    @extend_schema(parameters=[SEARCH_PARAMETER, FIELDS_PARAMETER])
+    @action(detail=False, methods=["get"])
+    def search(self, request, *args, **kwargs):
+        """ Books matching 'search', best matches first. """
+        return cached_catalog_response(
+            request, self._ranked_search, *args, **kwargs
+        )
+
+    def _ranked_search(self, request, *args, **kwargs):
+        search = request.query_params.get("search")
 
+        if not search:
+            raise ValidationError(
+                {"search": "This query parameter is required."}
+            )
+
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def facets(self, request, *args, **kwargs):
+        """
+        Book counts per cover, available now and for the top authors,
+        read from precomputed counters.
+        """
+        return cached_catalog_response(request, self._facets)
+
+    def _facets(self, request, *args, **kwargs):
+        return Response(BookFacetCount.objects.panel())
+
+    @extend_schema(parameters=[FIELDS_PARAMETER])
+    @action(detail=True, methods=["get"], pagination_class=None)
+    def similar(self, request, *args, **kwargs):
+        """ Books most often borrowed by readers of this book. """
+        return cached_catalog_response(
+            request, self._similar, *args, **kwargs
+        )
+
+    def _similar(self, request, *args, **kwargs):
+        get_object_or_404(Book.objects.only("id"), pk=kwargs["pk"])
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return Response(serializer.data)
+
+    @extend_schema(parameters=[FIELDS_PARAMETER])
     def retrieve(self, request, *args, **kwargs):
         """ Retrieve a specific book by ID for authenticated users. """
-        return super().retrieve(request, *args, **kwargs)
+        return cached_catalog_response(
+            request, super().retrieve, *args, **kwargs
+        )
 
     def create(self, request, *args, **kwargs):
         """ Create a new book only for admin users. """
@@ -46,3 +166,31 @@ class BookViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         """ Destroy existing book only with admin permissions. """
         return super().destroy(request, *args, **kwargs)
+
+
+class BookImportJobViewSet(
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.CreateModelMixin,
+    viewsets.GenericViewSet
+):
+    queryset = BookImportJob.objects.all().order_by("-id")
+    serializer_class = BookImportJobSerializer
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    def create(self, request, *args, **kwargs) -> Response:
+        """
+        Upload a CSV/JSONL feed and import it in the background.
+        Poll the returned job for progress and rejected rows.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(created_by=request.user)
+
+        transaction.on_commit(lambda: import_books.delay(job.id))
+
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
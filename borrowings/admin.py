@@ -1,6 +1,14 @@
 from django.contrib import admin
 
-from borrowings.models import Borrowing
+from borrowings.models import (
+    ArchivedBorrowing,
+    Borrowing,
+    Hold,
+    OverdueScan
+)
 
 
+admin.site.register(ArchivedBorrowing)
 admin.site.register(Borrowing)
+admin.site.register(Hold)
+admin.site.register(OverdueScan)
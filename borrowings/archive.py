@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import transaction
+
+from borrowings.models import ArchivedBorrowing, Borrowing
+from payment.models import ArchivedPayment
+
+
+UNPAID_STATUSES = ("PENDING", "EXPIRED")
+
+
+def get_archivable_borrowings(cutoff):
+    """Loans returned before `cutoff` that owe nothing any more"""
+    return Borrowing.objects.filter(
+        actual_return_date__lt=cutoff
+    ).exclude(payments__status__in=UNPAID_STATUSES)
+
+
+def archive_batch(cutoff, batch_size: int) -> int:
+    """
+    Move up to `batch_size` archivable loans and their payments,
+    oldest first, in one transaction: one locking SELECT, one INSERT
+    into each archive and one DELETE. Rows locked by another worker
+    are skipped.
+    """
+    with transaction.atomic():
+        borrowings = list(
+            get_archivable_borrowings(cutoff)
+            .with_fees()
+            .select_related("payments")
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("id")[:batch_size]
+        )
+        if not borrowings:
+            return 0
+
+        archived, archived_payments = [], []
+        for borrowing in borrowings:
+            payment = getattr(borrowing, "payments", None)
+            if payment:
+                archived_payments.append(
+                    ArchivedPayment(
+                        id=payment.id,
+                        status=payment.status,
+                        pay_type=payment.pay_type,
+                        borrowing_id=borrowing.id,
+                        session_url=payment.session_url,
+                        session_id=payment.session_id,
+                        money_to_pay=payment.money_to_pay,
+                    )
+                )
+            archived.append(
+                ArchivedBorrowing(
+                    id=borrowing.id,
+                    borrow_date=borrowing.borrow_date,
+                    expected_return_date=borrowing.expected_return_date,
+                    actual_return_date=borrowing.actual_return_date,
+                    book_id=borrowing.book_id,
+                    user_id=borrowing.user_id,
+                    total_fee=borrowing.total_fee,
+                    overdue_fee=borrowing.overdue_fee,
+                    payment_status=payment.status if payment else "",
+                    payment_type=payment.pay_type if payment else "",
+                    money_paid=payment.money_to_pay if payment else None,
+                )
+            )
+
+        ArchivedBorrowing.objects.bulk_create(archived, ignore_conflicts=True)
+        ArchivedPayment.objects.bulk_create(
+            archived_payments, ignore_conflicts=True
+        )
+        Borrowing.objects.filter(
+            pk__in=[borrowing.id for borrowing in borrowings]
+        ).delete()
+    return len(borrowings)
+
+
+def archive_returned_borrowings(
+    months: int | None = None,
+    batch_size: int | None = None
+) -> int:
+    """
+    Archive loans returned more than `months` months ago, batch by
+    batch so no transaction holds many locks for long.
+    Returns the number of loans archived.
+    """
+    months = months or settings.BORROWING_ARCHIVE_AFTER_MONTHS
+    batch_size = batch_size or settings.BORROWING_ARCHIVE_BATCH_SIZE
+    cutoff = datetime.today().date() - relativedelta(months=months)
+
+    total = 0
+    while archived := archive_batch(cutoff, batch_size):
+        total += archived
+    return total
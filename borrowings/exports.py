@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.db.models import Value
+
+from borrowings.models import ArchivedBorrowing, Borrowing
+
+
+BORROWING_EXPORT_COLUMNS = (
+    "id",
+    "borrow_date",
+    "expected_return_date",
+    "actual_return_date",
+    "is_active",
+    "book__id",
+    "book__title",
+    "book__author",
+    "book__daily_fee",
+    "user__id",
+    "user__email",
+)
+
+
+def get_borrowing_export_queryset(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    archived: bool = False
+):
+    """
+    Borrowings made between date_from and date_to, both inclusive,
+    from the live table or, when `archived`, from the archive.
+    """
+    if archived:
+        queryset = ArchivedBorrowing.objects.annotate(is_active=Value(False))
+    else:
+        queryset = Borrowing.objects.all()
+    if date_from:
+        queryset = queryset.filter(borrow_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(borrow_date__lte=date_to)
+    return queryset
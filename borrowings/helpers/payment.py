@@ -1,46 +1,70 @@
+from functools import partial
+
 from django.shortcuts import redirect
-import stripe
-from django.conf import settings
+from django.db import transaction
 
-from payment.models import Payment
+from payment.models import Payment, PaymentSessionRequest
+from payment.tasks import open_payment_session
+from users.account_state import StateDeltas, payment_state
+from users.models import AccountState
 
 
 def create_payment_session(borrowing, amount, payment_type):
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[
-            {
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": f"{payment_type} fee "
-                        "for " f"{borrowing.book.title}",
-                    },
-                    "unit_amount": int(amount * 100),
-                },
-                "quantity": 1,
-            }
-        ],
-        mode="payment",
-        success_url=(
-            settings.STRIPE_SUCCESS_URL
-            + "?session_id={CHECKOUT_SESSION_ID}"
-        ),
-        cancel_url=(
-            settings.STRIPE_CANCEL_URL
-            + "?session_id={CHECKOUT_SESSION_ID}"
-        ),
+    return request_checkout_session([(borrowing, amount)], payment_type)
+
+
+def request_checkout_session(items, payment_type) -> PaymentSessionRequest:
+    """
+    Point each (borrowing, amount) pair's payment at a new session
+    request, upserting all the payments in one statement. The checkout
+    session itself is opened by a worker after commit, so the caller's
+    transaction never waits on the payment gateway.
+    """
+    session_request = PaymentSessionRequest.objects.create(
+        payment_type=payment_type
     )
 
-    payment, created = Payment.objects.update_or_create(
-        borrowing=borrowing,
-        defaults={
-            "session_url": session.url,
-            "session_id": session.id,
-            "money_to_pay": amount,
-            "pay_type": payment_type,
-            "status": Payment.PaymentStatus.PENDING.name,
-        },
+    # The upsert skips the payment signals; account for it here.
+    deltas = StateDeltas()
+    for user_id, status, money_to_pay in Payment.objects.filter(
+        borrowing__in=[borrowing for borrowing, _ in items]
+    ).values_list("borrowing__user", "status", "money_to_pay"):
+        deltas.add(user_id, payment_state(status, money_to_pay), -1)
+    for borrowing, amount in items:
+        deltas.add(
+            borrowing.user_id,
+            payment_state(Payment.PaymentStatus.PENDING, amount)
+        )
+
+    Payment.objects.bulk_create(
+        [
+            Payment(
+                borrowing=borrowing,
+                session_url="",
+                session_id="",
+                session_expires_at=None,
+                session_request=session_request,
+                money_to_pay=amount,
+                pay_type=payment_type,
+                status=Payment.PaymentStatus.PENDING.name,
+            )
+            for borrowing, amount in items
+        ],
+        update_conflicts=True,
+        unique_fields=["borrowing"],
+        update_fields=[
+            "session_url",
+            "session_id",
+            "session_expires_at",
+            "session_request",
+            "money_to_pay",
+            "pay_type",
+            "status",
+        ],
     )
+    AccountState.objects.add(deltas)
 
-    return session
+    transaction.on_commit(
+        partial(open_payment_session.delay, session_request.id)
+    )
+    return session_request
@@ -1,4 +1,6 @@
 import os
+from typing import Iterable
+
 import requests
 from dotenv import load_dotenv
 
@@ -7,16 +9,52 @@ load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# Telegram rejects longer message texts.
+TELEGRAM_MESSAGE_LIMIT = 4096
 
 
-def send_message(message):
+def send_message(message, session=None):
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
         "chat_id": TELEGRAM_CHAT_ID,
         "text": message
     }
 
-    response = requests.post(url, data=payload)
+    response = (session or requests).post(url, data=payload)
 
     if response.status_code != 200:
         raise Exception(f"Error sending message: {response.text}")
+
+
+def send_messages(messages: Iterable[str]) -> int:
+    """Send messages in order over one kept-alive connection."""
+    sent = 0
+    with requests.Session() as session:
+        for message in messages:
+            send_message(message, session=session)
+            sent += 1
+    return sent
+
+
+def build_digests(
+    header: str,
+    lines: Iterable[str],
+    limit: int = TELEGRAM_MESSAGE_LIMIT
+) -> Iterable[str]:
+    """
+    Join lines under `header` into as few messages as fit in `limit`
+    characters each, never splitting a line unless it alone is too long.
+    """
+    room = limit - len(header) - 1
+    chunk, size = [], 0
+
+    for line in lines:
+        line = line[:room]
+        if chunk and size + len(line) + 1 > room:
+            yield "\n".join([header, *chunk])
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+
+    if chunk:
+        yield "\n".join([header, *chunk])
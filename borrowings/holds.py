@@ -0,0 +1,67 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from borrowings.helpers.telegram import send_messages
+from borrowings.models import Hold
+
+
+def format_ready_hold(hold: Hold) -> str:
+    return (
+        f"Hold Ready:\n"
+        f"Book: {hold.book.title} ({hold.book.author})\n"
+        f"User: {hold.user.email}\n"
+        f"Pick up by: {timezone.localdate(hold.expires_at)}"
+    )
+
+
+def notify_holders(hold_ids: list[int]) -> int:
+    """Tell each holder still waiting to pick up that a copy is theirs."""
+    holds = Hold.objects.filter(
+        pk__in=hold_ids,
+        status=Hold.Status.READY
+    ).select_related("book", "user").order_by("id")
+    return send_messages(format_ready_hold(hold) for hold in holds)
+
+
+def expire_ready_holds() -> int:
+    """
+    Expire ready holds not picked up in time and pass their copies
+    on to the next holds in line, or back to the shelf.
+    """
+    with transaction.atomic():
+        expired = list(
+            Hold.objects.filter(
+                status=Hold.Status.READY,
+                expires_at__lt=timezone.now()
+            ).select_for_update(skip_locked=True).values_list(
+                "id", "book_id"
+            )
+        )
+        if not expired:
+            return 0
+
+        Hold.objects.filter(
+            pk__in=[hold_id for hold_id, _ in expired]
+        ).update(status=Hold.Status.EXPIRED)
+        Hold.objects.release_copies(
+            Counter(book_id for _, book_id in expired)
+        )
+    return len(expired)
+
+
+@transaction.atomic
+def cancel_hold(hold: Hold) -> None:
+    """Cancel an open hold, passing on the copy a ready one kept."""
+    was_ready = Hold.objects.filter(
+        pk=hold.pk,
+        status=Hold.Status.READY
+    ).update(status=Hold.Status.CANCELLED)
+    Hold.objects.filter(
+        pk=hold.pk,
+        status=Hold.Status.WAITING
+    ).update(status=Hold.Status.CANCELLED)
+    hold.status = Hold.Status.CANCELLED
+    if was_ready:
+        Hold.objects.release_copies({hold.book_id: 1})
@@ -0,0 +1,74 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from borrowings.exports import (
+    BORROWING_EXPORT_COLUMNS,
+    get_borrowing_export_queryset
+)
+from library_service.exports import (
+    EXPORT_CONTENT_TYPES,
+    export_rows,
+    iter_export
+)
+from payment.exports import (
+    PAYMENT_EXPORT_COLUMNS,
+    get_payment_export_queryset
+)
+
+
+EXPORTS = {
+    "borrowings": (get_borrowing_export_queryset, BORROWING_EXPORT_COLUMNS),
+    "payments": (get_payment_export_queryset, PAYMENT_EXPORT_COLUMNS),
+}
+
+
+class Command(BaseCommand):
+    """Stream borrowings or payments to a CSV/NDJSON file or stdout"""
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("records", choices=list(EXPORTS))
+        parser.add_argument(
+            "--output",
+            choices=list(EXPORT_CONTENT_TYPES),
+            default="csv"
+        )
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            type=date.fromisoformat
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            type=date.fromisoformat
+        )
+        parser.add_argument(
+            "--archived",
+            action="store_true",
+            help="Export archived records instead of live ones"
+        )
+        parser.add_argument("--file", help="Write here instead of stdout")
+
+    def handle(self, *args, **options) -> None:
+        get_queryset, columns = EXPORTS[options["records"]]
+        queryset = get_queryset(
+            options["date_from"], options["date_to"], options["archived"]
+        )
+        chunks = iter_export(
+            export_rows(queryset, columns),
+            columns,
+            options["output"]
+        )
+
+        if not options["file"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(options["file"], "w", newline="") as export_file:
+            for chunk in chunks:
+                export_file.write(chunk)
+        self.stderr.write(
+            self.style.SUCCESS(f"Exported to {options['file']}")
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0002_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OverdueScan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scanned_through", models.DateField()),
+                ("notified", models.PositiveIntegerField(default=0)),
+                ("finished_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="borrowing",
+            name="overdue_notified_level",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (0, "Not notified"),
+                    (1, "Due"),
+                    (2, "1 day overdue"),
+                    (3, "7 days overdue"),
+                    (4, "30 days overdue"),
+                ],
+                default=0,
+            ),
+        ),
+    ]
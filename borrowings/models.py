@@ -1,6 +1,9 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from django.db import models
+from functools import partial
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 
 from books.models import Book
 from borrowings.validators import validate_expected_return_date
@@ -10,7 +13,100 @@ from library_service import settings
 FINE_MULTIPLIER = 2
 
 
+class DaysBetween(models.Func):
+    """Whole days from the `start` date expression to the `end` one"""
+    arity = 2
+    output_field = models.IntegerField()
+
+    def __init__(self, end, start, **extra) -> None:
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # date - date is an integer number of days on PostgreSQL.
+        return super().as_sql(
+            compiler,
+            connection,
+            template="(%(expressions)s)",
+            arg_joiner=" - ",
+            **extra_context
+        )
+
+
+class BorrowingQuerySet(models.QuerySet):
+
+    def with_fees(self, today: date | None = None) -> "BorrowingQuerySet":
+        """
+        Annotate total_fee and overdue_fee, computed in SQL the same way
+        as calculate_total_fee() and calculate_overdue_fee().
+        """
+        today = today or datetime.today().date()
+        money = models.DecimalField(max_digits=10, decimal_places=2)
+        overdue_days = Greatest(
+            DaysBetween(
+                Coalesce(
+                    "actual_return_date",
+                    models.Value(today, output_field=models.DateField())
+                ),
+                "expected_return_date"
+            ),
+            models.Value(0)
+        )
+        return self.annotate(
+            total_fee=models.ExpressionWrapper(
+                DaysBetween("expected_return_date", "borrow_date")
+                * models.F("book__daily_fee"),
+                output_field=money
+            ),
+            overdue_fee=models.ExpressionWrapper(
+                overdue_days
+                * models.F("book__daily_fee")
+                * models.Value(FINE_MULTIPLIER),
+                output_field=money
+            ),
+        )
+
+    def balance(self) -> dict:
+        """
+        Rental and overdue fees accrued by these borrowings, and
+        what their unpaid (pending or expired) payments still owe,
+        in one aggregate query.
+        """
+        zero = models.Value(
+            Decimal("0.00"),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        )
+        return self.with_fees().aggregate(
+            total_fees=Coalesce(models.Sum("total_fee"), zero),
+            overdue_fees=Coalesce(models.Sum("overdue_fee"), zero),
+            outstanding_fees=Coalesce(
+                models.Sum(
+                    "payments__money_to_pay",
+                    filter=models.Q(
+                        payments__status__in=["PENDING", "EXPIRED"]
+                    )
+                ),
+                zero
+            ),
+        )
+
+
 class Borrowing(models.Model):
+
+    class OverdueLevel(models.IntegerChoices):
+        NONE = 0, "Not notified"
+        DUE = 1, "Due"
+        DAY = 2, "1 day overdue"
+        WEEK = 3, "7 days overdue"
+        MONTH = 4, "30 days overdue"
+
+    # Days past expected_return_date at which each level is reached.
+    OVERDUE_LEVEL_DAYS = {
+        OverdueLevel.DUE: 0,
+        OverdueLevel.DAY: 1,
+        OverdueLevel.WEEK: 7,
+        OverdueLevel.MONTH: 30,
+    }
+
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField(
         validators=[validate_expected_return_date]
@@ -27,6 +123,27 @@ class Borrowing(models.Model):
         on_delete=models.CASCADE,
         related_name="borrowing"
     )
+    overdue_notified_level = models.PositiveSmallIntegerField(
+        choices=OverdueLevel.choices,
+        default=OverdueLevel.NONE
+    )
+
+    objects = BorrowingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # A user's loans, optionally only active ones, newest first.
+            models.Index(
+                fields=["user", "is_active", "-id"],
+                name="borrowing_user_active_idx"
+            ),
+            # Loans still out, by due date: the overdue scan.
+            models.Index(
+                fields=["expected_return_date"],
+                condition=models.Q(actual_return_date__isnull=True),
+                name="borrowing_unreturned_due_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return (
@@ -45,21 +162,26 @@ class Borrowing(models.Model):
             )
 
     def clean(self) -> None:
-        Borrowing.validate_borrowing(
-            self.book.inventory,
-            ValueError
-        )
+        if self._state.adding:
+            Borrowing.validate_borrowing(
+                self.book.inventory,
+                ValueError
+            )
 
     def save(self, *args, **kwargs) -> None:
         self.clean()
         return super().save(*args, **kwargs)
 
+    @transaction.atomic
     def return_book(self) -> None:
         self.actual_return_date = date.today()
-        self.book.inventory += 1
-        self.book.save()
         self.is_active = False
-        self.save()
+        inventory = Hold.objects.release_copies({self.book_id: 1})
+
+        # A copy handed to a hold stays off the shelf.
+        if Borrowing.book.is_cached(self) and self.book_id in inventory:
+            self.book.inventory = inventory[self.book_id]
+        self.save(update_fields=["actual_return_date", "is_active"])
 
     def calculate_total_fee(self) -> Decimal:
         end_date = self.expected_return_date
@@ -69,16 +191,233 @@ class Borrowing(models.Model):
         return total_fee
 
     def calculate_overdue_fee(self) -> Decimal:
-        if not self.actual_return_date:
-            self.actual_return_date = datetime.today().date()
+        end_date = self.actual_return_date or datetime.today().date()
 
-        if self.actual_return_date <= self.expected_return_date:
+        if end_date <= self.expected_return_date:
             return Decimal(0)
 
-        overdue_days = (
-            self.actual_return_date - self.expected_return_date
-        ).days
+        overdue_days = (end_date - self.expected_return_date).days
         daily_fee = self.book.daily_fee
         fine_multiplier = Decimal(FINE_MULTIPLIER)
         overdue_fee = overdue_days * daily_fee * fine_multiplier
         return overdue_fee
+
+
+class ArchivedBorrowing(models.Model):
+    """
+    A borrowing returned long ago, moved out of the borrowings table
+    with its fees and payment frozen. It keeps the borrowing's id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    borrow_date = models.DateField()
+    expected_return_date = models.DateField()
+    actual_return_date = models.DateField()
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="archived_borrowings"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="archived_borrowings"
+    )
+    total_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    overdue_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_status = models.CharField(max_length=20, blank=True)
+    payment_type = models.CharField(max_length=20, blank=True)
+    money_paid = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-id"],
+                name="archived_borrowing_user_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"Archived borrowing {self.id}: {self.book.title} "
+            f"by User: {self.user.email}"
+        )
+
+
+class OverdueScan(models.Model):
+    """
+    One completed overdue scan. The latest `scanned_through` date is
+    the watermark: the next scan only looks at loans that reached a
+    notification level after it.
+    """
+    scanned_through = models.DateField()
+    notified = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return (
+            f"Overdue scan through {self.scanned_through}: "
+            f"{self.notified} notified"
+        )
+
+
+def _notify_ready_holds(hold_ids: list[int]) -> None:
+    from borrowings.tasks import notify_ready_holds
+
+    notify_ready_holds.delay(hold_ids)
+
+
+class HoldQuerySet(models.QuerySet):
+
+    def allocate(self, counts: dict[int, int]) -> dict[int, int]:
+        """
+        Hand counts[book_id] returned copies of each book to its oldest
+        waiting holds, read from the queue index with SKIP LOCKED so
+        concurrent returns take different holds. The holders are
+        notified once the transaction commits. Returns the copies
+        left over for the shelf.
+        """
+        now = timezone.now()
+        allocated, left = [], {}
+        for book_id, count in counts.items():
+            hold_ids = list(
+                self.filter(book_id=book_id, status=Hold.Status.WAITING)
+                .order_by("id")
+                .select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[:count]
+            )
+            allocated += hold_ids
+            left[book_id] = count - len(hold_ids)
+
+        if allocated:
+            self.filter(pk__in=allocated).update(
+                status=Hold.Status.READY,
+                ready_at=now,
+                expires_at=now + timedelta(days=settings.HOLD_PICKUP_DAYS),
+            )
+            transaction.on_commit(partial(_notify_ready_holds, allocated))
+        return left
+
+    def release_copies(self, counts: dict[int, int]) -> dict[int, int]:
+        """
+        Give copies to waiting holds first and put the rest back
+        on the shelf, returning the new inventory of those books.
+        """
+        left = {
+            book_id: count
+            for book_id, count in self.allocate(counts).items()
+            if count
+        }
+        return Book.objects.return_copies(left) if left else {}
+
+    def with_positions(self) -> "HoldQuerySet":
+        """Annotate each waiting hold's place in its book's queue."""
+        waiting_ahead = Hold.objects.filter(
+            book=models.OuterRef("book"),
+            status=Hold.Status.WAITING,
+            id__lte=models.OuterRef("id"),
+        ).order_by().values("book").annotate(
+            count=models.Count("id")
+        ).values("count")
+        return self.annotate(
+            position=models.Case(
+                models.When(
+                    status=Hold.Status.WAITING,
+                    then=models.Subquery(waiting_ahead)
+                ),
+                default=None,
+                output_field=models.IntegerField()
+            )
+        )
+
+    def claim(self, user, book_ids) -> list[int]:
+        """
+        Fulfil the user's ready holds on these books and put their
+        reserved copies back in inventory, so the borrowing made in
+        the same transaction takes them before anyone else can.
+        Returns the ids of the books that were held.
+        """
+        held = list(
+            self.filter(
+                user=user,
+                book_id__in=book_ids,
+                status=Hold.Status.READY
+            ).select_for_update().values_list("book_id", flat=True)
+        )
+        if held:
+            self.filter(
+                user=user,
+                book_id__in=held,
+                status=Hold.Status.READY
+            ).update(status=Hold.Status.FULFILLED)
+            Book.objects.return_copies({book_id: 1 for book_id in held})
+        return held
+
+
+class Hold(models.Model):
+    """
+    A patron's place in the queue for a book that is out of stock.
+    A returned copy goes to the oldest waiting hold, which is then
+    READY and keeps the copy until `expires_at`.
+    """
+
+    class Status(models.TextChoices):
+        WAITING = "WAITING", "Waiting"
+        READY = "READY", "Ready for pickup"
+        FULFILLED = "FULFILLED", "Fulfilled"
+        CANCELLED = "CANCELLED", "Cancelled"
+        EXPIRED = "EXPIRED", "Expired"
+
+    OPEN_STATUSES = (Status.WAITING, Status.READY)
+
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="holds"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="holds"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.WAITING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = HoldQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "book"],
+                condition=models.Q(status__in=["WAITING", "READY"]),
+                name="unique_open_hold"
+            ),
+        ]
+        indexes = [
+            # A book's queue in arrival order: the allocation lookup.
+            models.Index(
+                fields=["book", "id"],
+                condition=models.Q(status="WAITING"),
+                name="hold_waiting_queue_idx"
+            ),
+            # Ready holds by pickup deadline: the expiry scan.
+            models.Index(
+                fields=["expires_at"],
+                condition=models.Q(status="READY"),
+                name="hold_ready_expiry_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Hold {self.id} on book {self.book_id}: {self.status}"
@@ -1,29 +1,98 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from borrowings.helpers.telegram import send_message
-from borrowings.models import Borrowing
+from django.conf import settings
+from django.db import transaction
+
+from borrowings.helpers.telegram import build_digests, send_messages
+from borrowings.models import Borrowing, OverdueScan
+
+
+def get_new_overdue_borrowings(today, watermark=None):
+    """
+    Yield (level, queryset) pairs, highest level first. Each queryset
+    holds the unreturned loans whose current overdue level is `level`,
+    that reached it after the `watermark` date and that were not
+    notified at it yet. Loans past several thresholds since the last
+    scan only show up at the highest one.
+    """
+    higher_level_from = None
+
+    for level, days in sorted(
+        Borrowing.OVERDUE_LEVEL_DAYS.items(), reverse=True
+    ):
+        reached_by = today - timedelta(days=days)
+        queryset = Borrowing.objects.filter(
+            actual_return_date__isnull=True,
+            expected_return_date__lte=reached_by,
+            overdue_notified_level__lt=level,
+        )
+        if higher_level_from is not None:
+            queryset = queryset.filter(
+                expected_return_date__gt=higher_level_from
+            )
+        if watermark is not None:
+            queryset = queryset.filter(
+                expected_return_date__gt=watermark - timedelta(days=days)
+            )
+        higher_level_from = reached_by
+        yield level, queryset
+
+
+def stream_for_digest(queryset):
+    """
+    Loans with only the columns the digest prints, book and user
+    joined in, streamed in chunks.
+    """
+    return queryset.select_related("book", "user").only(
+        "id",
+        "borrow_date",
+        "expected_return_date",
+        "book__title",
+        "user__email",
+    ).order_by("expected_return_date", "id").iterator(
+        chunk_size=settings.OVERDUE_SCAN_CHUNK_SIZE
+    )
 
 
 def check_overdue_borrowings():
     today = datetime.today().date()
-    overdue_borrowings = Borrowing.objects.filter(
-        expected_return_date__lte=today,
-        actual_return_date__isnull=True,
+    last_scan = OverdueScan.objects.order_by("-scanned_through").first()
+    watermark = last_scan.scanned_through if last_scan else None
+    levels = list(get_new_overdue_borrowings(today, watermark))
+    count = 0
+
+    def lines():
+        nonlocal count
+        for level, queryset in levels:
+            for borrowing in stream_for_digest(queryset):
+                count += 1
+                yield format_overdue_borrowing(borrowing, level)
+
+    messages = send_messages(
+        build_digests(f"Overdue Borrowings on {today}:", lines())
     )
-    if overdue_borrowings:
-        for borrowing in overdue_borrowings:
-            send_telegram_notification(borrowing)
-        return f"{len(overdue_borrowings)} overdue borrowings notified."
+
+    # Only record the notifications once they were all delivered,
+    # so a failed run is simply repeated by the next one.
+    with transaction.atomic():
+        for level, queryset in levels:
+            queryset.update(overdue_notified_level=level)
+        OverdueScan.objects.create(scanned_through=today, notified=count)
+
+    if count:
+        return (
+            f"{count} overdue borrowings notified "
+            f"in {messages} messages."
+        )
 
     return "No borrowings overdue today"
 
 
-def send_telegram_notification(borrowing):
-    message = (
-        f"Overdue Borrowing:\n"
-        f"Book: {borrowing.book.title}\n"
-        f"User: {borrowing.user.email}\n"
-        f"Expected Return Date: {borrowing.expected_return_date}\n"
-        f"Borrow Date: {borrowing.borrow_date}"
+def format_overdue_borrowing(borrowing, level):
+    return (
+        f"[{Borrowing.OverdueLevel(level).label}] "
+        f"#{borrowing.id} {borrowing.book.title} | "
+        f"{borrowing.user.email} | "
+        f"borrowed {borrowing.borrow_date}, "
+        f"due {borrowing.expected_return_date}"
     )
-    send_message(message)
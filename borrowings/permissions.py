@@ -14,6 +14,6 @@ class IsAuthenticatedAndOwnerOrAdmin(BasePermission):
     def has_object_permission(self, request, view, obj):
 
         if request.method in SAFE_METHODS:
-            return obj.user == request.user or request.user.is_staff
+            return obj.user_id == request.user.id or request.user.is_staff
 
         return request.user.is_staff
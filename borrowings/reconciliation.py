@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from payment.gateways import GatewayError, get_gateway
+from payment.models import Payment
+
+
+PENDING = Payment.PaymentStatus.PENDING.name
+EXPIRED = Payment.PaymentStatus.EXPIRED.name
+
+
+def get_due_payments(now):
+    """
+    Pending payments whose session may have expired by `now`:
+    past their stored expiry, or with none stored yet. Payments
+    whose session is not opened yet are left out.
+    """
+    return Payment.objects.filter(status=PENDING).exclude(
+        session_id=""
+    ).filter(
+        Q(session_expires_at__lte=now) | Q(session_expires_at__isnull=True)
+    ).only("id", "session_id", "session_expires_at")
+
+
+def list_expired_session_ids(created_from, created_to) -> set[str]:
+    """Ids of the sessions created in the window that have expired."""
+    return set(
+        get_gateway().list_expired_sessions(
+            int(created_from.timestamp()),
+            int(created_to.timestamp()),
+        )
+    )
+
+
+def retrieve_sessions(session_ids: list[str]) -> dict:
+    """
+    Fetch sessions concurrently, at most STRIPE_RECONCILE_WORKERS.
+    Sessions the gateway fails to return are left out until a later run.
+    """
+    if not session_ids:
+        return {}
+    gateway = get_gateway()
+
+    def retrieve(session_id: str):
+        try:
+            return gateway.retrieve_session(session_id)
+        except GatewayError:
+            return None
+
+    with ThreadPoolExecutor(
+        max_workers=settings.STRIPE_RECONCILE_WORKERS
+    ) as pool:
+        return {
+            session_id: session
+            for session_id, session in zip(
+                session_ids, pool.map(retrieve, session_ids)
+            )
+            if session is not None
+        }
+
+
+def reconcile_expired_payments(now=None) -> int:
+    """
+    Mark pending payments whose checkout session expired as EXPIRED.
+    Sessions that cannot have expired yet are skipped. The expired
+    ones are read with paged list calls over the window in which the
+    due sessions were created; only sessions not found there (created
+    before expiries were stored, or not expired by Stripe yet) are
+    retrieved one by one. Returns the number of payments expired.
+    """
+    now = now or timezone.now()
+    payments = list(get_due_payments(now))
+    if not payments:
+        return 0
+
+    lifetime = timedelta(hours=settings.STRIPE_SESSION_LIFETIME_HOURS)
+    expiries = [
+        payment.session_expires_at
+        for payment in payments
+        if payment.session_expires_at
+    ]
+    expired_ids = set()
+    if expiries:
+        try:
+            expired_ids = list_expired_session_ids(
+                min(expiries) - lifetime,
+                max(expiries),
+            )
+        except GatewayError:
+            # Every due session is retrieved one by one instead.
+            pass
+
+    unresolved = sorted(
+        {payment.session_id for payment in payments} - expired_ids
+    )
+    sessions = retrieve_sessions(unresolved)
+    expired_ids |= {
+        session_id
+        for session_id, session in sessions.items()
+        if session.status == "expired"
+    }
+
+    # Remember the expiry of older sessions, so the next runs skip them.
+    dated = []
+    for payment in payments:
+        session = sessions.get(payment.session_id)
+        if payment.session_expires_at is None and session is not None:
+            payment.session_expires_at = datetime.fromtimestamp(
+                session.expires_at, tz=dt_timezone.utc
+            )
+            dated.append(payment)
+    Payment.objects.bulk_update(dated, ["session_expires_at"])
+
+    # Guarded on PENDING so a payment settled meanwhile is kept.
+    # Both statuses are unpaid, so AccountState does not change.
+    return Payment.objects.filter(
+        pk__in=[
+            payment.id
+            for payment in payments
+            if payment.session_id in expired_ids
+        ],
+        status=PENDING,
+    ).update(status=EXPIRED)
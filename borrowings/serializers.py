@@ -1,25 +1,60 @@
-import stripe
+from collections import Counter
 from decimal import Decimal
 from datetime import datetime
 from django.conf import settings
+from django.db import IntegrityError
 from rest_framework import serializers
 from django.db.transaction import atomic
 
 from payment.models import Payment
-from borrowings.models import Borrowing
+from books.models import Book
+from borrowings.models import ArchivedBorrowing, Borrowing, Hold
 from books.serializers import BookSerializer
-from borrowings.helpers.payment import create_payment_session
+from borrowings.helpers.payment import (
+    create_payment_session,
+    request_checkout_session
+)
+from borrowings.validators import validate_expected_return_date
+from library_service.serializers import DynamicFieldsMixin
+from users.account_state import StateDeltas, loan_state
+from users.models import AccountState
 
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+class BorrowingFeeField(serializers.DecimalField):
+    """
+    A fee annotated by Borrowing.objects.with_fees(), computed by the
+    model's calculate_<fee>() for instances loaded without it.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(
+            max_digits=10,
+            decimal_places=2,
+            read_only=True,
+            **kwargs
+        )
+
+    def get_attribute(self, instance):
+        try:
+            return getattr(instance, self.source)
+        except AttributeError:
+            return getattr(instance, f"calculate_{self.source}")()
 
 
-class BorrowingReadSerializer(serializers.ModelSerializer):
+class BorrowingReadSerializer(
+    DynamicFieldsMixin,
+    serializers.ModelSerializer
+):
+    expandable_fields = {"book": BookSerializer}
+    annotated_fields = ("total_fee", "overdue_fee")
+
     book = BookSerializer(read_only=True)
     user = serializers.CharField(
         read_only=True,
         source="user.email"
     )
+    total_fee = BorrowingFeeField()
+    overdue_fee = BorrowingFeeField()
 
     class Meta:
         model = Borrowing
@@ -31,10 +66,50 @@ class BorrowingReadSerializer(serializers.ModelSerializer):
             "book",
             "is_active",
             "user",
+            "total_fee",
+            "overdue_fee",
         )
         read_only_fields = ("is_active", "actual_return_date")
 
 
+class ArchivedBorrowingSerializer(
+    DynamicFieldsMixin,
+    serializers.ModelSerializer
+):
+    """Reads archived loans in the same shape as live ones"""
+    expandable_fields = {"book": BookSerializer}
+    annotated_fields = ("is_active",)
+
+    book = BookSerializer(read_only=True)
+    user = serializers.CharField(
+        read_only=True,
+        source="user.email"
+    )
+    is_active = serializers.BooleanField(read_only=True, default=False)
+
+    class Meta:
+        model = ArchivedBorrowing
+        fields = BorrowingReadSerializer.Meta.fields
+
+
+def check_account_state(user, new_loans: int) -> None:
+    """
+    Gate new borrowings on the user's AccountState row, a single
+    primary key upsert that also locks it for the borrow's transaction.
+    """
+    state = AccountState.objects.lock_for_user(user)
+    if state.blocking_payments > 0:
+        raise serializers.ValidationError(
+            "You have pending/expired payments. "
+            "You cannot borrow new books until they are paid."
+        )
+    if state.active_loans + new_loans > settings.MAX_ACTIVE_LOANS:
+        raise serializers.ValidationError(
+            f"You cannot have more than {settings.MAX_ACTIVE_LOANS} "
+            f"books borrowed at once."
+        )
+
+
 class BorrowingCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -48,16 +123,26 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         data = super(BorrowingCreateSerializer, self).validate(attrs)
 
-        Borrowing.validate_borrowing(
-            attrs["book"].inventory,
-            serializers.ValidationError
-        )
+        # A ready hold keeps a copy off the shelf for this user.
+        if not Hold.objects.filter(
+            user=self.context["request"].user,
+            book=attrs["book"],
+            status=Hold.Status.READY
+        ).exists():
+            Borrowing.validate_borrowing(
+                attrs["book"].inventory,
+                serializers.ValidationError
+            )
         return data
 
     @atomic
     def create(self, validated_data):
         book = validated_data["book"]
         expected_return_date = validated_data["expected_return_date"]
+        check_account_state(self.context["request"].user, new_loans=1)
+
+        if Hold.objects.claim(self.context["request"].user, [book.id]):
+            book.refresh_from_db(fields=["inventory"])
 
         borrowing = Borrowing.objects.create(
             user=self.context["request"].user,
@@ -65,8 +150,11 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
             expected_return_date=expected_return_date,
         )
 
-        book.inventory -= 1
-        book.save()
+        inventory = Book.objects.checkout_copies({book.id: 1})
+        # Left out only when no copy was taken; 0 means the last one was.
+        if book.id not in inventory:
+            Borrowing.validate_borrowing(0, serializers.ValidationError)
+        book.inventory = inventory[book.id]
 
         total_fee = borrowing.calculate_total_fee()
         create_payment_session(
@@ -77,6 +165,125 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
         return borrowing
 
 
+class BorrowingCheckoutSerializer(serializers.Serializer):
+    books = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.CHECKOUT_MAX_BOOKS,
+    )
+    expected_return_date = serializers.DateField(
+        validators=[validate_expected_return_date]
+    )
+
+    def validate_books(self, book_ids):
+        if len(set(book_ids)) != len(book_ids):
+            raise serializers.ValidationError(
+                "Each book can only be borrowed once per checkout."
+            )
+
+        books = Book.objects.only("id", "title", "daily_fee").in_bulk(
+            book_ids
+        )
+        missing = [book_id for book_id in book_ids if book_id not in books]
+        if missing:
+            raise serializers.ValidationError(
+                f"Books not found: {missing}."
+            )
+        return [books[book_id] for book_id in book_ids]
+
+    @atomic
+    def create(self, validated_data):
+        """
+        Take one copy of every book in a single statement, create all
+        borrowings in one INSERT and request one Stripe session with a
+        line item per borrowing. Nothing is kept if any book is out.
+        """
+        books = validated_data["books"]
+        check_account_state(self.context["request"].user, len(books))
+
+        Hold.objects.claim(
+            self.context["request"].user, [book.id for book in books]
+        )
+        inventory = Book.objects.checkout_copies(
+            {book.id: 1 for book in books}
+        )
+        out_of_stock = [book.id for book in books if book.id not in inventory]
+        if out_of_stock:
+            raise serializers.ValidationError(
+                {"books": f"Book inventory is zero for books {out_of_stock}."}
+            )
+
+        borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                user=self.context["request"].user,
+                book=book,
+                expected_return_date=validated_data["expected_return_date"],
+            )
+            for book in books
+        )
+        # bulk_create skips the Borrowing signals.
+        AccountState.objects.add(
+            {self.context["request"].user.id: {
+                "active_loans": len(borrowings)
+            }}
+        )
+
+        session_request = request_checkout_session(
+            [
+                (borrowing, borrowing.calculate_total_fee())
+                for borrowing in borrowings
+            ],
+            Payment.PaymentType.PAYMENT.name
+        )
+        return borrowings, session_request
+
+
+class HoldSerializer(serializers.ModelSerializer):
+    position = serializers.IntegerField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Hold
+        fields = (
+            "id",
+            "book",
+            "status",
+            "position",
+            "created_at",
+            "ready_at",
+            "expires_at",
+        )
+        read_only_fields = ("status", "created_at", "ready_at", "expires_at")
+
+    def validate_book(self, book):
+        if book.inventory > 0:
+            raise serializers.ValidationError(
+                "This book is in stock. Borrow it instead."
+            )
+        if Hold.objects.filter(
+            user=self.context["request"].user,
+            book=book,
+            status__in=Hold.OPEN_STATUSES
+        ).exists():
+            raise serializers.ValidationError(
+                "You already have a hold on this book."
+            )
+        return book
+
+    def create(self, validated_data):
+        # A concurrent request may place the same hold after validation.
+        try:
+            with atomic():
+                hold = Hold.objects.create(
+                    user=self.context["request"].user,
+                    **validated_data
+                )
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {"book": ["You already have a hold on this book."]}
+            )
+        return Hold.objects.with_positions().get(pk=hold.pk)
+
+
 class BorrowingReturnSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -108,5 +315,99 @@ class BorrowingReturnSerializer(serializers.ModelSerializer):
             )
 
         instance.return_book()
-        instance.save()
         return instance
+
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    RETURNED = "returned"
+    ALREADY_RETURNED = "already_returned"
+    NOT_FOUND = "not_found"
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.BULK_RETURN_MAX_ITEMS,
+    )
+
+    @atomic
+    def create(self, validated_data) -> list[dict]:
+        """
+        Return every listed borrowing that is still out: one locking
+        SELECT, one UPDATE for the borrowings and one for the books.
+        Fines are computed from the loaded rows. Gives one result
+        per distinct id, in request order.
+        """
+        ids = list(dict.fromkeys(validated_data["ids"]))
+        today = datetime.today().date()
+
+        borrowings = {
+            borrowing.id: borrowing
+            for borrowing in Borrowing.objects.filter(pk__in=ids)
+            .select_related("book")
+            .only(
+                "id",
+                "borrow_date",
+                "expected_return_date",
+                "actual_return_date",
+                "is_active",
+                "user",
+                "book__id",
+                "book__title",
+                "book__daily_fee",
+            )
+            .select_for_update(of=("self",))
+        }
+        returned = [
+            borrowing for borrowing in borrowings.values()
+            if borrowing.actual_return_date is None
+        ]
+        returned_ids = {borrowing.id for borrowing in returned}
+
+        if returned:
+            Borrowing.objects.filter(pk__in=returned_ids).update(
+                actual_return_date=today,
+                is_active=False
+            )
+            Hold.objects.release_copies(
+                Counter(borrowing.book_id for borrowing in returned)
+            )
+            # The UPDATE skips the Borrowing signals.
+            deltas = StateDeltas()
+            for borrowing in returned:
+                deltas.change(
+                    borrowing.user_id,
+                    loan_state(borrowing.is_active),
+                    loan_state(False)
+                )
+            AccountState.objects.add(deltas)
+
+        fines = {}
+        for borrowing in returned:
+            borrowing.actual_return_date = today
+            borrowing.is_active = False
+            overdue_fee = borrowing.calculate_overdue_fee()
+            if overdue_fee > Decimal(0):
+                create_payment_session(
+                    borrowing,
+                    overdue_fee,
+                    Payment.PaymentType.FINE.name
+                )
+                fines[borrowing.id] = {"fine": str(overdue_fee)}
+        for borrowing_id, payment_id in Payment.objects.filter(
+            borrowing__in=list(fines)
+        ).values_list("borrowing_id", "id"):
+            fines[borrowing_id]["payment_id"] = payment_id
+
+        results = []
+        for borrowing_id in ids:
+            if borrowing_id not in borrowings:
+                result = {"status": self.NOT_FOUND}
+            elif borrowing_id in returned_ids:
+                result = {
+                    "status": self.RETURNED,
+                    **fines.get(borrowing_id, {}),
+                }
+            else:
+                result = {"status": self.ALREADY_RETURNED}
+            results.append({"id": borrowing_id, **result})
+        return results
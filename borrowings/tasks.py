@@ -1,28 +1,34 @@
 from datetime import datetime, timedelta
 
 from django.conf import settings
-import stripe
+from borrowings.archive import archive_returned_borrowings
+from borrowings.holds import expire_ready_holds, notify_holders
 from borrowings.overdue_borrowings import check_overdue_borrowings
+from borrowings.reconciliation import reconcile_expired_payments
 
 from celery import shared_task
 
-from payment.models import Payment
+
+@shared_task
+def check_borrowings() -> str:
+    return check_overdue_borrowings()
 
 
 @shared_task
-def check_borrowings() -> None:
-    check_overdue_borrowings()
+def archive_borrowings() -> str:
+    return f"{archive_returned_borrowings()} borrowings archived."
 
 
 @shared_task
-def check_expired_payments():
-    stripe.api_key = settings.STRIPE_SECRET_KEY
+def notify_ready_holds(hold_ids: list[int]) -> str:
+    return f"{notify_holders(hold_ids)} holders notified."
 
-    pending_payments = Payment.objects.filter(status="PENDING")
 
-    for payment in pending_payments:
-        session = stripe.checkout.Session.retrieve(payment.session_id)
+@shared_task
+def expire_holds() -> str:
+    return f"{expire_ready_holds()} holds expired."
 
-        if session["status"] == "expired":
-            payment.status = Payment.PaymentStatus.EXPIRED
-            payment.save()
+
+@shared_task
+def check_expired_payments() -> str:
+    return f"{reconcile_expired_payments()} payments expired."
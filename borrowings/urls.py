@@ -2,16 +2,31 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from borrowings.views import (
+    BorrowingBulkReturnView,
+    BorrowingExportView,
     BorrowingReturnAPIView,
-    BorrowingViewSet
+    BorrowingViewSet,
+    HoldViewSet
 )
 
 
 router = DefaultRouter()
+# Registered first, so "holds/" is not read as a borrowing id.
+router.register("holds", HoldViewSet)
 router.register("", BorrowingViewSet)
 
 
 urlpatterns = [
+    path(
+        "export/",
+        BorrowingExportView.as_view(),
+        name="borrowing-export"
+    ),
+    path(
+        "return/bulk/",
+        BorrowingBulkReturnView.as_view(),
+        name="borrowing-bulk-return"
+    ),
     path("", include(router.urls)),
     path(
         "<int:pk>/return/",
@@ -1,35 +1,94 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Value
+from django.http import Http404
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from rest_framework import viewsets, mixins, generics, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
     OpenApiTypes
 )
 
-from borrowings.models import Borrowing
+from borrowings.exports import (
+    BORROWING_EXPORT_COLUMNS,
+    get_borrowing_export_queryset
+)
+from borrowings.holds import cancel_hold
+from borrowings.models import ArchivedBorrowing, Borrowing, Hold
 from borrowings.permissions import IsAuthenticatedAndOwnerOrAdmin
 from borrowings.serializers import (
+    ArchivedBorrowingSerializer,
+    BorrowingBulkReturnSerializer,
+    BorrowingCheckoutSerializer,
     BorrowingCreateSerializer,
     BorrowingReadSerializer,
-    BorrowingReturnSerializer
+    BorrowingReturnSerializer,
+    HoldSerializer
+)
+from library_service.exports import (
+    EXPORT_PARAMETERS,
+    export_response,
+    get_date_range,
+    get_export_format
 )
+from library_service.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from library_service.mixins import FastListMixin
+from library_service.serializers import EXPAND_PARAMETER, FIELDS_PARAMETER
 from payment.models import Payment
 
 
+ARCHIVED_PARAMETER = OpenApiParameter(
+    name="archived",
+    description=(
+        "Set to 'true' to read borrowings returned long ago, "
+        "which are moved to the archive"
+    ),
+    type=OpenApiTypes.STR,
+    required=False,
+)
+
+
 class BorrowingViewSet(
+    FastListMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
     viewsets.GenericViewSet
 ):
-    queryset = Borrowing.objects.all().select_related("book", "user")
+    queryset = Borrowing.objects.all()
     permission_classes = (IsAuthenticatedAndOwnerOrAdmin,)
     serializer_class = BorrowingReadSerializer
+    fee_orderings = ("total_fee", "-total_fee", "overdue_fee", "-overdue_fee")
+    # Read returned loans moved to the archive (?archived=true)
+    archived = False
+
+    def initial(self, request, *args, **kwargs) -> None:
+        super().initial(request, *args, **kwargs)
+        self.archived = (
+            request.query_params.get("archived", "").lower() == "true"
+            and self.action in ["list", "retrieve"]
+        )
+
+    @property
+    def keyset_ordering(self):
+        """Fee orderings are not unique, so they cannot be keyset-paged"""
+        if self.request.query_params.get("ordering") in self.fee_orderings:
+            return None
+        # borrow_date is set on insert, so id order is borrow_date order
+        return "-id"
 
     def get_queryset(self):
         """Retrieve borrowings with filters"""
         queryset = self.queryset
+        if self.archived:
+            queryset = ArchivedBorrowing.objects.annotate(
+                is_active=Value(False)
+            )
         user = self.request.user
         user_id = self.request.query_params.get("user_id")
 
@@ -46,42 +105,92 @@ class BorrowingViewSet(
             is_active = True if is_active.lower() == "true" else False
             queryset = queryset.filter(is_active=is_active)
 
+        if self.action in ["list", "retrieve"]:
+            queryset = self.filter_by_fees(queryset)
+            queryset = self.get_serializer().prune_queryset(queryset)
+
+        return queryset
+
+    def filter_by_fees(self, queryset):
+        """Annotate fees when shown, sorted or filtered on"""
+        ordering = self.request.query_params.get("ordering")
+        min_overdue_fee = self.request.query_params.get("min_overdue_fee")
+        serializer_fields = self.get_serializer().fields
+
+        if not self.archived and (
+            ordering in self.fee_orderings
+            or min_overdue_fee
+            or set(BorrowingReadSerializer.annotated_fields)
+            & set(serializer_fields)
+        ):
+            queryset = queryset.with_fees()
+
+        if min_overdue_fee:
+            try:
+                min_overdue_fee = Decimal(min_overdue_fee)
+            except InvalidOperation:
+                raise ValidationError(
+                    {"min_overdue_fee": "A valid number is required."}
+                )
+            queryset = queryset.filter(overdue_fee__gte=min_overdue_fee)
+
+        if ordering in self.fee_orderings:
+            queryset = queryset.order_by(ordering, "-id")
+
         return queryset
 
     def get_serializer_class(self):
-        if self.action == "create":
+        if self.archived:
+            serializer = ArchivedBorrowingSerializer
+        elif self.action == "create":
             serializer = BorrowingCreateSerializer
+        elif self.action == "checkout":
+            serializer = BorrowingCheckoutSerializer
         else:
             serializer = BorrowingReadSerializer
         return serializer
 
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
     def create(self, request, *args, **kwargs) -> Response:
         """
-        Create a new borrowing. Return the Stripe session
+        Create a new borrowing. Return its payment, whose Stripe
+        session is opened right after; poll the payment for its URL.
         Check if user has Pending or Expired payment.
+        Retries with the same Idempotency-Key replay the response.
         """
-        user = self.request.user
-
-        pending_payments = Payment.objects.filter(
-            borrowing__user=user,
-            status="PENDING" or "EXPIRED"
-        )
-        if pending_payments:
-            raise ValidationError(
-                "You have pending/expired payments. "
-                "You cannot borrow new books until they are paid."
-            )
-
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        borrowing = serializer.save(user=user)
+        borrowing = serializer.save(user=self.request.user)
 
         payment = Payment.objects.get(borrowing=borrowing)
 
         return Response(
             {
                 "detail": "Borrowing created successfully",
-                "stripe_session_url": payment.session_url
+                "payment_id": payment.id
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=False, methods=["post"])
+    def checkout(self, request, *args, **kwargs) -> Response:
+        """
+        Borrow several books at once, paid through
+        a single Stripe session with one line item per book.
+        Returns the payments sharing that session.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        borrowings, session_request = serializer.save()
+
+        return Response(
+            {
+                "detail": "Borrowings created successfully",
+                "borrowings": [borrowing.id for borrowing in borrowings],
+                "payment_ids": sorted(
+                    session_request.payments.values_list("id", flat=True)
+                )
             },
             status=status.HTTP_201_CREATED,
         )
@@ -104,6 +213,22 @@ class BorrowingViewSet(
                 type=OpenApiTypes.STR,
                 required=False,
             ),
+            OpenApiParameter(
+                name="ordering",
+                description="Sort by fee",
+                type=OpenApiTypes.STR,
+                enum=list(fee_orderings),
+                required=False,
+            ),
+            OpenApiParameter(
+                name="min_overdue_fee",
+                description="Only borrowings with at least this overdue fee",
+                type=OpenApiTypes.DECIMAL,
+                required=False,
+            ),
+            ARCHIVED_PARAMETER,
+            FIELDS_PARAMETER,
+            EXPAND_PARAMETER,
         ]
     )
     def list(self, request, *args, **kwargs):
@@ -113,6 +238,22 @@ class BorrowingViewSet(
         """
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(
+        parameters=[ARCHIVED_PARAMETER, FIELDS_PARAMETER, EXPAND_PARAMETER]
+    )
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a borrowing by ID,
+        looking in the archive if it was moved there.
+        """
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if self.archived:
+                raise
+            self.archived = True
+            return super().retrieve(request, *args, **kwargs)
+
 
 class BorrowingReturnAPIView(
     generics.CreateAPIView
@@ -120,10 +261,13 @@ class BorrowingReturnAPIView(
     queryset = Borrowing.objects.all()
     serializer_class = BorrowingReturnSerializer
 
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
     def post(self, request, pk=None) -> Response:
         """
         Mark a borrowing as returned
         and handle overdue payments.
+        Retries with the same Idempotency-Key replay the response.
         """
 
         borrowing = self.get_object()
@@ -142,8 +286,95 @@ class BorrowingReturnAPIView(
         return Response(
             {
                 "detail": "You ned to pay overdue",
-                "stripe_session_url": payment.session_url
+                "payment_id": payment.id
             },
             status=status.HTTP_200_OK,
             headers=headers
         )
+
+
+class BorrowingBulkReturnView(generics.GenericAPIView):
+    permission_classes = (IsAdminUser,)
+    serializer_class = BorrowingBulkReturnSerializer
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    def post(self, request, *args, **kwargs) -> Response:
+        """
+        Check in a cart of borrowings at once. Each id gets a result:
+        returned (with the overdue fine and its payment, if any),
+        already_returned or not_found.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class HoldViewSet(
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.CreateModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    Queue for books that are out of stock. A returned copy goes to
+    the oldest waiting hold, whose holder is notified, instead of
+    back on the shelf; deleting a hold cancels it.
+    """
+    queryset = Hold.objects.all()
+    serializer_class = HoldSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+
+        hold_status = self.request.query_params.get("status")
+        if hold_status:
+            queryset = queryset.filter(status=hold_status.upper())
+
+        return queryset.with_positions().order_by("-id")
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="status",
+                description=(
+                    "Filter by hold status (waiting, ready, fulfilled, "
+                    "cancelled, expired)"
+                ),
+                type=OpenApiTypes.STR,
+                required=False,
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def perform_destroy(self, instance) -> None:
+        cancel_hold(instance)
+
+
+class BorrowingExportView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(parameters=EXPORT_PARAMETERS, responses=OpenApiTypes.BINARY)
+    def get(self, request, *args, **kwargs):
+        """
+        Stream every borrowing with its book and user
+        as CSV or NDJSON, optionally for a borrow date range.
+        Archived borrowings are exported with ?archived=true.
+        """
+        export_format = get_export_format(request.query_params.get("output"))
+        date_from, date_to = get_date_range(request.query_params)
+        archived = request.query_params.get("archived", "").lower() == "true"
+
+        return export_response(
+            get_borrowing_export_queryset(date_from, date_to, archived),
+            BORROWING_EXPORT_COLUMNS,
+            export_format,
+            "borrowings"
+        )
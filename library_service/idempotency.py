@@ -0,0 +1,124 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.exceptions import ImproperlyConfigured
+from drf_spectacular.utils import OpenApiParameter, OpenApiTypes
+from rest_framework import status
+from rest_framework.response import Response
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER,
+    location=OpenApiParameter.HEADER,
+    description=(
+        "Unique key of this request; a retry with the same key gets "
+        "the stored response without the request being run again"
+    ),
+    type=OpenApiTypes.STR,
+    required=False,
+)
+
+
+def get_idempotency_cache():
+    """
+    The IDEMPOTENCY_CACHE every worker shares. A missing one is an
+    error: a per-process cache would neither replay nor lock retries
+    that reach another worker.
+    """
+    try:
+        return caches[settings.IDEMPOTENCY_CACHE]
+    except InvalidCacheBackendError:
+        raise ImproperlyConfigured(
+            f"The '{settings.IDEMPOTENCY_CACHE}' cache is not configured; "
+            "set IDEMPOTENCY_CACHE_URL or CACHE_URL to a Redis URL."
+        )
+
+
+def idempotency_cache_key(request, key: str) -> str:
+    """Keys are scoped to the user and the endpoint they were sent to."""
+    scope = f"{request.user.pk}:{request.method}:{request.path}:{key}"
+    return f"idempotency:{hashlib.md5(scope.encode()).hexdigest()}"
+
+
+def idempotent(handler):
+    """
+    Store the response of a view method under the request's
+    Idempotency-Key header for IDEMPOTENCY_KEY_TTL seconds, and replay
+    it for retries with the same key instead of running the view again.
+
+    Only successful responses are stored, so a request that failed
+    can be retried with the same key. A retry that arrives while the
+    first request still runs gets 409, one with a different body 422.
+    Requests without the header are not affected.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return handler(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {
+                    "detail": f"{IDEMPOTENCY_HEADER} must be 1 to "
+                              f"{MAX_KEY_LENGTH} characters long."
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache = get_idempotency_cache()
+        cache_key = idempotency_cache_key(request, key)
+        lock_key = f"{cache_key}:lock"
+        fingerprint = hashlib.md5(request.body).hexdigest()
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            token = uuid.uuid4().hex
+            if not cache.add(
+                lock_key, token, settings.IDEMPOTENCY_LOCK_TIMEOUT
+            ):
+                return Response(
+                    {
+                        "detail": "A request with this "
+                                  f"{IDEMPOTENCY_HEADER} is in progress."
+                    },
+                    status=status.HTTP_409_CONFLICT
+                )
+            try:
+                # The first request may have finished in between.
+                stored = cache.get(cache_key)
+                if stored is None:
+                    response = handler(self, request, *args, **kwargs)
+                    if status.is_success(response.status_code):
+                        cache.set(
+                            cache_key,
+                            (fingerprint, response.status_code,
+                             response.data),
+                            settings.IDEMPOTENCY_KEY_TTL
+                        )
+                    return response
+            finally:
+                # Past IDEMPOTENCY_LOCK_TIMEOUT the lock may be a retry's.
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        stored_fingerprint, status_code, data = stored
+        if stored_fingerprint != fingerprint:
+            return Response(
+                {
+                    "detail": f"This {IDEMPOTENCY_HEADER} was already "
+                              "used with a different request body."
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        response = Response(data, status=status_code)
+        response[REPLAYED_HEADER] = "true"
+        return response
+
+    return wrapper
@@ -0,0 +1,36 @@
+from rest_framework.response import Response
+
+from library_service.serializers import compile_serializer
+
+
+class FastListMixin:
+    """
+    list() through a CompiledSerializer when `fast_serialization` is
+    set and the request's serializer compiles; otherwise the regular
+    ListModelMixin path. The output is the same either way.
+    """
+    fast_serialization = True
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        compiled = (
+            compile_serializer(serializer, queryset)
+            if self.fast_serialization else None
+        )
+
+        if compiled is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+
+        rows = compiled.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                compiled.to_representation(page)
+            )
+        return Response(compiled.to_representation(rows))
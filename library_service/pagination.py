@@ -0,0 +1,66 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a unique indexed key: every page is a
+    `WHERE key < cursor ORDER BY key LIMIT n`, with no COUNT or OFFSET.
+    """
+    page_size_query_param = "limit"
+    max_page_size = settings.MAX_PAGE_SIZE
+    ordering = "-id"
+
+
+class LibraryPagination(LimitOffsetPagination):
+    """
+    Limit/offset pages by default. With ?pagination=cursor (kept in the
+    next/previous links) views that define `keyset_ordering` are paged
+    with KeysetPagination on that ordering instead.
+    """
+    max_limit = settings.MAX_PAGE_SIZE
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, "keyset_ordering", None)
+
+        if ordering and request.query_params.get("pagination") == "cursor":
+            self.keyset_paginator = KeysetPagination()
+            self.keyset_paginator.ordering = ordering
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset_paginator:
+            return self.keyset_paginator.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+
+        if getattr(view, "keyset_ordering", None):
+            parameters += [
+                {
+                    "name": "pagination",
+                    "required": False,
+                    "in": "query",
+                    "description": "Set to 'cursor' for keyset pages.",
+                    "schema": {"type": "string", "enum": ["cursor"]},
+                },
+                {
+                    "name": KeysetPagination.cursor_query_param,
+                    "required": False,
+                    "in": "query",
+                    "description": KeysetPagination.cursor_query_description,
+                    "schema": {"type": "string"},
+                },
+            ]
+        return parameters
@@ -0,0 +1,222 @@
+from drf_spectacular.utils import OpenApiParameter, OpenApiTypes
+from rest_framework import serializers
+
+
+FIELDS_PARAMETER = OpenApiParameter(
+    name="fields",
+    description="Comma-separated fields to return (default: all)",
+    type=OpenApiTypes.STR,
+    required=False,
+)
+EXPAND_PARAMETER = OpenApiParameter(
+    name="expand",
+    description=(
+        "Comma-separated relations to nest; "
+        "relations not listed are returned as ids"
+    ),
+    type=OpenApiTypes.STR,
+    required=False,
+)
+
+
+def get_query_list(request, name: str) -> set[str] | None:
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Lets the request shape a top-level serializer:
+    ?fields=a,b keeps only those fields, and once ?expand= is given the
+    relations in `expandable_fields` are nested only if listed there
+    and returned as primary keys otherwise.
+    """
+    expandable_fields = {}
+    # Fields read from queryset annotations rather than columns.
+    annotated_fields = ()
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+
+        fields = get_query_list(request, "fields")
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+        expand = get_query_list(request, "expand")
+        if expand is not None:
+            for name, serializer_class in self.expandable_fields.items():
+                if name not in self.fields:
+                    continue
+                if name in expand:
+                    self.fields[name] = serializer_class(read_only=True)
+                else:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True
+                    )
+
+    def prune_queryset(self, queryset):
+        """
+        Join only the relations this serializer nests
+        and load only the columns its fields read.
+        """
+        related, columns = _get_lookups(self, "")
+        if related:
+            queryset = queryset.select_related(*related)
+        if columns is not None:
+            queryset = queryset.only(*columns)
+        return queryset
+
+
+def _get_lookups(serializer, prefix: str) -> tuple[list, list | None]:
+    """
+    Relations to select and columns to load for `serializer`'s fields,
+    as lookups under `prefix`. Columns are None when a field reads
+    the whole instance and so needs every column.
+    """
+    related, columns = [], [f"{prefix}id"]
+    needs_instance = False
+
+    annotated_fields = getattr(serializer, "annotated_fields", ())
+
+    for name, field in serializer.fields.items():
+        if name in annotated_fields:
+            continue
+        if (
+            field.source == "*"
+            or isinstance(field, serializers.ListSerializer)
+        ):
+            needs_instance = True
+            continue
+
+        path = prefix + "__".join(field.source_attrs)
+        if isinstance(field, serializers.BaseSerializer):
+            nested_related, nested_columns = _get_lookups(
+                field, f"{path}__"
+            )
+            related += [path] + nested_related
+            if nested_columns is None:
+                needs_instance = True
+            else:
+                columns += [path] + nested_columns
+        else:
+            if len(field.source_attrs) > 1:
+                relation = path.rsplit("__", 1)[0]
+                related.append(relation)
+                columns.append(relation)
+            columns.append(path)
+
+    return related, None if needs_instance else columns
+
+
+class NotCompilable(Exception):
+    """The serializer has fields that cannot be read from values()"""
+
+
+class CompiledSerializer:
+    """
+    A read-only serializer compiled from a (pruned) DRF serializer:
+    the queryset is read with values() and each row is turned into the
+    same dict the serializer would produce, without model instances
+    or per-field get_attribute() calls.
+
+    Covers model fields, dotted sources, primary key relations, nested
+    serializers and top-level annotations. Raises NotCompilable for
+    anything else, so callers fall back to the serializer.
+    """
+
+    def __init__(self, serializer, queryset) -> None:
+        self.annotations = set(queryset.query.annotations)
+        self.lookups = [queryset.model._meta.pk.name]
+        self.plan = self._compile(serializer, "")
+
+    def _compile(self, serializer, prefix: str) -> list[tuple]:
+        if (
+            type(serializer).to_representation
+            is not serializers.Serializer.to_representation
+        ):
+            raise NotCompilable(serializer)
+
+        annotated_fields = getattr(serializer, "annotated_fields", ())
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if (
+                field.source == "*"
+                or isinstance(field, serializers.ListSerializer)
+                or isinstance(field, serializers.ManyRelatedField)
+            ):
+                raise NotCompilable(field)
+
+            lookup = prefix + "__".join(field.source_attrs)
+
+            if isinstance(field, serializers.BaseSerializer):
+                pk = field.Meta.model._meta.pk.name
+                self._add_lookup(f"{lookup}__{pk}")
+                plan.append(
+                    (name, f"{lookup}__{pk}", None,
+                     self._compile(field, f"{lookup}__"))
+                )
+                continue
+
+            if name in annotated_fields:
+                if prefix or lookup not in self.annotations:
+                    raise NotCompilable(field)
+                convert = field.to_representation
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                # values() gives the related primary key itself.
+                convert = (
+                    field.pk_field.to_representation
+                    if field.pk_field else _identity
+                )
+            elif (
+                isinstance(field, serializers.RelatedField)
+                or type(field).get_attribute
+                is not serializers.Field.get_attribute
+            ):
+                raise NotCompilable(field)
+            else:
+                convert = field.to_representation
+
+            self._add_lookup(lookup)
+            plan.append((name, lookup, convert, None))
+        return plan
+
+    def _add_lookup(self, lookup: str) -> None:
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def to_representation(self, rows) -> list[dict]:
+        return [self._build(row, self.plan) for row in rows]
+
+    def _build(self, row: dict, plan: list[tuple]) -> dict:
+        data = {}
+        for name, lookup, convert, nested in plan:
+            value = row[lookup]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = self._build(row, nested)
+            else:
+                data[name] = convert(value)
+        return data
+
+
+def _identity(value):
+    return value
+
+
+def compile_serializer(serializer, queryset) -> CompiledSerializer | None:
+    try:
+        return CompiledSerializer(serializer, queryset)
+    except NotCompilable:
+        return None
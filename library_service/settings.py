@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework_simplejwt",
     "django_celery_beat",
     "drf_spectacular",
@@ -144,6 +146,10 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+MEDIA_URL = "media/"
+
+MEDIA_ROOT = BASE_DIR / "media"
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -161,12 +167,14 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination"
-    ".LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "library_service.pagination"
+    ".LibraryPagination",
     "PAGE_SIZE": 5,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+MAX_PAGE_SIZE = 100
+
 SIMPLE_JWT = {
     "AUTH_HEADER_NAME": "HTTP_AUTHORIZE",
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
@@ -183,12 +191,133 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Europe/Kyiv"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_BEAT_SCHEDULE = {
+    "rebuild-book-recommendations": {
+        "task": "books.tasks.rebuild_recommendations",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "archive-returned-borrowings": {
+        "task": "borrowings.tasks.archive_borrowings",
+        "schedule": crontab(hour=2, minute=0),
+    },
+    "expire-book-holds": {
+        "task": "borrowings.tasks.expire_holds",
+        "schedule": crontab(minute=0),
+    },
+    "open-stalled-payment-sessions": {
+        "task": "payment.tasks.open_stalled_payment_sessions",
+        "schedule": crontab(minute="*"),
+    },
+    # Webhooks queue processing themselves; this picks up stragglers.
+    "process-stripe-events": {
+        "task": "payment.tasks.process_stripe_events",
+        "schedule": crontab(minute="*/5"),
+    },
+}
+
+# Cache
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.getenv("CACHE_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL"),
+    }
+
+# Catalog: the version that invalidates cached book responses and
+# their ETags must be the same on every worker, so it needs Redis too.
+CATALOG_CACHE = "catalog"
+CATALOG_CACHE_URL = os.getenv("CATALOG_CACHE_URL", os.getenv("CACHE_URL"))
+if CATALOG_CACHE_URL:
+    CACHES[CATALOG_CACHE] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CATALOG_CACHE_URL,
+        "KEY_PREFIX": "catalog",
+    }
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Idempotency: stored responses and their locks must be seen by every
+# worker, so they get their own Redis cache and no per-process fallback.
+IDEMPOTENCY_CACHE = "idempotency"
+IDEMPOTENCY_CACHE_URL = os.getenv(
+    "IDEMPOTENCY_CACHE_URL", os.getenv("CACHE_URL")
+)
+if IDEMPOTENCY_CACHE_URL:
+    CACHES[IDEMPOTENCY_CACHE] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": IDEMPOTENCY_CACHE_URL,
+        "KEY_PREFIX": "idempotency",
+    }
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+# Longest a request may hold its key before a retry may run it again.
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Catalog facets
+FACET_AUTHOR_LIMIT = 20
+
+# Recommendations
+BOOK_SIMILAR_LIMIT = 10
+
+# Book imports
+BOOK_IMPORT_BATCH_SIZE = 1000
+BOOK_IMPORT_MAX_ERRORS = 1000
+
+# Exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Desk check-in
+BULK_RETURN_MAX_ITEMS = 200
+
+# Borrowing limits
+MAX_ACTIVE_LOANS = 10
+
+# Holds
+HOLD_PICKUP_DAYS = 3
+
+# Cart checkout
+CHECKOUT_MAX_BOOKS = 20
+
+# Borrowing archive
+BORROWING_ARCHIVE_AFTER_MONTHS = 12
+BORROWING_ARCHIVE_BATCH_SIZE = 1000
+
+# Overdue notifications
+OVERDUE_SCAN_CHUNK_SIZE = 2000
 
 # Stripe
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_SUCCESS_URL = os.getenv("STRIPE_SUCCESS_URL")
 STRIPE_CANCEL_URL = os.getenv("STRIPE_CANCEL_URL")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_EVENT_BATCH_SIZE = 500
+# Sessions are created with this lifetime (Stripe allows up to 24h),
+# so their creation time is known from the stored expiry.
+STRIPE_SESSION_LIFETIME_HOURS = 23
+STRIPE_RECONCILE_WORKERS = 8
+# Checkout sessions are opened by a worker after the borrowing commits.
+PAYMENT_SESSION_MAX_ATTEMPTS = 10
+# Failed attempts are retried after 2, 4, 8... seconds, at most this.
+PAYMENT_SESSION_RETRY_MAX_SECONDS = 600
+# The sweep requeues requests this late for their next attempt.
+PAYMENT_SESSION_STALL_SECONDS = 60
+
+# Payment gateway: payment.gateways.FakeGateway keeps checkout
+# offline for load tests and CI.
+PAYMENT_GATEWAY = os.getenv(
+    "PAYMENT_GATEWAY", "payment.gateways.StripeGateway"
+)
+FAKE_PAYMENT_GATEWAY = {
+    "LATENCY": float(os.getenv("FAKE_PAYMENT_LATENCY", 0)),
+    "ERROR_RATE": float(os.getenv("FAKE_PAYMENT_ERROR_RATE", 0)),
+    "RATE_LIMIT_RATE": float(os.getenv("FAKE_PAYMENT_RATE_LIMIT_RATE", 0)),
+    "SEED": os.getenv("FAKE_PAYMENT_SEED"),
+    # Shared by web and worker processes when it is Redis (CACHE_URL).
+    "CACHE": os.getenv("FAKE_PAYMENT_CACHE", "default"),
+}
 
 # DRF Spectacular
 SPECTACULAR_SETTINGS = {
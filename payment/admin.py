@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from payment.models import Payment
+from payment.models import ArchivedPayment, Payment, StripeEvent
 
 
 admin.site.register(Payment)
+admin.site.register(ArchivedPayment)
+admin.site.register(StripeEvent)
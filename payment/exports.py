@@ -0,0 +1,36 @@
+from datetime import date
+
+from payment.models import ArchivedPayment, Payment
+
+
+PAYMENT_EXPORT_COLUMNS = (
+    "id",
+    "status",
+    "pay_type",
+    "money_to_pay",
+    "session_id",
+    "borrowing__id",
+    "borrowing__borrow_date",
+    "borrowing__book__id",
+    "borrowing__book__title",
+    "borrowing__book__author",
+    "borrowing__user__id",
+    "borrowing__user__email",
+)
+
+
+def get_payment_export_queryset(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    archived: bool = False
+):
+    """
+    Payments for borrowings made between date_from and date_to,
+    from the live table or, when `archived`, from the archive.
+    """
+    queryset = (ArchivedPayment if archived else Payment).objects.all()
+    if date_from:
+        queryset = queryset.filter(borrowing__borrow_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(borrowing__borrow_date__lte=date_to)
+    return queryset
@@ -0,0 +1,302 @@
+import json
+from abc import ABC, abstractmethod
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Iterable
+
+import stripe
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class GatewayError(Exception):
+    """The payment gateway failed or refused the call"""
+
+
+class RateLimited(GatewayError):
+    """The payment gateway asked us to slow down"""
+
+
+class InvalidEvent(GatewayError):
+    """A webhook payload is malformed or its signature does not match"""
+
+
+@dataclass
+class CheckoutSession:
+    id: str
+    url: str
+    status: str
+    payment_status: str
+    expires_at: int
+
+
+class PaymentGateway(ABC):
+    """
+    What the library needs from a payment provider: hosted checkout
+    sessions, their state, and verified webhook events.
+    """
+
+    @abstractmethod
+    def create_session(
+        self,
+        line_items: list[dict],
+        expires_at: int,
+        success_url: str,
+        cancel_url: str,
+        idempotency_key: str | None = None,
+    ) -> CheckoutSession:
+        ...
+
+    @abstractmethod
+    def retrieve_session(self, session_id: str) -> CheckoutSession:
+        ...
+
+    @abstractmethod
+    def list_expired_sessions(
+        self,
+        created_from: int,
+        created_to: int
+    ) -> Iterable[str]:
+        """Ids of the sessions created in the window that expired"""
+        ...
+
+    @abstractmethod
+    def construct_event(self, payload: bytes, signature: str) -> dict:
+        ...
+
+
+class StripeGateway(PaymentGateway):
+
+    def __init__(self) -> None:
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+
+    def create_session(
+        self,
+        line_items: list[dict],
+        expires_at: int,
+        success_url: str,
+        cancel_url: str,
+        idempotency_key: str | None = None,
+    ) -> CheckoutSession:
+        try:
+            session = stripe.checkout.Session.create(
+                payment_method_types=["card"],
+                line_items=line_items,
+                mode="payment",
+                success_url=success_url,
+                cancel_url=cancel_url,
+                expires_at=expires_at,
+                idempotency_key=idempotency_key,
+            )
+        except stripe.RateLimitError as error:
+            raise RateLimited(str(error)) from error
+        except stripe.StripeError as error:
+            raise GatewayError(str(error)) from error
+        return CheckoutSession(
+            id=session.id,
+            url=session.url,
+            status=getattr(session, "status", "open"),
+            payment_status=getattr(session, "payment_status", "unpaid"),
+            expires_at=expires_at,
+        )
+
+    def retrieve_session(self, session_id: str) -> CheckoutSession:
+        try:
+            session = stripe.checkout.Session.retrieve(session_id)
+        except stripe.RateLimitError as error:
+            raise RateLimited(str(error)) from error
+        except stripe.StripeError as error:
+            raise GatewayError(str(error)) from error
+        return CheckoutSession(
+            id=session_id,
+            url=session.get("url"),
+            status=session["status"],
+            payment_status=session.get("payment_status"),
+            expires_at=session["expires_at"],
+        )
+
+    def list_expired_sessions(
+        self,
+        created_from: int,
+        created_to: int
+    ) -> Iterable[str]:
+        try:
+            sessions = stripe.checkout.Session.list(
+                status="expired",
+                created={"gte": created_from, "lte": created_to},
+                limit=100,
+            )
+            return [session.id for session in sessions.auto_paging_iter()]
+        except stripe.RateLimitError as error:
+            raise RateLimited(str(error)) from error
+        except stripe.StripeError as error:
+            raise GatewayError(str(error)) from error
+
+    def construct_event(self, payload: bytes, signature: str) -> dict:
+        try:
+            stripe.Webhook.construct_event(
+                payload, signature, settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.SignatureVerificationError) as error:
+            raise InvalidEvent(str(error)) from error
+        return json.loads(payload)
+
+
+class FakeGateway(PaymentGateway):
+    """
+    An offline gateway for load tests and CI. Sessions live in the
+    FAKE_PAYMENT_GATEWAY["CACHE"] cache, so web and worker processes
+    sharing a Redis cache see the same sessions. Sessions expire at
+    their `expires_at` unless paid, and can be settled with pay() or
+    expire() or the fake_gateway command. FAKE_PAYMENT_GATEWAY sets the
+    simulated latency (seconds per call) and the share of calls that
+    fail or are rate limited; events are accepted unsigned.
+    """
+    URL = "https://checkout.fake/pay/{session_id}"
+    PREFIX = "payment:fake-gateway"
+
+    def __init__(self) -> None:
+        self.cache = caches[settings.FAKE_PAYMENT_GATEWAY["CACHE"]]
+        self.lock = threading.Lock()
+        self.random = random.Random(settings.FAKE_PAYMENT_GATEWAY["SEED"])
+
+    def _call(self) -> None:
+        config = settings.FAKE_PAYMENT_GATEWAY
+        if config["LATENCY"]:
+            time.sleep(config["LATENCY"])
+        with self.lock:
+            draw = self.random.random()
+        if draw < config["RATE_LIMIT_RATE"]:
+            raise RateLimited("Simulated rate limit")
+        if draw < config["RATE_LIMIT_RATE"] + config["ERROR_RATE"]:
+            raise GatewayError("Simulated gateway error")
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.PREFIX, *map(str, parts)))
+
+    def _load(self, session_id: str) -> dict:
+        stored = self.cache.get(self._key("session", session_id))
+        if stored is None:
+            raise GatewayError(f"No such checkout session: {session_id}")
+        return stored
+
+    def _session(self, stored: dict) -> CheckoutSession:
+        session = CheckoutSession(**stored["session"])
+        if session.status == "open" and session.expires_at <= time.time():
+            session.status = "expired"
+        return session
+
+    def create_session(
+        self,
+        line_items: list[dict],
+        expires_at: int,
+        success_url: str,
+        cancel_url: str,
+        idempotency_key: str | None = None,
+    ) -> CheckoutSession:
+        self._call()
+        session_id = f"cs_fake_{uuid.uuid4().hex}"
+        if idempotency_key and not self.cache.add(
+            self._key("idempotent", idempotency_key), session_id, None
+        ):
+            session_id = self.cache.get(
+                self._key("idempotent", idempotency_key)
+            )
+            return self._session(self._load(session_id))
+
+        session = CheckoutSession(
+            id=session_id,
+            url=self.URL.format(session_id=session_id),
+            status="open",
+            payment_status="unpaid",
+            expires_at=expires_at,
+        )
+        self.cache.set(
+            self._key("session", session_id),
+            {"session": asdict(session), "created": int(time.time())},
+            None
+        )
+        # Numbered in creation order, so expired sessions can be listed.
+        self.cache.add(self._key("count"), 0, None)
+        number = self.cache.incr(self._key("count"))
+        self.cache.set(self._key("number", number), session_id, None)
+        return session
+
+    def retrieve_session(self, session_id: str) -> CheckoutSession:
+        self._call()
+        return self._session(self._load(session_id))
+
+    def list_expired_sessions(
+        self,
+        created_from: int,
+        created_to: int
+    ) -> Iterable[str]:
+        self._call()
+        count = self.cache.get(self._key("count")) or 0
+        session_ids = self.cache.get_many(
+            [self._key("number", number) for number in range(1, count + 1)]
+        ).values()
+        stored = self.cache.get_many(
+            [self._key("session", session_id) for session_id in session_ids]
+        ).values()
+        return [
+            item["session"]["id"]
+            for item in stored
+            if created_from <= item["created"] <= created_to
+            and self._session(item).status == "expired"
+        ]
+
+    def construct_event(self, payload: bytes, signature: str) -> dict:
+        try:
+            return json.loads(payload)
+        except ValueError as error:
+            raise InvalidEvent(str(error)) from error
+
+    def _settle(self, session_id: str, event_type: str, **changes) -> dict:
+        stored = self._load(session_id)
+        stored["session"].update(changes)
+        self.cache.set(self._key("session", session_id), stored, None)
+        return {
+            "id": f"evt_fake_{uuid.uuid4().hex}",
+            "object": "event",
+            "type": event_type,
+            "data": {
+                "object": {
+                    "id": session_id,
+                    "status": stored["session"]["status"],
+                    "payment_status": stored["session"]["payment_status"],
+                }
+            },
+        }
+
+    def pay(self, session_id: str) -> dict:
+        """Complete a session; returns the webhook event Stripe sends."""
+        return self._settle(
+            session_id,
+            "checkout.session.completed",
+            status="complete",
+            payment_status="paid",
+        )
+
+    def expire(self, session_id: str) -> dict:
+        """Expire a session now; returns the matching webhook event."""
+        return self._settle(
+            session_id,
+            "checkout.session.expired",
+            status="expired",
+        )
+
+
+_gateways = {}
+
+
+def get_gateway() -> PaymentGateway:
+    """The PAYMENT_GATEWAY in use, one instance per process."""
+    path = settings.PAYMENT_GATEWAY
+    if path not in _gateways:
+        _gateways[path] = import_string(path)()
+    return _gateways[path]
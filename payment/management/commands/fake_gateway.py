@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from payment.gateways import FakeGateway, GatewayError, get_gateway
+from payment.tasks import process_stripe_events
+from payment.webhooks import record_event
+
+
+class Command(BaseCommand):
+    """
+    Pay or expire FakeGateway sessions and deliver the events as the
+    webhook would, so load tests can settle checkouts offline.
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("action", choices=["pay", "expire"])
+        parser.add_argument("session_ids", nargs="+")
+
+    def handle(self, *args, **options) -> None:
+        gateway = get_gateway()
+        if not isinstance(gateway, FakeGateway):
+            raise CommandError("PAYMENT_GATEWAY is not the FakeGateway.")
+
+        settle = getattr(gateway, options["action"])
+        try:
+            events = [
+                settle(session_id) for session_id in options["session_ids"]
+            ]
+        except GatewayError as error:
+            raise CommandError(str(error))
+
+        with transaction.atomic():
+            recorded = sum(record_event(event) for event in events)
+            transaction.on_commit(process_stripe_events.delay)
+        self.stdout.write(
+            self.style.SUCCESS(f"Delivered {recorded} fake gateway events")
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0002_hot_query_indexes"),
+        ("payment", "0007_alter_payment_status"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status__in", ["PENDING", "EXPIRED"])),
+                fields=["status", "borrowing"],
+                name="payment_unsettled_status_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0005_hold"),
+        ("payment", "0008_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="session_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["session_expires_at"],
+                name="payment_pending_expiry_idx",
+            ),
+        ),
+    ]
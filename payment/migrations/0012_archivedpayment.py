@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0005_hold"),
+        ("payment", "0011_paymentsessionrequest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPayment",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("status", models.CharField(max_length=20)),
+                ("pay_type", models.CharField(max_length=20)),
+                ("session_url", models.URLField(blank=True, max_length=500)),
+                ("session_id", models.CharField(blank=True, max_length=100)),
+                ("money_to_pay", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "borrowing",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payment",
+                        to="borrowings.archivedborrowing",
+                    ),
+                ),
+            ],
+        ),
+    ]
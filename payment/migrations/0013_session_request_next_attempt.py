@@ -0,0 +1,40 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def expire_failed_payments(apps, schema_editor):
+    """Let payments stuck on a failed request be renewed"""
+    Payment = apps.get_model("payment", "Payment")
+    Payment.objects.using(schema_editor.connection.alias).filter(
+        session_request__status="FAILED", status="PENDING", session_id=""
+    ).update(status="EXPIRED")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payment", "0012_archivedpayment"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="paymentsessionrequest",
+            name="payment_request_pending_idx",
+        ),
+        migrations.AddField(
+            model_name="paymentsessionrequest",
+            name="next_attempt_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="paymentsessionrequest",
+            index=models.Index(
+                condition=models.Q(("status", "PENDING")),
+                fields=["next_attempt_at"],
+                name="payment_request_pending_idx",
+            ),
+        ),
+        migrations.RunPython(expire_failed_payments, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,48 @@
 from django.db import models
+from django.utils import timezone
 from enum import Enum
 
-from borrowings.models import Borrowing
+from borrowings.models import ArchivedBorrowing, Borrowing
+
+
+class PaymentSessionRequest(models.Model):
+    """
+    Outbox row for a checkout session: written with its payments in
+    the borrowing's transaction and turned into a gateway session by
+    a worker once that transaction has committed.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        OPENED = "OPENED", "Opened"
+        SUPERSEDED = "SUPERSEDED", "Superseded"
+        FAILED = "FAILED", "Failed"
+
+    payment_type = models.CharField(max_length=20)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    # Pushed back after each failed attempt by the retry backoff.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Requests still to open, by when they are due: the sweep.
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="PENDING"),
+                name="payment_request_pending_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Payment session request {self.id}: {self.status}"
 
 
 class Payment(models.Model):
@@ -30,9 +71,35 @@ class Payment(models.Model):
         on_delete=models.CASCADE,
         related_name="payments",
     )
-    session_url = models.URLField(max_length=500)
-    session_id = models.CharField(max_length=100)
+    # Blank until the session request's worker has opened the session.
+    session_url = models.URLField(max_length=500, blank=True)
+    session_id = models.CharField(max_length=100, blank=True)
+    session_request = models.ForeignKey(
+        PaymentSessionRequest,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="payments"
+    )
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2)
+    session_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only unsettled payments are looked up by status;
+            # PAID rows, the vast majority, stay out of the index.
+            models.Index(
+                fields=["status", "borrowing"],
+                condition=models.Q(status__in=["PENDING", "EXPIRED"]),
+                name="payment_unsettled_status_idx"
+            ),
+            # Pending sessions by expiry: the reconciliation scan.
+            models.Index(
+                fields=["session_expires_at"],
+                condition=models.Q(status="PENDING"),
+                name="payment_pending_expiry_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -48,3 +115,57 @@ class Payment(models.Model):
     def save(self, *args, **kwargs) -> None:
         self.clean()
         return super().save(*args, **kwargs)
+
+
+class ArchivedPayment(models.Model):
+    """
+    The payment of an archived borrowing, moved out of the payments
+    table with it. It keeps the payment's id and session.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    status = models.CharField(max_length=20)
+    pay_type = models.CharField(max_length=20)
+    borrowing = models.OneToOneField(
+        ArchivedBorrowing,
+        on_delete=models.CASCADE,
+        related_name="payment",
+    )
+    session_url = models.URLField(max_length=500, blank=True)
+    session_id = models.CharField(max_length=100, blank=True)
+    money_to_pay = models.DecimalField(max_digits=10, decimal_places=2)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return (
+            f"Archived payment for Borrowing ID {self.borrowing_id}, "
+            f"Type: {self.pay_type}, Status: {self.status}"
+        )
+
+
+class StripeEvent(models.Model):
+    """
+    A webhook event as Stripe sent it, stored once per event id so
+    redelivered events are ignored, and applied later in batches.
+    """
+    id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Events still to apply, oldest first: the batch scan.
+            models.Index(
+                fields=["received_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="stripe_event_unprocessed_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Stripe event {self.id}: {self.type}"
+
+    @property
+    def session(self) -> dict:
+        return self.payload["data"]["object"]
@@ -1,10 +1,15 @@
 from rest_framework import serializers
 
-from borrowings.serializers import BorrowingReadSerializer
-from payment.models import Payment
+from borrowings.serializers import (
+    ArchivedBorrowingSerializer,
+    BorrowingReadSerializer,
+)
+from library_service.serializers import DynamicFieldsMixin
+from payment.models import ArchivedPayment, Payment
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {"borrowing": BorrowingReadSerializer}
 
     class Meta:
         model = Payment
@@ -17,7 +22,12 @@ class PaymentSerializer(serializers.ModelSerializer):
         )
 
 
-class PaymentDetailSerializer(serializers.ModelSerializer):
+class PaymentDetailSerializer(
+    DynamicFieldsMixin,
+    serializers.ModelSerializer
+):
+    expandable_fields = {"borrowing": BorrowingReadSerializer}
+
     borrowing = BorrowingReadSerializer()
 
     class Meta:
@@ -31,3 +41,28 @@ class PaymentDetailSerializer(serializers.ModelSerializer):
             "session_id",
             "money_to_pay",
         )
+
+
+class ArchivedPaymentSerializer(
+    DynamicFieldsMixin,
+    serializers.ModelSerializer
+):
+    """Reads archived payments in the same shape as live ones"""
+    expandable_fields = {"borrowing": ArchivedBorrowingSerializer}
+
+    class Meta:
+        model = ArchivedPayment
+        fields = PaymentSerializer.Meta.fields
+
+
+class ArchivedPaymentDetailSerializer(
+    DynamicFieldsMixin,
+    serializers.ModelSerializer
+):
+    expandable_fields = {"borrowing": ArchivedBorrowingSerializer}
+
+    borrowing = ArchivedBorrowingSerializer()
+
+    class Meta:
+        model = ArchivedPayment
+        fields = PaymentDetailSerializer.Meta.fields
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from payment.gateways import GatewayError, get_gateway
+from payment.models import Payment, PaymentSessionRequest
+
+
+def get_line_items(payments) -> list[dict]:
+    return [
+        {
+            "price_data": {
+                "currency": "usd",
+                "product_data": {
+                    "name": f"{payment.pay_type} fee "
+                    "for " f"{payment.borrowing.book.title}",
+                },
+                "unit_amount": int(payment.money_to_pay * 100),
+            },
+            "quantity": 1,
+        }
+        for payment in payments
+    ]
+
+
+def retry_delay(attempts: int) -> int:
+    """Seconds to wait after the `attempts`-th failed attempt"""
+    return min(2 ** attempts, settings.PAYMENT_SESSION_RETRY_MAX_SECONDS)
+
+
+def fail_request(session_request, error: str) -> None:
+    """
+    Give up on a request and expire its payments, so the borrower
+    can renew them. PENDING and EXPIRED count alike in AccountState,
+    so the users' states do not change.
+    """
+    with transaction.atomic():
+        PaymentSessionRequest.objects.filter(pk=session_request.pk).update(
+            status=PaymentSessionRequest.Status.FAILED,
+            attempts=F("attempts") + 1,
+            last_error=error,
+        )
+        Payment.objects.filter(
+            session_request=session_request,
+            status=Payment.PaymentStatus.PENDING.name,
+        ).update(status=Payment.PaymentStatus.EXPIRED.name)
+
+
+def open_session(request_id: int) -> str:
+    """
+    Open the checkout session of a pending request, with a line item
+    per payment still pointing at it, and store it on those payments.
+    The gateway call runs outside any transaction and is keyed on the
+    request, so a retried request never opens a second session.
+    A failed call pushes the next attempt back and is re-raised, and
+    the last allowed one fails the request. Returns its new status.
+    """
+    session_request = PaymentSessionRequest.objects.get(pk=request_id)
+    if session_request.status != PaymentSessionRequest.Status.PENDING:
+        return session_request.status
+
+    payments = list(
+        session_request.payments.select_related("borrowing__book")
+        .order_by("id")
+    )
+    requests = PaymentSessionRequest.objects.filter(pk=request_id)
+    if not payments:
+        # Every payment was pointed at a newer request meanwhile.
+        requests.update(status=PaymentSessionRequest.Status.SUPERSEDED)
+        return PaymentSessionRequest.Status.SUPERSEDED
+
+    # Derived from the request, so retries send the same parameters.
+    expires_at = session_request.created_at + timedelta(
+        hours=settings.STRIPE_SESSION_LIFETIME_HOURS
+    )
+    try:
+        session = get_gateway().create_session(
+            line_items=get_line_items(payments),
+            expires_at=int(expires_at.timestamp()),
+            success_url=(
+                settings.STRIPE_SUCCESS_URL
+                + "?session_id={CHECKOUT_SESSION_ID}"
+            ),
+            cancel_url=(
+                settings.STRIPE_CANCEL_URL
+                + "?session_id={CHECKOUT_SESSION_ID}"
+            ),
+            idempotency_key=f"payment-session-request-{request_id}",
+        )
+    except GatewayError as error:
+        attempts = session_request.attempts + 1
+        if attempts < settings.PAYMENT_SESSION_MAX_ATTEMPTS:
+            requests.update(
+                attempts=F("attempts") + 1,
+                last_error=str(error),
+                next_attempt_at=timezone.now() + timedelta(
+                    seconds=retry_delay(attempts)
+                ),
+            )
+            raise
+        fail_request(session_request, str(error))
+        return PaymentSessionRequest.Status.FAILED
+
+    with transaction.atomic():
+        Payment.objects.filter(session_request=session_request).update(
+            session_id=session.id,
+            session_url=session.url,
+            session_expires_at=expires_at,
+        )
+        requests.update(
+            status=PaymentSessionRequest.Status.OPENED,
+            attempts=F("attempts") + 1,
+            opened_at=timezone.now(),
+        )
+    return PaymentSessionRequest.Status.OPENED
+
+
+def get_stalled_requests():
+    """
+    Pending requests overdue for their next attempt, whose after-commit
+    task or retry was lost. Requests waiting out a backoff are left to
+    their retry.
+    """
+    return PaymentSessionRequest.objects.filter(
+        status=PaymentSessionRequest.Status.PENDING,
+        next_attempt_at__lt=timezone.now() - timedelta(
+            seconds=settings.PAYMENT_SESSION_STALL_SECONDS
+        ),
+    ).order_by("next_attempt_at").values_list("id", flat=True)
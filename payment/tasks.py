@@ -0,0 +1,38 @@
+from celery import shared_task
+from django.conf import settings
+
+from payment.gateways import GatewayError
+from payment.sessions import (
+    get_stalled_requests,
+    open_session,
+    retry_delay,
+)
+from payment.webhooks import process_events
+
+
+@shared_task(
+    bind=True,
+    # The request itself fails after its last attempt.
+    max_retries=settings.PAYMENT_SESSION_MAX_ATTEMPTS - 1,
+)
+def open_payment_session(self, request_id: int) -> str:
+    try:
+        status = open_session(request_id)
+    except GatewayError as error:
+        raise self.retry(
+            exc=error, countdown=retry_delay(self.request.retries + 1)
+        )
+    return f"Payment session request {request_id}: {status}"
+
+
+@shared_task
+def open_stalled_payment_sessions() -> str:
+    request_ids = list(get_stalled_requests())
+    for request_id in request_ids:
+        open_payment_session.delay(request_id)
+    return f"{len(request_ids)} payment session requests queued."
+
+
+@shared_task
+def process_stripe_events() -> str:
+    return f"{process_events()} Stripe events processed."
@@ -3,9 +3,11 @@ from rest_framework.routers import DefaultRouter
 
 from payment.views import (
     PaymentCancelView,
+    PaymentExportView,
     PaymentSuccessView,
     PaymentViewSet,
-    PaymentRenewalView
+    PaymentRenewalView,
+    StripeWebhookView
 )
 
 
@@ -14,6 +16,16 @@ router.register("", PaymentViewSet)
 
 
 urlpatterns = [
+    path(
+        "payments/export/",
+        PaymentExportView.as_view(),
+        name="payment-export"
+    ),
+    path(
+        "payments/webhook/",
+        StripeWebhookView.as_view(),
+        name="payment-webhook"
+    ),
     path("payments/", include(router.urls)),
     path(
         "payments-renew/",
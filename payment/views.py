@@ -1,57 +1,94 @@
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import redirect
-import stripe
 from rest_framework import viewsets, mixins, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiParameter,
+    OpenApiTypes
+)
 
 
 from borrowings.helpers.payment import create_payment_session
-from borrowings.helpers.telegram import send_message
-from payment.models import Payment
+from library_service.exports import (
+    EXPORT_PARAMETERS,
+    export_response,
+    get_date_range,
+    get_export_format
+)
+from library_service.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from library_service.mixins import FastListMixin
+from library_service.serializers import EXPAND_PARAMETER, FIELDS_PARAMETER
+from payment.exports import (
+    PAYMENT_EXPORT_COLUMNS,
+    get_payment_export_queryset
+)
+from payment.gateways import InvalidEvent, get_gateway
+from payment.models import ArchivedPayment, Payment
 from payment.serializers import (
+    ArchivedPaymentDetailSerializer,
+    ArchivedPaymentSerializer,
     PaymentSerializer,
     PaymentDetailSerializer,
 )
+from payment.tasks import process_stripe_events
+from payment.webhooks import HANDLED_EVENTS, record_event
 
 
-def update_payment_status(payment, new_status, send_notification=False):
-    payment.status = new_status
-    payment.save()
-    if send_notification:
-        message = (
-            f"Payment Successful:\n"
-            f"Money to pay: ${payment.money_to_pay} USD\n"
-            f"New Borrowing Created:\n"
-            f"Book: {payment.borrowing.book.title} "
-            f"({payment.borrowing.book.author})\n"
-            f"User: {payment.borrowing.user.email}\n"
-            f"Borrow Date: {payment.borrowing.borrow_date}\n"
-            f"Expected Return Date: {
-                payment.borrowing.expected_return_date
-            }"
-        )
-        send_message(message)
+ARCHIVED_PARAMETER = OpenApiParameter(
+    name="archived",
+    description=(
+        "Set to 'true' to read the payments of archived borrowings"
+    ),
+    type=OpenApiTypes.STR,
+    required=False,
+)
 
 
 class PaymentViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    FastListMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet
 ):
-    queryset = Payment.objects.all().select_related()
+    queryset = Payment.objects.all()
     permission_classes = (IsAuthenticated,)
+    keyset_ordering = "-id"
+    # Read payments moved to the archive (?archived=true)
+    archived = False
+
+    def initial(self, request, *args, **kwargs) -> None:
+        super().initial(request, *args, **kwargs)
+        self.archived = (
+            request.query_params.get("archived", "").lower() == "true"
+        )
 
     def get_queryset(self):
         queryset = self.queryset
+        if self.archived:
+            queryset = ArchivedPayment.objects.all()
         user = self.request.user
         if not user.is_staff:
-            return queryset.filter(borrowing__user=user)
+            queryset = queryset.filter(borrowing__user=user)
+        if self.action in ["list", "retrieve"]:
+            queryset = self.get_serializer().prune_queryset(queryset)
         return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
+            if self.archived:
+                return ArchivedPaymentSerializer
             return PaymentSerializer
+        if self.archived:
+            return ArchivedPaymentDetailSerializer
         return PaymentDetailSerializer
 
+    @extend_schema(
+        parameters=[ARCHIVED_PARAMETER, FIELDS_PARAMETER, EXPAND_PARAMETER]
+    )
     def list(self, request, *args, **kwargs):
         """
         Retieve full list if is admin,
@@ -59,39 +96,72 @@ class PaymentViewSet(
         """
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(
+        parameters=[ARCHIVED_PARAMETER, FIELDS_PARAMETER, EXPAND_PARAMETER]
+    )
     def retrieve(self, request, *args, **kwargs):
         """
-        Retrieve a specific payment by ID.
+        Retrieve a specific payment by ID,
+        looking in the archive if it was moved there.
         """
-        return super().retrieve(request, *args, **kwargs)
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if self.archived:
+                raise
+            self.archived = True
+            return super().retrieve(request, *args, **kwargs)
+
+
+class PaymentExportView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(parameters=EXPORT_PARAMETERS, responses=OpenApiTypes.BINARY)
+    def get(self, request, *args, **kwargs):
+        """
+        Stream every payment with its borrowing, book and user
+        as CSV or NDJSON, optionally for a borrow date range.
+        Payments of archived borrowings are exported with ?archived=true.
+        """
+        export_format = get_export_format(request.query_params.get("output"))
+        date_from, date_to = get_date_range(request.query_params)
+        archived = request.query_params.get("archived", "").lower() == "true"
+
+        return export_response(
+            get_payment_export_queryset(date_from, date_to, archived),
+            PAYMENT_EXPORT_COLUMNS,
+            export_format,
+            "payments"
+        )
 
 
 class PaymentRenewalView(APIView):
 
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
     def post(self, request, *args, **kwargs):
-        """ Renewal session ID & URL. """
+        """
+        Renew an expired payment. The new session is opened right
+        after; poll the returned payment for its URL.
+        Retries with the same Idempotency-Key replay the response.
+        """
         user = self.request.user
 
         payment = Payment.objects.filter(
             status="EXPIRED", borrowing__user=user
         ).first()
         if payment:
-            new_session = create_payment_session(
+            # Upserts the payment back to PENDING for a new session.
+            create_payment_session(
                 payment.borrowing,
                 payment.money_to_pay,
                 Payment.PaymentType.PAYMENT.name
             )
-            update_payment_status(
-                payment,
-                new_session,
-                send_notification=True
-            )
 
             return Response(
                 {
-                    "detail": "Payment session renewed.",
-                    "session_id": new_session.id,
-                    "session_url": new_session.url
+                    "detail": "Payment session renewal requested.",
+                    "payment_id": payment.id
                 }
             )
         return Response(
@@ -102,23 +172,56 @@ class PaymentRenewalView(APIView):
 
 class PaymentSuccessView(APIView):
     """
-    Updates the status of a payment to 'PAID'
-    based on the session ID provided in the query parameters.
-    Sends a notification message about the new borrowing.
+    Where Stripe redirects after checkout. Payments are marked PAID by
+    the webhook events, so this only reports the session's local state.
     """
     def get(self, request, *args, **kwargs) -> Response:
         session_id = request.query_params.get("session_id")
-        session = stripe.checkout.Session.retrieve(session_id)
-        payment = Payment.objects.get(session_id=session_id)
-
-        if session.get("payment_status") == "paid":
-            update_payment_status(
-                payment,
-                Payment.PaymentStatus.PAID.name,
-                send_notification=True
-            )
+        # A cart checkout pays several borrowings with one session.
+        statuses = set(
+            Payment.objects.filter(
+                session_id=session_id
+            ).values_list("status", flat=True)
+        )
 
+        if not statuses:
+            return Response(
+                {"detail": "Payment session not found."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if statuses == {Payment.PaymentStatus.PAID.name}:
             return Response({"detail": "Payment succeeded!"})
+        return Response(
+            {"detail": "Payment is being confirmed. Check again shortly."},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class StripeWebhookView(APIView):
+    """
+    Receives Stripe's signed checkout session events. Each event is
+    stored once per event id and applied by process_stripe_events.
+    """
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    @extend_schema(request=None, responses=None)
+    def post(self, request, *args, **kwargs) -> Response:
+        try:
+            event = get_gateway().construct_event(
+                request.body,
+                request.headers.get("Stripe-Signature", "")
+            )
+        except InvalidEvent:
+            return Response(
+                {"detail": "Invalid Stripe event."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if event["type"] in HANDLED_EVENTS and record_event(event):
+            transaction.on_commit(process_stripe_events.delay)
+
+        return Response(status=status.HTTP_200_OK)
 
 
 class PaymentCancelView(APIView):
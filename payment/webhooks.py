@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from borrowings.helpers.telegram import send_messages
+from payment.models import Payment, StripeEvent
+from users.account_state import StateDeltas, payment_state
+from users.models import AccountState
+
+
+SESSION_COMPLETED = "checkout.session.completed"
+SESSION_EXPIRED = "checkout.session.expired"
+HANDLED_EVENTS = (SESSION_COMPLETED, SESSION_EXPIRED)
+
+PENDING = Payment.PaymentStatus.PENDING.name
+PAID = Payment.PaymentStatus.PAID.name
+EXPIRED = Payment.PaymentStatus.EXPIRED.name
+
+
+def record_event(event: dict) -> bool:
+    """Store a verified event; False if its id was already stored."""
+    _, created = StripeEvent.objects.get_or_create(
+        id=event["id"],
+        defaults={"type": event["type"], "payload": event},
+    )
+    return created
+
+
+def format_payment_notice(payment: Payment) -> str:
+    borrowing = payment.borrowing
+    return (
+        f"Payment Successful:\n"
+        f"Money to pay: ${payment.money_to_pay} USD\n"
+        f"New Borrowing Created:\n"
+        f"Book: {borrowing.book.title} ({borrowing.book.author})\n"
+        f"User: {borrowing.user.email}\n"
+        f"Borrow Date: {borrowing.borrow_date}\n"
+        f"Expected Return Date: {borrowing.expected_return_date}"
+    )
+
+
+def settle_payments(session_ids: set[str]) -> list[Payment]:
+    """
+    Mark the unpaid payments of these sessions PAID in one UPDATE,
+    keeping AccountState in step, and return them.
+    """
+    payments = list(
+        Payment.objects.filter(session_id__in=session_ids)
+        .exclude(status=PAID)
+        .select_related("borrowing__book", "borrowing__user")
+        .select_for_update(of=("self",))
+    )
+    if not payments:
+        return []
+
+    # The UPDATE skips the payment signals.
+    deltas = StateDeltas()
+    for payment in payments:
+        deltas.add(
+            payment.borrowing.user_id,
+            payment_state(payment.status, payment.money_to_pay),
+            -1
+        )
+    Payment.objects.filter(
+        pk__in=[payment.id for payment in payments]
+    ).update(status=PAID)
+    AccountState.objects.add(deltas)
+    return payments
+
+
+def process_events(batch_size: int | None = None) -> int:
+    """
+    Apply up to `batch_size` stored events, oldest first, in one
+    transaction: one UPDATE for the paid sessions, one for the
+    expired ones and one marking the events processed. Events locked
+    by another worker are skipped. The paid borrowings are announced
+    once the batch is committed. Returns the number of events.
+    """
+    batch_size = batch_size or settings.STRIPE_EVENT_BATCH_SIZE
+
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.filter(processed_at__isnull=True)
+            .order_by("received_at")
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not events:
+            return 0
+
+        paid, expired = set(), set()
+        for event in events:
+            session = event.session
+            if event.type == SESSION_EXPIRED:
+                expired.add(session["id"])
+            elif session.get("payment_status") == "paid":
+                paid.add(session["id"])
+
+        payments = settle_payments(paid)
+        # Both statuses are unpaid, so AccountState does not change.
+        Payment.objects.filter(
+            session_id__in=expired - paid,
+            status=PENDING
+        ).update(status=EXPIRED)
+        StripeEvent.objects.filter(
+            pk__in=[event.id for event in events]
+        ).update(processed_at=timezone.now())
+
+    send_messages(format_payment_notice(payment) for payment in payments)
+    return len(events)
@@ -0,0 +1,136 @@
+import io
+import tempfile
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from books.cache import get_catalog_cache, get_catalog_version
+from books.importers import BookImporter, read_rows
+from books.models import Book, BookFacetCount, BookImportJob
+from tests.test_books import sample_book
+
+
+BOOK_IMPORTS_URL = reverse("books:bookimportjob-list")
+
+CSV_FEED = (
+    "isbn,title,author,cover,inventory,daily_fee\n"
+    "9780441013593,Dune,Frank Herbert,hard,4,1.50\n"
+    "9780261103344,The Hobbit,J. R. R. Tolkien,soft,2,0.75\n"
+    "9780000000000,Broken,Nobody,paper,-1,0\n"
+)
+
+JSONL_FEED = (
+    '{"isbn": "9780441013593", "title": "Dune", "author": "Frank Herbert",'
+    ' "cover": "hard", "inventory": 9, "daily_fee": "2.00"}\n'
+    "{not json\n"
+)
+
+
+def import_feed(feed: str, file_format: str, **kwargs) -> BookImporter:
+    stream = io.BytesIO(feed.encode())
+    return BookImporter(**kwargs).run(read_rows(stream, file_format))
+
+
+class BookImporterTest(APITestCase):
+
+    def test_csv_rows_are_created_and_errors_reported(self) -> None:
+
+        importer = import_feed(CSV_FEED, "csv", batch_size=2)
+
+        self.assertEqual(importer.processed_rows, 3)
+        self.assertEqual(importer.imported_rows, 2)
+        self.assertEqual(importer.failed_rows, 1)
+        self.assertEqual(importer.errors[0]["line"], 4)
+        self.assertEqual(
+            set(importer.errors[0]["errors"]),
+            {"cover", "inventory", "daily_fee"}
+        )
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_jsonl_rows_upsert_on_isbn(self) -> None:
+        sample_book(isbn="9780441013593", inventory=1)
+
+        importer = import_feed(JSONL_FEED, "jsonl")
+
+        book = Book.objects.get(isbn="9780441013593")
+        self.assertEqual(book.title, "Dune")
+        self.assertEqual(book.inventory, 9)
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(importer.errors[0]["line"], 2)
+
+    def test_failed_import_still_rebuilds_facets(self) -> None:
+        get_catalog_cache().clear()
+
+        def rows():
+            yield from read_rows(io.BytesIO(CSV_FEED.encode()), "csv")
+            raise OSError("Connection reset")
+
+        versions = []
+
+        with self.assertRaises(OSError):
+            BookImporter(
+                batch_size=1,
+                on_progress=lambda importer: versions.append(
+                    get_catalog_version()
+                ),
+            ).run(rows())
+        facets = BookFacetCount.objects.panel()
+
+        self.assertEqual(facets["cover"], {"hard": 1, "soft": 1})
+        self.assertEqual(facets["availability"], {"available": 2})
+        # Cached panels are dropped with the facets rebuilt.
+        self.assertGreater(get_catalog_version(), versions[-1])
+
+
+class BookImportJobTestView(APITestCase):
+
+    def setUp(self) -> None:
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="admin@test.com",
+            password="adminpassword",
+            is_staff=True,
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_admin_upload_creates_job(self) -> None:
+        feed = SimpleUploadedFile("feed.csv", CSV_FEED.encode())
+
+        response = self.client.post(
+            BOOK_IMPORTS_URL,
+            {"source": feed},
+            format="multipart"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = BookImportJob.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, BookImportJob.StatusChoices.PENDING)
+        self.assertEqual(job.created_by, self.user)
+
+    def test_upload_rejects_unknown_format(self) -> None:
+        feed = SimpleUploadedFile("feed.xlsx", b"")
+
+        response = self.client.post(
+            BOOK_IMPORTS_URL,
+            {"source": feed},
+            format="multipart"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_admin_cannot_upload(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="user@test.com",
+                password="testpassword",
+            )
+        )
+
+        response = self.client.get(BOOK_IMPORTS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
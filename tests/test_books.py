@@ -1,10 +1,15 @@
+import time
 from decimal import Decimal
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
 from django.urls import reverse
+from django.utils.http import http_date
 from django.contrib.auth import get_user_model
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
-from books.models import Book
+from books.cache import get_catalog_cache
+from books.models import Book, BookFacetCount
 
 
 BOOKS_URL = reverse("books:book-list")
@@ -149,3 +154,284 @@ class AdminBooksTestVew(APITestCase):
             response.status_code,
             status.HTTP_204_NO_CONTENT
         )
+
+
+class BookSearchTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.dune = sample_book(title="Dune", author="Frank Herbert")
+        self.hobbit = sample_book(title="The Hobbit", author="J. R. R. Tolkien")
+
+    def test_list_search_filters_books(self) -> None:
+
+        response = self.client.get(BOOKS_URL, {"search": "hobbit"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [self.hobbit.id]
+        )
+
+    def test_search_tolerates_typos(self) -> None:
+
+        response = self.client.get(BOOKS_URL, {"search": "Hobit"})
+
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [self.hobbit.id]
+        )
+
+    def test_search_vector_follows_updates(self) -> None:
+
+        Book.objects.filter(pk=self.dune.pk).update(title="Children of Dune")
+        self.dune.refresh_from_db()
+        self.dune.title = "Dune Messiah"
+        self.dune.save()
+
+        self.assertTrue(Book.objects.search("messiah").exists())
+        self.assertFalse(Book.objects.search("children").exists())
+
+    def test_ranked_search_requires_query(self) -> None:
+
+        response = self.client.get(reverse("books:book-search"))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ranked_search_orders_best_match_first(self) -> None:
+        sample_book(title="Dune Messiah", author="Frank Herbert")
+
+        response = self.client.get(
+            reverse("books:book-search"),
+            {"search": "dune"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["id"], self.dune.id)
+
+
+class CatalogCacheTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        get_catalog_cache().clear()
+
+    def test_cached_list_hits_no_database(self) -> None:
+        sample_book()
+        self.client.get(BOOKS_URL)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOKS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_book_changes_invalidate_cache(self) -> None:
+        book = sample_book()
+        self.client.get(BOOKS_URL)
+
+        sample_book(title="Sample book_2")
+        response = self.client.get(BOOKS_URL)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        book.inventory = 0
+        book.save()
+        response = self.client.get(BOOKS_URL)
+        inventory = {
+            item["id"]: item["inventory"]
+            for item in response.data["results"]
+        }
+        self.assertEqual(inventory[book.id], 0)
+
+        book.delete()
+        response = self.client.get(BOOKS_URL)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    @override_settings(CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    })
+    def test_missing_catalog_cache_fails_loudly(self) -> None:
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get(BOOKS_URL)
+
+
+class KeysetPaginationBooksTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        get_catalog_cache().clear()
+        self.books = [
+            sample_book(title=f"Sample book {number}")
+            for number in range(7)
+        ]
+
+    def test_cursor_pages_follow_id_order_without_count(self) -> None:
+
+        with self.assertNumQueries(1):
+            response = self.client.get(BOOKS_URL, {"pagination": "cursor"})
+
+        self.assertNotIn("count", response.data)
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [book.id for book in self.books[:5]]
+        )
+
+        response = self.client.get(response.data["next"])
+
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [book.id for book in self.books[5:]]
+        )
+        self.assertIsNone(response.data["next"])
+
+    def test_cursor_page_size_from_limit(self) -> None:
+
+        response = self.client.get(
+            BOOKS_URL,
+            {"pagination": "cursor", "limit": 2}
+        )
+
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+class InventoryUpdateTest(APITestCase):
+
+    def test_checkout_copies_skips_books_without_stock(self) -> None:
+        book = sample_book(inventory=1)
+        empty_book = sample_book(title="Sample book_2", inventory=0)
+
+        inventory = Book.objects.checkout_copies(
+            {book.id: 1, empty_book.id: 1}
+        )
+
+        self.assertEqual(inventory, {book.id: 0})
+        self.assertEqual(Book.objects.checkout_copies({book.id: 1}), {})
+        empty_book.refresh_from_db()
+        self.assertEqual(empty_book.inventory, 0)
+
+    def test_return_copies_increments_inventory(self) -> None:
+        book = sample_book(inventory=0)
+
+        inventory = Book.objects.return_copies({book.id: 2})
+
+        self.assertEqual(inventory, {book.id: 2})
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+
+
+class ConditionalGetBooksTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        get_catalog_cache().clear()
+        self.book = sample_book()
+
+    def test_matching_etag_returns_not_modified(self) -> None:
+        response = self.client.get(BOOKS_URL)
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_catalog_change_changes_etag(self) -> None:
+        etag = self.client.get(BOOKS_URL)["ETag"]
+
+        self.book.inventory = 3
+        self.book.save()
+        response = self.client.get(BOOKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_modified_since_does_not_skip_changes(self) -> None:
+        self.client.get(BOOKS_URL)
+
+        self.book.inventory = 3
+        self.book.save()
+        response = self.client.get(
+            BOOKS_URL, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_etag_differs_from_list(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="test@test.com",
+                password="testuser1234",
+            )
+        )
+        list_etag = self.client.get(BOOKS_URL)["ETag"]
+        response = self.client.get(detail_book_url(self.book.id))
+
+        self.assertNotEqual(response["ETag"], list_etag)
+
+        response = self.client.get(
+            detail_book_url(self.book.id),
+            HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class BookFacetsTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        get_catalog_cache().clear()
+        self.book = sample_book(author="Author A", inventory=1)
+        sample_book(author="Author A", cover=Book.CoverChoices.SOFT)
+        sample_book(author="Author B", inventory=0)
+
+    def get_facets(self) -> dict:
+        get_catalog_cache().clear()
+        response = self.client.get(reverse("books:book-facets"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_facets_count_books(self) -> None:
+        facets = self.get_facets()
+
+        self.assertEqual(facets["cover"], {"hard": 2, "soft": 1})
+        self.assertEqual(facets["availability"], {"available": 2})
+        self.assertEqual(
+            facets["author"],
+            [
+                {"value": "Author A", "count": 2},
+                {"value": "Author B", "count": 1},
+            ]
+        )
+
+    def test_facets_follow_book_changes(self) -> None:
+        self.book.author = "Author B"
+        self.book.cover = Book.CoverChoices.SOFT
+        self.book.save()
+        Book.objects.get(author="Author A").delete()
+
+        facets = self.get_facets()
+
+        self.assertEqual(facets["cover"], {"hard": 1, "soft": 1})
+        self.assertEqual(facets["availability"], {"available": 1})
+        self.assertEqual(
+            facets["author"], [{"value": "Author B", "count": 2}]
+        )
+
+    def test_facets_follow_inventory_changes(self) -> None:
+        Book.objects.checkout_copies({self.book.id: 1})
+        self.assertEqual(self.get_facets()["availability"], {"available": 1})
+
+        Book.objects.return_copies({self.book.id: 1})
+        Book.objects.return_copies({self.book.id: 1})
+        self.assertEqual(self.get_facets()["availability"], {"available": 2})
+
+    def test_facets_are_served_from_counters(self) -> None:
+        with self.assertNumQueries(2):
+            self.client.get(reverse("books:book-facets"))
+
+    def test_rebuild_matches_incremental_counts(self) -> None:
+        expected = self.get_facets()
+        BookFacetCount.objects.all().delete()
+
+        BookFacetCount.objects.rebuild()
+
+        self.assertEqual(self.get_facets(), expected)
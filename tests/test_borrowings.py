@@ -1,12 +1,21 @@
+import json
 from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework import status
-from rest_framework.test import APIClient, APITestCase
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
 
 from books.models import Book
-from borrowings.models import Borrowing
+from borrowings.helpers.telegram import build_digests
+from borrowings.archive import archive_returned_borrowings
+from borrowings.models import ArchivedBorrowing, Borrowing, OverdueScan
+from borrowings.overdue_borrowings import check_overdue_borrowings
 from borrowings.serializers import BorrowingReadSerializer
+from payment.models import ArchivedPayment, Payment
+from payment.sessions import open_session
 from tests.test_books import sample_book
 
 
@@ -98,6 +107,21 @@ class AuthenticatedUserBorrowingsTestView(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_auth_borrowing_create_last_copy(self):
+
+        date = datetime.today().date()
+        book = sample_book(inventory=1)
+        data = {
+            "book": book.id,
+            "expected_return_date": date + timedelta(days=7),
+        }
+
+        response = self.client.post(BORROWINGS_URL, data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 0)
+
     def test_auth_other_borrowing_detail(self):
 
         borrowing = sample_borrowing(user=self.other_user)
@@ -145,3 +169,656 @@ class AdminUserBorrowingsTestView(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ReturnBookTest(APITestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+
+    def test_return_book_updates_inventory_and_borrowing(self):
+        borrowing = sample_borrowing(user=self.user)
+        Book.objects.filter(pk=borrowing.book_id).update(inventory=0)
+
+        borrowing.return_book()
+
+        borrowing.refresh_from_db()
+        self.assertFalse(borrowing.is_active)
+        self.assertEqual(
+            borrowing.actual_return_date,
+            datetime.today().date()
+        )
+        self.assertEqual(
+            Book.objects.get(pk=borrowing.book_id).inventory,
+            1
+        )
+
+
+class SparseFieldsBorrowingsTestView(APITestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(self.user)
+        self.borrowing = sample_borrowing(user=self.user)
+
+    def test_fields_limits_output(self):
+
+        response = self.client.get(
+            BORROWINGS_URL,
+            {"fields": "id,borrow_date"}
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [{
+                "id": self.borrowing.id,
+                "borrow_date": str(self.borrowing.borrow_date),
+            }]
+        )
+
+    def test_expand_collapses_unlisted_relations(self):
+
+        response = self.client.get(
+            BORROWINGS_URL,
+            {"fields": "id,book", "expand": ""}
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.borrowing.id, "book": self.borrowing.book_id}]
+        )
+
+        response = self.client.get(
+            BORROWINGS_URL,
+            {"fields": "id,book", "expand": "book"}
+        )
+
+        self.assertEqual(
+            response.data["results"][0]["book"]["title"],
+            self.borrowing.book.title
+        )
+
+    def test_pruned_queryset_skips_unused_joins(self):
+        request = APIRequestFactory().get(
+            BORROWINGS_URL,
+            {"fields": "id,book", "expand": ""}
+        )
+        request.query_params = request.GET
+        serializer = BorrowingReadSerializer(context={"request": request})
+
+        queryset = serializer.prune_queryset(Borrowing.objects.all())
+
+        self.assertEqual(queryset.query.select_related, False)
+        self.assertEqual(
+            queryset.query.deferred_loading,
+            ({"id", "book"}, False)
+        )
+
+
+class ExportBorrowingsTestView(APITestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.admin_user = get_user_model().objects.create_user(
+            email="admin@test.com",
+            password="adminpassword",
+            is_staff=True,
+        )
+        self.client.force_authenticate(self.admin_user)
+        self.borrowing = sample_borrowing(user=self.admin_user)
+
+    def test_export_streams_csv(self):
+
+        response = self.client.get(reverse("borrowings:borrowing-export"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["id", "borrow_date"])
+        self.assertEqual(len(lines), 2)
+        self.assertIn(self.admin_user.email, lines[1])
+
+    def test_export_streams_ndjson_by_date_range(self):
+        today = datetime.today().date()
+
+        response = self.client.get(
+            reverse("borrowings:borrowing-export"),
+            {"output": "ndjson", "from": str(today)}
+        )
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+
+        self.assertEqual(rows[0]["id"], self.borrowing.id)
+        self.assertEqual(rows[0]["book_title"], self.borrowing.book.title)
+
+        response = self.client.get(
+            reverse("borrowings:borrowing-export"),
+            {"output": "ndjson", "to": str(today - timedelta(days=1))}
+        )
+
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_export_requires_admin(self):
+        self.client.force_authenticate(self.borrowing.user)
+        self.admin_user.is_staff = False
+        self.admin_user.save()
+
+        response = self.client.get(reverse("borrowings:borrowing-export"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OverdueBorrowingsTest(APITestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        today = datetime.today().date()
+        self.overdue = [
+            sample_borrowing(
+                user=self.user,
+                expected_return_date=today - timedelta(days=days)
+            )
+            for days in (3, 1, 0)
+        ]
+        sample_borrowing(
+            user=self.user,
+            expected_return_date=today - timedelta(days=5)
+        ).return_book()
+        sample_borrowing(
+            user=self.user,
+            expected_return_date=today + timedelta(days=1)
+        )
+
+    def test_build_digests_splits_at_limit(self) -> None:
+        lines = [f"line {number}" for number in range(10)]
+
+        digests = list(build_digests("Header:", lines, limit=30))
+
+        for digest in digests:
+            self.assertLessEqual(len(digest), 30)
+            self.assertTrue(digest.startswith("Header:\n"))
+        self.assertEqual(
+            [line for digest in digests for line in digest.split("\n")[1:]],
+            lines,
+        )
+
+    @mock.patch("borrowings.helpers.telegram.send_message")
+    def test_overdue_scan_sends_one_digest(self, send_message) -> None:
+        # Watermark, one scan and one update per level, the scan record;
+        # none of it depends on the number of overdue loans.
+        with self.assertNumQueries(12):
+            result = check_overdue_borrowings()
+
+        self.assertEqual(result, "3 overdue borrowings notified in 1 messages.")
+        send_message.assert_called_once()
+        message = send_message.call_args.args[0]
+        self.assertTrue(
+            message.splitlines()[1].startswith(
+                f"[1 day overdue] #{self.overdue[0].id} "
+            )
+        )
+        self.assertIn(f"[Due] #{self.overdue[2].id} ", message)
+        self.assertIn(self.user.email, message)
+        self.assertEqual(
+            [
+                borrowing.overdue_notified_level
+                for borrowing in Borrowing.objects.filter(
+                    pk__in=[borrowing.pk for borrowing in self.overdue]
+                ).order_by("expected_return_date")
+            ],
+            [
+                Borrowing.OverdueLevel.DAY,
+                Borrowing.OverdueLevel.DAY,
+                Borrowing.OverdueLevel.DUE,
+            ]
+        )
+
+    @mock.patch("borrowings.helpers.telegram.send_message")
+    def test_rerun_only_notifies_new_levels(self, send_message) -> None:
+        today = datetime.today().date()
+        check_overdue_borrowings()
+        send_message.reset_mock()
+
+        self.assertEqual(
+            check_overdue_borrowings(), "No borrowings overdue today"
+        )
+        send_message.assert_not_called()
+
+        # A day later, the loan due yesterday is now a week late.
+        OverdueScan.objects.update(scanned_through=today - timedelta(days=1))
+        Borrowing.objects.filter(pk=self.overdue[1].pk).update(
+            expected_return_date=today - timedelta(days=7)
+        )
+
+        result = check_overdue_borrowings()
+
+        self.assertEqual(result, "1 overdue borrowings notified in 1 messages.")
+        self.assertIn(
+            f"[7 days overdue] #{self.overdue[1].id} ",
+            send_message.call_args.args[0]
+        )
+        self.overdue[1].refresh_from_db()
+        self.assertEqual(
+            self.overdue[1].overdue_notified_level,
+            Borrowing.OverdueLevel.WEEK
+        )
+
+    @mock.patch("borrowings.helpers.telegram.send_message")
+    def test_no_overdue_borrowings(self, send_message) -> None:
+        Borrowing.objects.update(actual_return_date=datetime.today().date())
+
+        self.assertEqual(
+            check_overdue_borrowings(), "No borrowings overdue today"
+        )
+        send_message.assert_not_called()
+
+
+class BulkReturnBorrowingsTestView(APITestCase):
+    url = reverse("borrowings:borrowing-bulk-return")
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@test.com",
+            password="testadmin1234",
+        )
+        self.client.force_authenticate(self.admin)
+        self.book = sample_book(inventory=2)
+        self.borrowings = [
+            Borrowing.objects.create(
+                user=self.admin,
+                book=self.book,
+                expected_return_date=(
+                    datetime.today().date() + timedelta(days=7)
+                ),
+            )
+            for _ in range(2)
+        ]
+        Book.objects.checkout_copies({self.book.id: 2})
+
+    def test_bulk_return_gives_per_item_results(self) -> None:
+        returned = sample_borrowing(user=self.admin)
+        returned.return_book()
+        ids = [
+            self.borrowings[0].id,
+            returned.id,
+            0,
+            self.borrowings[1].id,
+            self.borrowings[0].id,
+        ]
+
+        response = self.client.post(self.url, {"ids": ids}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"id": self.borrowings[0].id, "status": "returned"},
+                {"id": returned.id, "status": "already_returned"},
+                {"id": 0, "status": "not_found"},
+                {"id": self.borrowings[1].id, "status": "returned"},
+            ]
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 2)
+        self.assertFalse(
+            Borrowing.objects.filter(
+                pk__in=[borrowing.id for borrowing in self.borrowings],
+                is_active=True,
+            ).exists()
+        )
+
+    @mock.patch("stripe.checkout.Session.create")
+    def test_bulk_return_fines_overdue_borrowings(self, create_session):
+        Borrowing.objects.filter(pk=self.borrowings[0].pk).update(
+            expected_return_date=datetime.today().date() - timedelta(days=3)
+        )
+
+        response = self.client.post(
+            self.url,
+            {"ids": [borrowing.id for borrowing in self.borrowings]},
+            format="json"
+        )
+
+        fine = Payment.objects.get(borrowing=self.borrowings[0])
+        self.assertEqual(
+            response.data["results"][0],
+            {
+                "id": self.borrowings[0].id,
+                "status": "returned",
+                "fine": "6.00",
+                "payment_id": fine.id,
+            }
+        )
+        self.assertEqual(
+            response.data["results"][1],
+            {"id": self.borrowings[1].id, "status": "returned"}
+        )
+        self.assertEqual(fine.money_to_pay, Decimal("6.00"))
+        # The session is opened after commit, outside the request.
+        create_session.assert_not_called()
+
+    def test_bulk_return_admin_only(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="user@test.com",
+                password="testuser1234",
+            )
+        )
+
+        response = self.client.post(
+            self.url, {"ids": [self.borrowings[0].id]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(
+    STRIPE_SUCCESS_URL="http://testserver/api/payments/success/",
+    STRIPE_CANCEL_URL="http://testserver/api/payments/cancel/",
+)
+class CheckoutBorrowingsTestView(APITestCase):
+    url = reverse("borrowings:borrowing-checkout")
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        self.client.force_authenticate(self.user)
+        self.books = [
+            sample_book(title=f"Sample book_{number}", inventory=1)
+            for number in range(2)
+        ]
+        self.payload = {
+            "books": [book.id for book in self.books],
+            "expected_return_date": (
+                datetime.today().date() + timedelta(days=7)
+            ),
+        }
+
+    @mock.patch(
+        "payment.tasks.open_payment_session.delay", side_effect=open_session
+    )
+    @mock.patch("stripe.checkout.Session.create")
+    def test_checkout_creates_borrowings_with_one_session(
+        self, create_session, open_payment_session
+    ) -> None:
+        create_session.return_value = mock.Mock(
+            id="cs_test_cart", url="https://checkout.stripe.com/cart"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url, self.payload, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.data["payment_ids"],
+            sorted(
+                Payment.objects.filter(
+                    borrowing__user=self.user
+                ).values_list("id", flat=True)
+            )
+        )
+        open_payment_session.assert_called_once()
+        create_session.assert_called_once()
+        self.assertEqual(
+            len(create_session.call_args.kwargs["line_items"]), 2
+        )
+        borrowings = Borrowing.objects.filter(user=self.user)
+        self.assertEqual(
+            sorted(response.data["borrowings"]),
+            sorted(borrowing.id for borrowing in borrowings)
+        )
+        self.assertEqual(
+            set(
+                Payment.objects.filter(
+                    borrowing__in=borrowings
+                ).values_list("session_id", "money_to_pay")
+            ),
+            {("cs_test_cart", Decimal("7.00"))}
+        )
+        self.assertEqual(
+            Payment.objects.filter(session_id="cs_test_cart").count(), 2
+        )
+        self.assertFalse(
+            Book.objects.filter(
+                pk__in=self.payload["books"], inventory__gt=0
+            ).exists()
+        )
+
+    @mock.patch("stripe.checkout.Session.create")
+    def test_checkout_is_all_or_nothing(self, create_session) -> None:
+        Book.objects.filter(pk=self.books[1].pk).update(inventory=0)
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        create_session.assert_not_called()
+        self.assertFalse(Borrowing.objects.exists())
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].inventory, 1)
+
+    def test_checkout_rejects_duplicate_and_unknown_books(self) -> None:
+        for books in ([self.books[0].id] * 2, [0]):
+            response = self.client.post(
+                self.url, {**self.payload, "books": books}, format="json"
+            )
+
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn("books", response.data)
+
+
+class BorrowingFeesTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        self.client.force_authenticate(self.user)
+        today = datetime.today().date()
+        self.on_time = sample_borrowing(
+            user=self.user,
+            expected_return_date=today + timedelta(days=7)
+        )
+        self.overdue = sample_borrowing(
+            user=self.user,
+            expected_return_date=today - timedelta(days=3)
+        )
+        self.returned = sample_borrowing(
+            user=self.user,
+            expected_return_date=today - timedelta(days=5)
+        )
+        Borrowing.objects.filter(
+            pk__in=[self.overdue.pk, self.returned.pk]
+        ).update(borrow_date=today - timedelta(days=10))
+        Borrowing.objects.filter(pk=self.returned.pk).update(
+            actual_return_date=today - timedelta(days=2),
+            is_active=False
+        )
+
+    def test_fee_annotations_match_model_methods(self) -> None:
+        for borrowing in Borrowing.objects.with_fees():
+            self.assertEqual(
+                borrowing.total_fee, borrowing.calculate_total_fee()
+            )
+            self.assertEqual(
+                borrowing.overdue_fee, borrowing.calculate_overdue_fee()
+            )
+
+        self.assertEqual(
+            dict(
+                Borrowing.objects.with_fees().values_list(
+                    "id", "overdue_fee"
+                )
+            ),
+            {
+                self.on_time.id: Decimal("0.00"),
+                self.overdue.id: Decimal("6.00"),
+                self.returned.id: Decimal("6.00"),
+            }
+        )
+
+    def test_list_sorts_and_filters_by_fee(self) -> None:
+        response = self.client.get(
+            BORROWINGS_URL,
+            {"ordering": "-total_fee", "min_overdue_fee": "1"}
+        )
+
+        self.assertEqual(
+            [
+                (borrowing["id"], borrowing["total_fee"])
+                for borrowing in response.data["results"]
+            ],
+            [(self.overdue.id, "7.00"), (self.returned.id, "5.00")]
+        )
+
+    def test_invalid_min_overdue_fee(self) -> None:
+        response = self.client.get(BORROWINGS_URL, {"min_overdue_fee": "x"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArchiveBorrowingsTest(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        self.client.force_authenticate(self.user)
+        today = datetime.today().date()
+        long_ago = today - timedelta(days=500)
+
+        self.paid, self.unpaid, self.recent, self.active = [
+            sample_borrowing(
+                user=self.user,
+                expected_return_date=today + timedelta(days=7)
+            )
+            for _ in range(4)
+        ]
+        Borrowing.objects.filter(
+            pk__in=[self.paid.pk, self.unpaid.pk]
+        ).update(
+            borrow_date=long_ago - timedelta(days=7),
+            expected_return_date=long_ago,
+            actual_return_date=long_ago,
+            is_active=False,
+        )
+        Borrowing.objects.filter(pk=self.recent.pk).update(
+            actual_return_date=today,
+            is_active=False,
+        )
+        for borrowing, payment_status in (
+            (self.paid, "PAID"),
+            (self.unpaid, "EXPIRED"),
+        ):
+            Payment.objects.create(
+                borrowing=borrowing,
+                status=payment_status,
+                session_url="http://example.com",
+                session_id=f"sess_{borrowing.id}",
+                money_to_pay=Decimal("7.00"),
+            )
+
+    def test_archive_moves_old_settled_borrowings(self) -> None:
+        self.assertEqual(archive_returned_borrowings(batch_size=1), 1)
+
+        self.assertFalse(Borrowing.objects.filter(pk=self.paid.pk).exists())
+        self.assertFalse(
+            Payment.objects.filter(borrowing_id=self.paid.pk).exists()
+        )
+        payment = ArchivedPayment.objects.get()
+        self.assertEqual(payment.borrowing_id, self.paid.id)
+        self.assertEqual(payment.session_id, f"sess_{self.paid.id}")
+        self.assertEqual(payment.money_to_pay, Decimal("7.00"))
+        archived = ArchivedBorrowing.objects.get()
+        self.assertEqual(archived.id, self.paid.id)
+        self.assertEqual(archived.total_fee, Decimal("7.00"))
+        self.assertEqual(archived.overdue_fee, Decimal("0.00"))
+        self.assertEqual(archived.payment_status, "PAID")
+        self.assertEqual(archived.money_paid, Decimal("7.00"))
+        self.assertEqual(archive_returned_borrowings(), 0)
+
+    def test_archived_borrowings_read_on_request(self) -> None:
+        archive_returned_borrowings()
+
+        response = self.client.get(BORROWINGS_URL)
+        self.assertNotIn(
+            self.paid.id,
+            [borrowing["id"] for borrowing in response.data["results"]]
+        )
+
+        response = self.client.get(BORROWINGS_URL, {"archived": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        borrowing = response.data["results"][0]
+        self.assertEqual(borrowing["id"], self.paid.id)
+        self.assertFalse(borrowing["is_active"])
+        self.assertEqual(borrowing["total_fee"], "7.00")
+        self.assertEqual(borrowing["user"], self.user.email)
+
+    def test_archived_payments_read_on_request(self) -> None:
+        archive_returned_borrowings()
+        payment = ArchivedPayment.objects.get()
+
+        response = self.client.get(
+            reverse("payment:payment-list"), {"archived": "true"}
+        )
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [payment.id]
+        )
+
+        response = self.client.get(
+            reverse("payment:payment-detail", kwargs={"pk": payment.id})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["session_id"], payment.session_id)
+        self.assertEqual(response.data["borrowing"]["id"], self.paid.id)
+
+    def test_archived_rows_exported_on_request(self) -> None:
+        archive_returned_borrowings()
+        self.user.is_staff = True
+        self.user.save()
+
+        for url in (
+            reverse("borrowings:borrowing-export"),
+            reverse("payment:payment-export"),
+        ):
+            response = self.client.get(
+                url, {"output": "ndjson", "archived": "true"}
+            )
+            rows = [
+                json.loads(line)
+                for line in b"".join(response.streaming_content).splitlines()
+            ]
+            self.assertEqual(len(rows), 1)
+
+    def test_retrieve_falls_back_to_archive(self) -> None:
+        archive_returned_borrowings()
+
+        response = self.client.get(detail_borrowing_url(self.paid.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.paid.id)
+        self.assertEqual(
+            set(response.data),
+            set(BorrowingReadSerializer.Meta.fields)
+        )
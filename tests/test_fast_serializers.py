@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from rest_framework.request import Request
+
+from books.cache import get_catalog_cache
+from books.views import BookViewSet
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingReadSerializer
+from borrowings.views import BorrowingViewSet
+from library_service.serializers import compile_serializer
+from payment.models import Payment
+from payment.serializers import PaymentSerializer
+from payment.views import PaymentViewSet
+from tests.test_books import BOOKS_URL
+from tests.test_borrowings import BORROWINGS_URL, sample_borrowing
+from tests.test_payment import PAYMENTS_LIST, sample_payment
+
+
+class FastSerializationTest(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@test.com",
+            password="testadmin1234",
+        )
+        self.client.force_authenticate(self.admin)
+        today = datetime.today().date()
+        for days in (7, -3):
+            borrowing = sample_borrowing(
+                user=self.admin,
+                expected_return_date=today + timedelta(days=days)
+            )
+            sample_payment(borrowing, money_to_pay="7.50")
+
+    def assertSameOutput(self, view_class, url: str, params: dict) -> None:
+        get_catalog_cache().clear()
+        fast = self.client.get(url, params)
+        get_catalog_cache().clear()
+        with mock.patch.object(view_class, "fast_serialization", False):
+            slow = self.client.get(url, params)
+
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(fast.content, slow.content, params)
+
+    def test_books_output_is_identical(self) -> None:
+        for params in ({}, {"fields": "id,title"}, {"pagination": "cursor"}):
+            self.assertSameOutput(BookViewSet, BOOKS_URL, params)
+
+    def test_borrowings_output_is_identical(self) -> None:
+        for params in (
+            {},
+            {"expand": "book"},
+            {"expand": ""},
+            {"fields": "id,user,total_fee"},
+            {"ordering": "-overdue_fee"},
+            {"pagination": "cursor", "limit": 1},
+            {"archived": "true"},
+        ):
+            self.assertSameOutput(BorrowingViewSet, BORROWINGS_URL, params)
+
+    def test_payments_output_is_identical(self) -> None:
+        for params in (
+            {},
+            {"fields": "id,money_to_pay"},
+            {"expand": "borrowing"},
+        ):
+            self.assertSameOutput(PaymentViewSet, PAYMENTS_LIST, params)
+
+    def test_compiles_only_what_values_can_read(self) -> None:
+        request = Request(APIRequestFactory().get("/", {"expand": "book"}))
+
+        self.assertIsNotNone(
+            compile_serializer(
+                BorrowingReadSerializer(context={"request": request}),
+                Borrowing.objects.with_fees()
+            )
+        )
+        # Fees are annotations, which a payment query does not have.
+        request = Request(
+            APIRequestFactory().get("/", {"expand": "borrowing"})
+        )
+        self.assertIsNone(
+            compile_serializer(
+                PaymentSerializer(context={"request": request}),
+                Payment.objects.all()
+            )
+        )
@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from borrowings.reconciliation import reconcile_expired_payments
+from payment import gateways
+from payment.gateways import GatewayError, RateLimited, get_gateway
+from payment.models import Payment
+from payment.sessions import open_session
+from payment.webhooks import process_events
+from tests.test_books import sample_book
+
+
+FAKE_GATEWAY = {
+    "LATENCY": 0,
+    "ERROR_RATE": 0,
+    "RATE_LIMIT_RATE": 0,
+    "SEED": 1,
+    "CACHE": "default",
+}
+
+
+class IncompleteGateway(gateways.PaymentGateway):
+
+    def retrieve_session(self, session_id: str):
+        return None
+
+
+@override_settings(
+    PAYMENT_GATEWAY="payment.gateways.FakeGateway",
+    FAKE_PAYMENT_GATEWAY=FAKE_GATEWAY,
+    STRIPE_SUCCESS_URL="http://testserver/api/payments/success/",
+    STRIPE_CANCEL_URL="http://testserver/api/payments/cancel/",
+)
+class FakeGatewayTest(APITestCase):
+
+    def setUp(self) -> None:
+        gateways._gateways.clear()
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        self.client.force_authenticate(self.user)
+
+    @mock.patch(
+        "payment.tasks.open_payment_session.delay", side_effect=open_session
+    )
+    def borrow(self, open_payment_session) -> Payment:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("borrowings:borrowing-list"),
+                {
+                    "book": sample_book().id,
+                    "expected_return_date": (
+                        datetime.today().date() + timedelta(days=7)
+                    ),
+                }
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Payment.objects.get(pk=response.data["payment_id"])
+
+    @mock.patch("payment.webhooks.send_messages")
+    @mock.patch("payment.tasks.process_stripe_events.delay")
+    def test_checkout_is_paid_offline(self, process, send_messages):
+        payment = self.borrow()
+        event = get_gateway().pay(payment.session_id)
+
+        response = self.client.post(
+            reverse("payment:payment-webhook"),
+            json.dumps(event),
+            content_type="application/json",
+        )
+        process_events()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PAID")
+
+    def test_sessions_expire_and_are_reconciled(self) -> None:
+        payment = self.borrow()
+        gateway = get_gateway()
+        gateway.expire(payment.session_id)
+        Payment.objects.filter(pk=payment.pk).update(
+            session_expires_at=datetime.now().astimezone()
+        )
+
+        self.assertEqual(
+            gateway.retrieve_session(payment.session_id).status, "expired"
+        )
+        self.assertEqual(
+            reconcile_expired_payments(
+                datetime.now().astimezone() + timedelta(seconds=1)
+            ),
+            1
+        )
+
+    @mock.patch("payment.webhooks.send_messages")
+    @mock.patch("payment.tasks.process_stripe_events.delay")
+    def test_sessions_are_shared_between_processes(
+        self, process, send_messages
+    ) -> None:
+        payment = self.borrow()
+        # A worker process builds its own gateway over the same cache.
+        gateways._gateways.clear()
+
+        self.assertEqual(
+            get_gateway().retrieve_session(payment.session_id).status, "open"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("fake_gateway", "pay", payment.session_id)
+        process_events()
+
+        process.assert_called_once()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PAID")
+
+    def test_failures_are_simulated(self) -> None:
+        for setting, error in (
+            ("ERROR_RATE", GatewayError),
+            ("RATE_LIMIT_RATE", RateLimited),
+        ):
+            with override_settings(
+                FAKE_PAYMENT_GATEWAY={**FAKE_GATEWAY, setting: 1}
+            ):
+                with self.assertRaises(error):
+                    get_gateway().retrieve_session("cs_fake_unknown")
+
+    def test_incomplete_gateway_is_rejected_on_load(self) -> None:
+        with override_settings(
+            PAYMENT_GATEWAY="tests.test_gateways.IncompleteGateway"
+        ):
+            with self.assertRaises(TypeError):
+                get_gateway()
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from books.models import Book
+from borrowings.holds import expire_ready_holds, notify_holders
+from borrowings.models import Borrowing, Hold
+from borrowings.serializers import HoldSerializer
+from payment.models import Payment
+from tests.test_books import sample_book
+
+
+HOLDS_URL = reverse("borrowings:hold-list")
+BORROWINGS_URL = reverse("borrowings:borrowing-list")
+
+
+def detail_hold_url(hold_id: int):
+    return reverse("borrowings:hold-detail", kwargs={"pk": hold_id})
+
+
+def sample_user(email: str):
+    return get_user_model().objects.create_user(
+        email=email,
+        password="testuser1234",
+    )
+
+
+class HoldsTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.reader = sample_user("reader@test.com")
+        self.first = sample_user("first@test.com")
+        self.second = sample_user("second@test.com")
+        self.client.force_authenticate(self.first)
+        self.book = sample_book(inventory=1)
+        self.borrowing = Borrowing.objects.create(
+            user=self.reader,
+            book=self.book,
+            expected_return_date=datetime.today().date() + timedelta(days=7),
+        )
+        Book.objects.checkout_copies({self.book.id: 1})
+
+    def place_hold(self, user) -> Hold:
+        return Hold.objects.create(user=user, book=self.book)
+
+    def assert_inventory(self, inventory: int) -> None:
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, inventory)
+
+    def test_place_hold_on_out_of_stock_book(self) -> None:
+        self.place_hold(self.second)
+
+        response = self.client.post(HOLDS_URL, {"book": self.book.id})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status"], Hold.Status.WAITING)
+        self.assertEqual(response.data["position"], 2)
+
+    def test_hold_rejected_when_in_stock_or_already_held(self) -> None:
+        self.place_hold(self.first)
+        in_stock = sample_book(title="In stock", inventory=1)
+
+        for book in (in_stock, self.book):
+            response = self.client.post(HOLDS_URL, {"book": book.id})
+
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_concurrent_duplicate_hold_rejected(self) -> None:
+        validate_book = HoldSerializer.validate_book
+
+        def place_concurrently(serializer, book):
+            book = validate_book(serializer, book)
+            # Another request places the same hold after this check.
+            self.place_hold(self.first)
+            return book
+
+        with mock.patch.object(
+            HoldSerializer, "validate_book", place_concurrently
+        ):
+            response = self.client.post(HOLDS_URL, {"book": self.book.id})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["book"], ["You already have a hold on this book."]
+        )
+        self.assertEqual(Hold.objects.filter(user=self.first).count(), 1)
+
+    @mock.patch("borrowings.tasks.notify_ready_holds.delay")
+    def test_return_goes_to_oldest_waiting_hold(self, notify) -> None:
+        first = self.place_hold(self.first)
+        second = self.place_hold(self.second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borrowing.return_book()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, Hold.Status.READY)
+        self.assertIsNotNone(first.expires_at)
+        self.assertEqual(second.status, Hold.Status.WAITING)
+        self.assert_inventory(0)
+        notify.assert_called_once_with([first.id])
+
+    @mock.patch("borrowings.tasks.notify_ready_holds.delay")
+    def test_ready_holder_borrows_reserved_copy(self, notify) -> None:
+        hold = self.place_hold(self.first)
+        self.borrowing.return_book()
+
+        response = self.client.post(
+            BORROWINGS_URL,
+            {
+                "book": self.book.id,
+                "expected_return_date": (
+                    datetime.today().date() + timedelta(days=7)
+                ),
+            }
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, Hold.Status.FULFILLED)
+        self.assert_inventory(0)
+        self.assertTrue(
+            Payment.objects.filter(
+                pk=response.data["payment_id"],
+                borrowing__user=self.first,
+            ).exists()
+        )
+
+    @mock.patch("borrowings.tasks.notify_ready_holds.delay")
+    def test_expired_and_cancelled_holds_pass_copy_on(self, notify) -> None:
+        first = self.place_hold(self.first)
+        second = self.place_hold(self.second)
+        self.borrowing.return_book()
+        Hold.objects.filter(pk=first.pk).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(expire_ready_holds(), 1)
+
+        second.refresh_from_db()
+        self.assertEqual(second.status, Hold.Status.READY)
+
+        self.client.force_authenticate(self.second)
+        response = self.client.delete(detail_hold_url(second.id))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        second.refresh_from_db()
+        self.assertEqual(second.status, Hold.Status.CANCELLED)
+        self.assert_inventory(1)
+
+    def test_holds_list_shows_own_holds_only(self) -> None:
+        hold = self.place_hold(self.first)
+        self.place_hold(self.second)
+
+        response = self.client.get(HOLDS_URL)
+
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [hold.id]
+        )
+
+    @mock.patch("borrowings.holds.send_messages")
+    def test_notify_holders_skips_holds_no_longer_ready(
+        self, send_messages
+    ) -> None:
+        ready = self.place_hold(self.first)
+        cancelled = self.place_hold(self.second)
+        Hold.objects.filter(pk=ready.pk).update(
+            status=Hold.Status.READY, expires_at=timezone.now()
+        )
+        Hold.objects.filter(pk=cancelled.pk).update(
+            status=Hold.Status.CANCELLED
+        )
+
+        notify_holders([ready.id, cancelled.id])
+
+        messages = list(send_messages.call_args.args[0])
+        self.assertEqual(len(messages), 1)
+        self.assertIn("first@test.com", messages[0])
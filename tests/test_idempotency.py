@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from borrowings.models import Borrowing
+from library_service.idempotency import (
+    get_idempotency_cache,
+    idempotency_cache_key,
+)
+from payment.models import Payment, PaymentSessionRequest
+from tests.test_books import sample_book
+from tests.test_borrowings import sample_borrowing
+from tests.test_payment import sample_payment
+
+
+BORROWINGS_URL = reverse("borrowings:borrowing-list")
+RENEWAL_URL = reverse("payment:payment-renewal")
+LOCAL_CACHE = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
+
+def return_borrowing_url(borrowing_id: int):
+    return reverse("borrowings:borrowing-return", kwargs={"pk": borrowing_id})
+
+
+@override_settings(
+    STRIPE_SUCCESS_URL="http://testserver/api/payments/success/",
+    STRIPE_CANCEL_URL="http://testserver/api/payments/cancel/",
+    CACHES={
+        "default": LOCAL_CACHE,
+        "catalog": LOCAL_CACHE,
+        "idempotency": LOCAL_CACHE,
+    },
+)
+@mock.patch("payment.tasks.open_payment_session.delay")
+class IdempotencyKeyTestView(APITestCase):
+
+    def setUp(self) -> None:
+        self.cache = get_idempotency_cache()
+        self.cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = sample_book(inventory=5)
+        self.data = {
+            "book": self.book.id,
+            "expected_return_date": (
+                datetime.today().date() + timedelta(days=7)
+            ),
+        }
+
+    def borrow(self, key: str):
+        return self.client.post(
+            BORROWINGS_URL, self.data, HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retried_borrow_replays_response(self, open_session) -> None:
+        first = self.borrow("borrow-1")
+        retry = self.borrow("borrow-1")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Borrowing.objects.count(), 1)
+        self.assertEqual(PaymentSessionRequest.objects.count(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 4)
+
+    def test_keys_are_scoped_by_key_and_user(self, open_session) -> None:
+        self.borrow("borrow-1")
+        # Runs again and is refused: the first payment is still pending.
+        new_key = self.borrow("borrow-2")
+        other = get_user_model().objects.create_user(
+            email="other@test.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(other)
+        other_user = self.borrow("borrow-1")
+
+        self.assertEqual(new_key.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(other_user.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Borrowing.objects.count(), 2)
+
+    def test_key_reused_with_other_body_rejected(self, open_session) -> None:
+        self.borrow("borrow-1")
+        self.data["book"] = sample_book(title="Other").id
+
+        response = self.borrow("borrow-1")
+
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertEqual(Borrowing.objects.count(), 1)
+
+    def test_retry_during_first_request_conflicts(self, open_session) -> None:
+        request = APIRequestFactory().post(BORROWINGS_URL)
+        request.user = self.user
+        lock_key = f"{idempotency_cache_key(request, 'borrow-1')}:lock"
+        self.cache.add(lock_key, "first-request")
+
+        response = self.borrow("borrow-1")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Borrowing.objects.exists())
+        self.assertEqual(self.cache.get(lock_key), "first-request")
+
+    def test_expired_lock_taken_over_is_kept(self, open_session) -> None:
+        request = APIRequestFactory().post(BORROWINGS_URL)
+        request.user = self.user
+        lock_key = f"{idempotency_cache_key(request, 'borrow-1')}:lock"
+
+        def take_over(*args, **kwargs):
+            # The lock expired and a retry took it during the request.
+            self.cache.set(lock_key, "retry")
+            raise RuntimeError
+
+        with mock.patch(
+            "borrowings.views.BorrowingViewSet.get_serializer",
+            side_effect=take_over
+        ):
+            with self.assertRaises(RuntimeError):
+                self.borrow("borrow-1")
+
+        self.assertEqual(self.cache.get(lock_key), "retry")
+
+    @override_settings(
+        CACHES={"default": LOCAL_CACHE, "catalog": LOCAL_CACHE}
+    )
+    def test_missing_idempotency_cache_fails_loudly(
+        self, open_session
+    ) -> None:
+        with self.assertRaises(ImproperlyConfigured):
+            self.borrow("borrow-1")
+
+        response = self.client.post(BORROWINGS_URL, self.data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_failed_request_is_not_stored(self, open_session) -> None:
+        self.data["expected_return_date"] = datetime.today().date()
+
+        first = self.borrow("borrow-1")
+        self.data["expected_return_date"] += timedelta(days=7)
+        retry = self.borrow("borrow-1")
+
+        self.assertEqual(first.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+
+    def test_retried_return_replays_response(self, open_session) -> None:
+        borrowing = sample_borrowing(user=self.user)
+        sample_payment(borrowing)
+        url = return_borrowing_url(borrowing.id)
+
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+        retry = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+
+    def test_retried_renewal_replays_response(self, open_session) -> None:
+        borrowing = sample_borrowing(user=self.user)
+        payment = sample_payment(
+            borrowing, status=Payment.PaymentStatus.EXPIRED.name
+        )
+
+        first = self.client.post(RENEWAL_URL, HTTP_IDEMPOTENCY_KEY="renew-1")
+        retry = self.client.post(RENEWAL_URL, HTTP_IDEMPOTENCY_KEY="renew-1")
+
+        self.assertEqual(first.data["payment_id"], payment.id)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(PaymentSessionRequest.objects.count(), 1)
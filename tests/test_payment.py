@@ -1,16 +1,36 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import stripe
 from django.contrib.auth import get_user_model
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from borrowings.helpers.payment import create_payment_session
 from borrowings.models import Borrowing
-from payment.models import Payment
+from borrowings.reconciliation import reconcile_expired_payments
+from payment.gateways import GatewayError
+from payment.models import Payment, PaymentSessionRequest, StripeEvent
+from payment.sessions import get_stalled_requests, open_session
 from payment.serializers import PaymentSerializer
+from payment.webhooks import process_events
 from tests.test_books import sample_book
 from tests.test_borrowings import sample_borrowing
+from users.models import AccountState
 
 
 PAYMENTS_LIST = reverse("payment:payment-list")
+WEBHOOK_URL = reverse("payment:payment-webhook")
+SUCCESS_URL = reverse("payment:payment-success")
+WEBHOOK_SECRET = "whsec_test"
 
 
 def sample_payment(borrowing=None, **kwargs) -> Payment:
@@ -92,3 +112,427 @@ class AuthenticatedUserPaymentTestView(APITestCase):
         url_2 = detail_payment_url(pay_2.id)
         response = self.client.get(url_2)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SparseFieldsPaymentTestView(APITestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.borrowing = sample_borrowing(user=self.user)
+        self.payment = sample_payment(borrowing=self.borrowing)
+
+    def test_list_expands_borrowing_on_request(self) -> None:
+
+        response = self.client.get(
+            PAYMENTS_LIST,
+            {"fields": "id,borrowing", "expand": "borrowing"}
+        )
+
+        result = response.data["results"][0]
+        self.assertEqual(set(result), {"id", "borrowing"})
+        self.assertEqual(result["borrowing"]["id"], self.borrowing.id)
+
+    def test_detail_collapses_borrowing(self) -> None:
+
+        response = self.client.get(
+            detail_payment_url(self.payment.id),
+            {"fields": "id,status,borrowing", "expand": ""}
+        )
+
+        self.assertEqual(
+            response.data,
+            {
+                "id": self.payment.id,
+                "status": self.payment.status,
+                "borrowing": self.borrowing.id,
+            }
+        )
+
+
+class ExportPaymentsTestView(APITestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.admin_user = get_user_model().objects.create_user(
+            email="admin@test.com",
+            password="adminpassword",
+            is_staff=True,
+        )
+        self.client.force_authenticate(self.admin_user)
+
+    def test_export_streams_payments_with_borrowing_fields(self) -> None:
+        borrowing = sample_borrowing(user=self.admin_user)
+        payment = sample_payment(borrowing=borrowing)
+
+        response = self.client.get(reverse("payment:payment-export"))
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f"{payment.id},PAID,PAYMENT"))
+        self.assertIn(self.admin_user.email, lines[1])
+
+    def test_export_rejects_unknown_format(self) -> None:
+
+        response = self.client.get(
+            reverse("payment:payment-export"),
+            {"output": "xlsx"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ReconcileExpiredPaymentsTest(APITestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+        self.now = timezone.now()
+
+    def pending_payment(self, session_id, expires_at) -> Payment:
+        return sample_payment(
+            sample_borrowing(user=self.user),
+            session_id=session_id,
+            session_expires_at=expires_at,
+            status=Payment.PaymentStatus.PENDING.name,
+        )
+
+    @mock.patch("stripe.checkout.Session.retrieve")
+    @mock.patch("stripe.checkout.Session.list")
+    def test_sessions_not_due_are_skipped(self, list_sessions, retrieve):
+        self.pending_payment("cs_open", self.now + timedelta(hours=1))
+
+        self.assertEqual(reconcile_expired_payments(self.now), 0)
+
+        list_sessions.assert_not_called()
+        retrieve.assert_not_called()
+
+    @mock.patch("stripe.checkout.Session.retrieve")
+    @mock.patch("stripe.checkout.Session.list")
+    def test_expired_sessions_are_listed_then_retrieved(
+        self, list_sessions, retrieve
+    ):
+        listed = self.pending_payment(
+            "cs_listed", self.now - timedelta(minutes=5)
+        )
+        paid_late = self.pending_payment(
+            "cs_complete", self.now - timedelta(hours=2)
+        )
+        legacy = self.pending_payment("cs_legacy", None)
+        list_sessions.return_value.auto_paging_iter.return_value = [
+            mock.Mock(id="cs_listed")
+        ]
+        expires_at = int((self.now - timedelta(days=1)).timestamp())
+        retrieve.side_effect = lambda session_id: {
+            "cs_complete": {"status": "complete", "expires_at": 0},
+            "cs_legacy": {"status": "expired", "expires_at": expires_at},
+        }[session_id]
+
+        self.assertEqual(reconcile_expired_payments(self.now), 2)
+
+        list_sessions.assert_called_once()
+        self.assertEqual(
+            sorted(call.args[0] for call in retrieve.call_args_list),
+            ["cs_complete", "cs_legacy"]
+        )
+        for payment, expected in (
+            (listed, "EXPIRED"),
+            (paid_late, "PENDING"),
+            (legacy, "EXPIRED"),
+        ):
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, expected)
+        self.assertEqual(
+            int(legacy.session_expires_at.timestamp()), expires_at
+        )
+
+    @mock.patch("stripe.checkout.Session.retrieve")
+    @mock.patch("stripe.checkout.Session.list")
+    def test_gateway_errors_skip_only_failing_sessions(
+        self, list_sessions, retrieve
+    ):
+        failing = self.pending_payment(
+            "cs_failing", self.now - timedelta(minutes=5)
+        )
+        expired = self.pending_payment(
+            "cs_expired", self.now - timedelta(minutes=5)
+        )
+        list_sessions.side_effect = stripe.RateLimitError("slow down")
+
+        def retrieve_session(session_id):
+            if session_id == "cs_failing":
+                raise stripe.APIConnectionError("down")
+            return {"status": "expired", "expires_at": 0}
+
+        retrieve.side_effect = retrieve_session
+
+        self.assertEqual(reconcile_expired_payments(self.now), 1)
+
+        failing.refresh_from_db()
+        expired.refresh_from_db()
+        self.assertEqual(failing.status, "PENDING")
+        self.assertEqual(expired.status, "EXPIRED")
+
+
+def session_event(event_id, event_type, session_id, **session) -> dict:
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "data": {"object": {"id": session_id, **session}},
+    }
+
+
+def sign(payload: str, secret: str = WEBHOOK_SECRET) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(),
+        f"{timestamp}.{payload}".encode(),
+        hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTestView(APITestCase):
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+        self.paid = sample_payment(
+            sample_borrowing(user=self.user),
+            session_id="cs_paid",
+            money_to_pay=7,
+            status=Payment.PaymentStatus.PENDING.name,
+        )
+        self.expired = sample_payment(
+            sample_borrowing(user=self.user),
+            session_id="cs_expired",
+            money_to_pay=3,
+            status=Payment.PaymentStatus.PENDING.name,
+        )
+
+    def post_event(self, event: dict, secret: str = WEBHOOK_SECRET):
+        payload = json.dumps(event)
+        return self.client.post(
+            WEBHOOK_URL,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign(payload, secret),
+        )
+
+    @mock.patch("payment.tasks.process_stripe_events.delay")
+    def test_events_are_stored_once(self, process) -> None:
+        event = session_event(
+            "evt_1",
+            "checkout.session.completed",
+            "cs_paid",
+            payment_status="paid",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                response = self.post_event(event)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        process.assert_called_once()
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.status, "PENDING")
+
+    def test_unsigned_events_are_rejected(self) -> None:
+        response = self.post_event(
+            session_event("evt_1", "checkout.session.completed", "cs_paid"),
+            secret="whsec_other",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @mock.patch("payment.webhooks.send_messages")
+    def test_events_are_applied_in_a_batch(self, send_messages) -> None:
+        for event in (
+            session_event(
+                "evt_1",
+                "checkout.session.completed",
+                "cs_paid",
+                payment_status="paid",
+            ),
+            session_event("evt_2", "checkout.session.expired", "cs_expired"),
+        ):
+            StripeEvent.objects.create(
+                id=event["id"], type=event["type"], payload=event
+            )
+
+        self.assertEqual(process_events(), 2)
+        self.assertEqual(process_events(), 0)
+
+        self.paid.refresh_from_db()
+        self.expired.refresh_from_db()
+        self.assertEqual(self.paid.status, "PAID")
+        self.assertEqual(self.expired.status, "EXPIRED")
+        state = AccountState.objects.for_user(self.user)
+        self.assertEqual(
+            (state.blocking_payments, state.outstanding_amount),
+            (1, Decimal("3"))
+        )
+        self.assertEqual(len(list(send_messages.call_args.args[0])), 1)
+
+    @mock.patch("stripe.checkout.Session.retrieve")
+    def test_success_page_reads_local_state(self, retrieve) -> None:
+        self.client.force_authenticate(self.user)
+
+        pending = self.client.get(SUCCESS_URL, {"session_id": "cs_paid"})
+        Payment.objects.filter(pk=self.paid.pk).update(status="PAID")
+        paid = self.client.get(SUCCESS_URL, {"session_id": "cs_paid"})
+        unknown = self.client.get(SUCCESS_URL, {"session_id": "cs_x"})
+
+        self.assertEqual(pending.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(paid.data, {"detail": "Payment succeeded!"})
+        self.assertEqual(unknown.status_code, status.HTTP_404_NOT_FOUND)
+        retrieve.assert_not_called()
+
+
+@override_settings(
+    STRIPE_SUCCESS_URL="http://testserver/api/payments/success/",
+    STRIPE_CANCEL_URL="http://testserver/api/payments/cancel/",
+)
+class PaymentSessionRequestTest(APITestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="user@test.com",
+            password="testpassword"
+        )
+        self.borrowing = sample_borrowing(user=self.user)
+
+    @mock.patch("payment.tasks.open_payment_session.delay")
+    @mock.patch("stripe.checkout.Session.create")
+    def test_session_is_opened_after_commit(
+        self, create_session, open_payment_session
+    ) -> None:
+        with self.captureOnCommitCallbacks() as callbacks:
+            session_request = create_payment_session(
+                self.borrowing, Decimal("7"), "PAYMENT"
+            )
+
+        create_session.assert_not_called()
+        open_payment_session.assert_not_called()
+        payment = Payment.objects.get(borrowing=self.borrowing)
+        self.assertEqual(payment.session_request, session_request)
+        self.assertEqual(payment.session_url, "")
+
+        callbacks[0]()
+
+        open_payment_session.assert_called_once_with(session_request.id)
+
+    @mock.patch("payment.tasks.open_payment_session.delay")
+    @mock.patch("stripe.checkout.Session.create")
+    def test_open_session_fills_payments_once(
+        self, create_session, open_payment_session
+    ) -> None:
+        create_session.return_value = mock.Mock(
+            id="cs_outbox", url="https://checkout.stripe.com/outbox"
+        )
+        session_request = create_payment_session(
+            self.borrowing, Decimal("7"), "PAYMENT"
+        )
+
+        self.assertEqual(open_session(session_request.id), "OPENED")
+        self.assertEqual(open_session(session_request.id), "OPENED")
+
+        create_session.assert_called_once()
+        self.assertEqual(
+            create_session.call_args.kwargs["idempotency_key"],
+            f"payment-session-request-{session_request.id}"
+        )
+        payment = Payment.objects.get(borrowing=self.borrowing)
+        self.assertEqual(
+            (payment.session_id, payment.session_url),
+            ("cs_outbox", "https://checkout.stripe.com/outbox")
+        )
+        self.assertIsNotNone(payment.session_expires_at)
+
+    @mock.patch("payment.tasks.open_payment_session.delay")
+    @mock.patch("stripe.checkout.Session.create")
+    def test_failed_and_superseded_requests(
+        self, create_session, open_payment_session
+    ) -> None:
+        create_session.side_effect = stripe.APIConnectionError("down")
+        first = create_payment_session(
+            self.borrowing, Decimal("7"), "PAYMENT"
+        )
+
+        with self.assertRaises(GatewayError):
+            open_session(first.id)
+
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), ("PENDING", 1))
+        self.assertGreater(first.next_attempt_at, timezone.now())
+
+        create_payment_session(self.borrowing, Decimal("7"), "PAYMENT")
+
+        self.assertEqual(open_session(first.id), "SUPERSEDED")
+        self.assertEqual(
+            PaymentSessionRequest.objects.get(pk=first.pk).status,
+            "SUPERSEDED"
+        )
+
+    @override_settings(PAYMENT_SESSION_MAX_ATTEMPTS=2)
+    @mock.patch("payment.tasks.open_payment_session.delay")
+    @mock.patch("stripe.checkout.Session.create")
+    def test_failed_request_expires_payments_for_renewal(
+        self, create_session, open_payment_session
+    ) -> None:
+        create_session.side_effect = stripe.APIConnectionError("down")
+        session_request = create_payment_session(
+            self.borrowing, Decimal("7"), "PAYMENT"
+        )
+
+        with self.assertRaises(GatewayError):
+            open_session(session_request.id)
+        self.assertEqual(open_session(session_request.id), "FAILED")
+
+        payment = Payment.objects.get(borrowing=self.borrowing)
+        self.assertEqual(payment.status, "EXPIRED")
+        self.assertEqual(
+            AccountState.objects.for_user(self.user).blocking_payments, 1
+        )
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse("payment:payment-renewal"))
+
+        self.assertEqual(response.data["payment_id"], payment.id)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "PENDING")
+        self.assertNotEqual(payment.session_request, session_request)
+
+    @mock.patch("payment.tasks.open_payment_session.delay")
+    @mock.patch("stripe.checkout.Session.create")
+    def test_sweep_skips_requests_in_backoff(
+        self, create_session, open_payment_session
+    ) -> None:
+        create_session.side_effect = stripe.APIConnectionError("down")
+        session_request = create_payment_session(
+            self.borrowing, Decimal("7"), "PAYMENT"
+        )
+        PaymentSessionRequest.objects.filter(pk=session_request.pk).update(
+            next_attempt_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        self.assertEqual(list(get_stalled_requests()), [session_request.id])
+
+        with self.assertRaises(GatewayError):
+            open_session(session_request.id)
+
+        self.assertEqual(list(get_stalled_requests()), [])
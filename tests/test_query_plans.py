@@ -0,0 +1,116 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payment.models import Payment
+
+
+def iter_plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from iter_plan_nodes(child)
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "EXPLAIN plans are PostgreSQL specific"
+)
+class HotQueryPlansTest(TestCase):
+    """
+    Each hot query must be answered from the index added for it.
+    Sequential scans are disabled while planning, so any index would
+    do; the plan has to name one of the expected ones.
+    """
+    BORROWINGS = 2000
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"reader{number}@test.com")
+            for number in range(50)
+        )
+        cls.user = users[0]
+        book = Book.objects.create(
+            title="Sample book",
+            author="Sample author",
+            cover=Book.CoverChoices.HARD,
+            inventory=10,
+            daily_fee=Decimal("1.00"),
+        )
+        today = date.today()
+        borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                user=users[number % len(users)],
+                book=book,
+                expected_return_date=today + timedelta(days=number % 30 - 15),
+                actual_return_date=today if number % 10 else None,
+                is_active=not number % 10,
+            )
+            for number in range(cls.BORROWINGS)
+        )
+        Payment.objects.bulk_create(
+            Payment(
+                borrowing=borrowing,
+                status="PAID" if number % 20 else "PENDING",
+                session_url="https://checkout.stripe.com/test",
+                session_id=f"cs_test_{number}",
+                money_to_pay=Decimal("7.00"),
+            )
+            for number, borrowing in enumerate(borrowings)
+        )
+        with connection.cursor() as cursor:
+            for model in (Borrowing, Payment):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+    def assertUsesIndex(self, queryset, *index_names: str) -> None:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain(format="json")
+
+        root = json.loads(plan)[0]["Plan"]
+        used_indexes = {
+            node["Index Name"]
+            for node in iter_plan_nodes(root)
+            if "Index Name" in node
+        }
+        self.assertTrue(used_indexes & set(index_names), plan)
+
+    def test_overdue_scan(self) -> None:
+        self.assertUsesIndex(
+            Borrowing.objects.filter(
+                expected_return_date__lte=date.today(),
+                actual_return_date__isnull=True,
+            ),
+            "borrowing_unreturned_due_idx"
+        )
+
+    def test_user_active_borrowings(self) -> None:
+        self.assertUsesIndex(
+            Borrowing.objects.filter(
+                user=self.user, is_active=True
+            ).order_by("-id"),
+            "borrowing_user_active_idx"
+        )
+
+    def test_pending_payments(self) -> None:
+        self.assertUsesIndex(
+            Payment.objects.filter(status="PENDING"),
+            # Both partial indexes cover every pending payment.
+            "payment_unsettled_status_idx",
+            "payment_pending_expiry_idx",
+        )
+
+    def test_user_expired_payments(self) -> None:
+        self.assertUsesIndex(
+            Payment.objects.filter(
+                status="EXPIRED", borrowing__user=self.user
+            ),
+            "payment_unsettled_status_idx"
+        )
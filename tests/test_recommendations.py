@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from books.cache import get_catalog_cache
+from books.models import BookPopularity, BookSimilarity
+from books.recommendations import rebuild_popularity, rebuild_similarities
+from borrowings.models import Borrowing
+from tests.test_books import BOOKS_URL, sample_book
+
+
+def similar_books_url(book_id: int) -> str:
+    return reverse("books:book-similar", kwargs={"pk": book_id})
+
+
+class RecommendationsTest(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        get_catalog_cache().clear()
+        self.books = [
+            sample_book(title=f"Sample book_{number}") for number in range(4)
+        ]
+        self.users = [
+            get_user_model().objects.create_user(
+                email=f"reader{number}@test.com",
+                password="testuser1234",
+            )
+            for number in range(3)
+        ]
+        # Readers 0 and 1 borrowed books 0 and 1, reader 2 books 0 and 2.
+        for user, book_numbers in zip(self.users, [(0, 1), (0, 1), (0, 2)]):
+            for number in book_numbers:
+                self.borrow(user, self.books[number])
+
+    def borrow(self, user, book, days_ago: int = 0) -> Borrowing:
+        borrowing = Borrowing.objects.create(
+            user=user,
+            book=book,
+            expected_return_date=date.today() + timedelta(days=7),
+        )
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            borrow_date=date.today() - timedelta(days=days_ago)
+        )
+        return borrowing
+
+    def test_popularity_counts_borrows_per_window(self) -> None:
+        self.borrow(self.users[0], self.books[3], days_ago=10)
+        self.borrow(self.users[1], self.books[3], days_ago=100)
+
+        self.assertEqual(rebuild_popularity(), 4)
+
+        popularity = BookPopularity.objects.get(book=self.books[3])
+        self.assertEqual(popularity.week_borrows, 0)
+        self.assertEqual(popularity.month_borrows, 1)
+        self.assertEqual(popularity.total_borrows, 2)
+
+    def test_list_ordered_by_popularity(self) -> None:
+        rebuild_popularity()
+
+        response = self.client.get(BOOKS_URL, {"ordering": "popular"})
+
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [self.books[0].id, self.books[1].id, self.books[2].id,
+             self.books[3].id],
+        )
+
+    def test_similarities_keep_top_neighbours(self) -> None:
+        self.assertEqual(rebuild_similarities(limit=1), 3)
+
+        self.assertEqual(
+            list(
+                BookSimilarity.objects.order_by("book_id").values_list(
+                    "book_id", "similar_book_id", "score"
+                )
+            ),
+            [
+                (self.books[0].id, self.books[1].id, 2),
+                (self.books[1].id, self.books[0].id, 2),
+                (self.books[2].id, self.books[0].id, 1),
+            ],
+        )
+
+    def test_similar_books_endpoint(self) -> None:
+        rebuild_similarities()
+
+        response = self.client.get(similar_books_url(self.books[0].id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [book["id"] for book in response.data],
+            [self.books[1].id, self.books[2].id],
+        )
+
+    def test_similar_books_of_unknown_book(self) -> None:
+        response = self.client.get(similar_books_url(0))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_similar_books_of_non_numeric_id(self) -> None:
+        response = self.client.get(similar_books_url("abc"))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
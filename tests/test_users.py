@@ -0,0 +1,246 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APITestCase
+
+from books.models import Book
+from borrowings.archive import archive_batch
+from borrowings.models import Borrowing
+from borrowings.serializers import check_account_state
+from payment.models import Payment
+from tests.test_books import sample_book
+from tests.test_borrowings import sample_borrowing
+from tests.test_payment import sample_payment
+from users.models import AccountState
+
+
+BALANCE_URL = reverse("users:balance")
+
+
+class UserBalanceTestView(APITestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        self.client.force_authenticate(self.user)
+        today = datetime.today().date()
+        # 7.00 rent, 6.00 overdue so far, payment pending.
+        overdue = sample_borrowing(
+            user=self.user,
+            expected_return_date=today - timedelta(days=3)
+        )
+        # 5.00 rent, 6.00 overdue when returned, paid.
+        returned = sample_borrowing(
+            user=self.user,
+            expected_return_date=today - timedelta(days=5)
+        )
+        Borrowing.objects.filter(pk__in=[overdue.pk, returned.pk]).update(
+            borrow_date=today - timedelta(days=10)
+        )
+        Borrowing.objects.filter(pk=returned.pk).update(
+            actual_return_date=today - timedelta(days=2),
+            is_active=False
+        )
+        sample_payment(overdue, status="PENDING", money_to_pay=7)
+        sample_payment(returned, status="PAID", money_to_pay=5)
+
+    def test_balance_sums_fees_in_two_queries(self) -> None:
+        with self.assertNumQueries(2):
+            response = self.client.get(BALANCE_URL)
+
+        self.assertEqual(
+            response.data,
+            {
+                "total_fees": "12.00",
+                "overdue_fees": "12.00",
+                "accrued_fees": "24.00",
+                "outstanding_fees": "7.00",
+            }
+        )
+
+    def test_balance_keeps_archived_fees(self) -> None:
+        self.assertEqual(archive_batch(datetime.today().date(), 10), 1)
+
+        response = self.client.get(BALANCE_URL)
+
+        self.assertEqual(response.data["total_fees"], "12.00")
+        self.assertEqual(response.data["overdue_fees"], "12.00")
+        self.assertEqual(response.data["accrued_fees"], "24.00")
+        self.assertEqual(response.data["outstanding_fees"], "7.00")
+
+    def test_balance_of_other_users_is_empty(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="other@test.com",
+                password="testuser1234",
+            )
+        )
+
+        response = self.client.get(BALANCE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["accrued_fees"], "0.00")
+
+    def test_balance_requires_authentication(self) -> None:
+        self.client.force_authenticate(None)
+
+        response = self.client.get(BALANCE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+def account_state(user) -> tuple:
+    state = AccountState.objects.for_user(user)
+    return (
+        state.active_loans,
+        state.blocking_payments,
+        state.outstanding_amount,
+    )
+
+
+@override_settings(
+    STRIPE_SUCCESS_URL="http://testserver/api/payments/success/",
+    STRIPE_CANCEL_URL="http://testserver/api/payments/cancel/",
+)
+class AccountStateTest(APITestCase):
+    checkout_url = reverse("borrowings:borrowing-checkout")
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.com",
+            password="testuser1234",
+        )
+        self.client.force_authenticate(self.user)
+        self.books = [
+            sample_book(title=f"Sample book_{number}", inventory=1)
+            for number in range(2)
+        ]
+        self.payload = {
+            "books": [book.id for book in self.books],
+            "expected_return_date": (
+                datetime.today().date() + timedelta(days=7)
+            ),
+        }
+
+    def test_state_follows_borrowings_and_payments(self) -> None:
+        borrowing = sample_borrowing(user=self.user)
+        self.assertEqual(account_state(self.user), (1, 0, Decimal("0")))
+
+        payment = sample_payment(
+            borrowing, status="PENDING", money_to_pay=7
+        )
+        self.assertEqual(account_state(self.user), (1, 1, Decimal("7")))
+
+        payment.status = Payment.PaymentStatus.EXPIRED.name
+        payment.save()
+        self.assertEqual(account_state(self.user), (1, 1, Decimal("7")))
+
+        payment.status = Payment.PaymentStatus.PAID.name
+        payment.save()
+        borrowing.return_book()
+        self.assertEqual(account_state(self.user), (0, 0, Decimal("0")))
+
+    def test_saves_and_deletes_do_not_reread_state(self) -> None:
+        borrowing = Borrowing.objects.get(
+            pk=sample_borrowing(user=self.user).pk
+        )
+        borrowing.is_active = False
+
+        # The UPDATE and the AccountState upsert.
+        with self.assertNumQueries(2):
+            borrowing.save()
+
+        self.assertEqual(account_state(self.user), (0, 0, Decimal("0")))
+        with self.assertNumQueries(3):
+            Borrowing.objects.filter(pk=borrowing.pk).delete()
+
+    def test_rebuild_matches_running_totals(self) -> None:
+        sample_payment(
+            sample_borrowing(user=self.user),
+            status="EXPIRED",
+            money_to_pay=4
+        )
+        sample_borrowing(user=self.user).return_book()
+        expected = account_state(self.user)
+
+        AccountState.objects.all().delete()
+        AccountState.objects.rebuild()
+
+        self.assertEqual(account_state(self.user), expected)
+        self.assertEqual(expected, (1, 1, Decimal("4")))
+
+    @mock.patch("stripe.checkout.Session.create")
+    def test_checkout_and_bulk_return_keep_state(
+        self, create_session
+    ) -> None:
+        create_session.return_value = mock.Mock(
+            id="cs_test_cart", url="https://checkout.stripe.com/cart"
+        )
+
+        response = self.client.post(
+            self.checkout_url, self.payload, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(account_state(self.user), (2, 2, Decimal("14")))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.post(
+            reverse("borrowings:borrowing-bulk-return"),
+            {"ids": response.data["borrowings"]},
+            format="json"
+        )
+
+        self.assertEqual(account_state(self.user), (0, 2, Decimal("14")))
+
+    @mock.patch("stripe.checkout.Session.create")
+    def test_expired_payment_blocks_borrowing(self, create_session) -> None:
+        sample_payment(
+            sample_borrowing(user=self.user),
+            status=Payment.PaymentStatus.EXPIRED.name
+        )
+
+        response = self.client.post(
+            self.checkout_url, self.payload, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        create_session.assert_not_called()
+
+    @override_settings(MAX_ACTIVE_LOANS=2)
+    @mock.patch("stripe.checkout.Session.create")
+    def test_active_loans_are_limited(self, create_session) -> None:
+        sample_borrowing(user=self.user)
+
+        response = self.client.post(
+            self.checkout_url, self.payload, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        create_session.assert_not_called()
+        self.assertEqual(
+            Book.objects.filter(
+                pk__in=self.payload["books"], inventory=1
+            ).count(),
+            2
+        )
+
+    def test_gating_reads_one_row(self) -> None:
+        sample_payment(
+            sample_borrowing(user=self.user),
+            status=Payment.PaymentStatus.PENDING.name
+        )
+
+        with self.assertNumQueries(1):
+            with self.assertRaises(ValidationError):
+                check_account_state(self.user, new_loans=1)
@@ -0,0 +1,38 @@
+from collections import defaultdict
+from decimal import Decimal
+from enum import Enum
+
+
+UNPAID_STATUSES = ("PENDING", "EXPIRED")
+
+
+def loan_state(is_active: bool) -> dict:
+    return {"active_loans": 1 if is_active else 0}
+
+
+def payment_state(status, amount) -> dict:
+    """What a payment adds to its user's state"""
+    if isinstance(status, Enum):
+        status = status.name
+    if status not in UNPAID_STATUSES:
+        return {}
+    return {
+        "blocking_payments": 1,
+        "outstanding_amount": Decimal(str(amount or 0)),
+    }
+
+
+class StateDeltas(defaultdict):
+    """Per-user deltas to AccountState counters"""
+
+    def __init__(self) -> None:
+        super().__init__(dict)
+
+    def add(self, user_id: int, state: dict, sign: int = 1) -> None:
+        delta = self[user_id]
+        for name, value in state.items():
+            delta[name] = delta.get(name, 0) + sign * value
+
+    def change(self, user_id: int, old: dict, new: dict) -> None:
+        self.add(user_id, old, -1)
+        self.add(user_id, new)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.models import AccountState
+
+
+class Command(BaseCommand):
+    """Recount every user's borrowing state from borrowings and payments"""
+
+    def handle(self, *args, **options) -> None:
+        AccountState.objects.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {AccountState.objects.count()} account states"
+            )
+        )
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:34
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_account_states(apps, schema_editor):
+    AccountState = apps.get_model("users", "AccountState")
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    Payment = apps.get_model("payment", "Payment")
+    db_alias = schema_editor.connection.alias
+
+    states = {}
+    for user_id, active_loans in (
+        Borrowing.objects.using(db_alias)
+        .filter(is_active=True)
+        .values_list("user")
+        .annotate(count=Count("id"))
+        .order_by()
+    ):
+        states[user_id] = AccountState(user_id=user_id, active_loans=active_loans)
+    for user_id, blocking_payments, outstanding_amount in (
+        Payment.objects.using(db_alias)
+        .filter(status__in=["PENDING", "EXPIRED"])
+        .values_list("borrowing__user")
+        .annotate(count=Count("id"), amount=Sum("money_to_pay"))
+        .order_by()
+    ):
+        state = states.setdefault(user_id, AccountState(user_id=user_id))
+        state.blocking_payments = blocking_payments
+        state.outstanding_amount = outstanding_amount
+    AccountState.objects.using(db_alias).bulk_create(states.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        ("borrowings", "0004_archivedborrowing"),
+        ("payment", "0008_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountState",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="account_state",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("active_loans", models.IntegerField(default=0)),
+                ("blocking_payments", models.IntegerField(default=0)),
+                (
+                    "outstanding_amount",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0"), max_digits=12
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(count_account_states, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,17 @@
 
-from django.db import models
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Count, Sum
 from django.utils.translation import gettext as _
 from django.contrib.auth.models import (
     AbstractUser,
     UserManager as DjangoUserManager
 )
 
+from users.account_state import UNPAID_STATUSES
+
 
 class UserManager(DjangoUserManager):
     """Define a model manager for User model with no username field."""
@@ -61,3 +67,134 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+
+
+class AccountStateQuerySet(models.QuerySet):
+
+    def add(self, deltas: dict[int, dict]) -> None:
+        """
+        Add per-user deltas ({user_id: {"active_loans": 1, ...}}) with
+        one INSERT ... ON CONFLICT DO UPDATE SET x = x + delta, so
+        concurrent borrows, returns and payments never lose an update.
+        """
+        rows = sorted(
+            (
+                user_id,
+                delta.get("active_loans", 0),
+                delta.get("blocking_payments", 0),
+                delta.get("outstanding_amount", Decimal("0")),
+            )
+            for user_id, delta in deltas.items()
+            if any(delta.values())
+        )
+        if not rows:
+            return
+
+        table = AccountState._meta.db_table
+        placeholders = ", ".join("(%s, %s, %s, %s)" for _ in rows)
+        sql = (
+            f"INSERT INTO {table} "
+            f"(user_id, active_loans, blocking_payments, outstanding_amount) "
+            f"VALUES {placeholders} "
+            f"ON CONFLICT (user_id) DO UPDATE SET "
+            f"active_loans = {table}.active_loans + EXCLUDED.active_loans, "
+            f"blocking_payments = "
+            f"{table}.blocking_payments + EXCLUDED.blocking_payments, "
+            f"outstanding_amount = "
+            f"{table}.outstanding_amount + EXCLUDED.outstanding_amount"
+        )
+        params = [param for row in rows for param in row]
+
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def rebuild(self) -> None:
+        """Recount every user's state from borrowings and payments."""
+        from borrowings.models import Borrowing
+        from payment.models import Payment
+
+        states = {}
+        for user_id, active_loans in (
+            Borrowing.objects.using(self.db).filter(is_active=True)
+            .values_list("user").annotate(count=Count("id")).order_by()
+        ):
+            states[user_id] = self.model(
+                user_id=user_id, active_loans=active_loans
+            )
+        for user_id, blocking_payments, outstanding_amount in (
+            Payment.objects.using(self.db)
+            .filter(status__in=UNPAID_STATUSES)
+            .values_list("borrowing__user")
+            .annotate(count=Count("id"), amount=Sum("money_to_pay"))
+            .order_by()
+        ):
+            state = states.setdefault(user_id, self.model(user_id=user_id))
+            state.blocking_payments = blocking_payments
+            state.outstanding_amount = outstanding_amount
+
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create(states.values())
+
+    def lock_for_user(self, user) -> "AccountState":
+        """
+        The user's state, created if missing, with its row locked until
+        the transaction ends: one INSERT ... ON CONFLICT DO UPDATE
+        RETURNING. Concurrent borrows of the same user queue here, so
+        each sees the loans the previous one added.
+        """
+        table = AccountState._meta.db_table
+        sql = (
+            f"INSERT INTO {table} "
+            f"(user_id, active_loans, blocking_payments, outstanding_amount) "
+            f"VALUES (%s, 0, 0, 0) "
+            f"ON CONFLICT (user_id) DO UPDATE SET "
+            f"active_loans = {table}.active_loans "
+            f"RETURNING active_loans, blocking_payments, outstanding_amount"
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [user.pk])
+            active_loans, blocking_payments, outstanding_amount = (
+                cursor.fetchone()
+            )
+        return AccountState(
+            user=user,
+            active_loans=active_loans,
+            blocking_payments=blocking_payments,
+            outstanding_amount=outstanding_amount,
+        )
+
+    def for_user(self, user) -> "AccountState":
+        """The user's state by primary key, empty if never recorded."""
+        state = self.filter(pk=user.pk).first()
+        return state or AccountState(user=user)
+
+
+class AccountState(models.Model):
+    """
+    Running totals used to gate borrowing: active loans, unpaid
+    (pending or expired) payments and what those payments owe.
+    Kept in step by the borrowing and payment signals and by the
+    bulk paths that bypass them.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="account_state"
+    )
+    active_loans = models.IntegerField(default=0)
+    blocking_payments = models.IntegerField(default=0)
+    outstanding_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0")
+    )
+
+    objects = AccountStateQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return (
+            f"User {self.user_id}: {self.active_loans} active loans, "
+            f"{self.blocking_payments} unpaid payments"
+        )
@@ -45,3 +45,13 @@ class UserSerializer(serializers.ModelSerializer):
             user.set_password(password)
             user.save()
         return user
+
+
+class UserBalanceSerializer(serializers.Serializer):
+    total_fees = serializers.DecimalField(max_digits=12, decimal_places=2)
+    overdue_fees = serializers.DecimalField(max_digits=12, decimal_places=2)
+    accrued_fees = serializers.DecimalField(max_digits=12, decimal_places=2)
+    outstanding_fees = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2
+    )
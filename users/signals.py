@@ -0,0 +1,125 @@
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from borrowings.models import Borrowing
+from payment.models import Payment
+from users.account_state import StateDeltas, loan_state, payment_state
+from users.models import AccountState
+
+
+def _loaded_state(instance, state, *fields) -> dict | None:
+    """
+    What `instance` added to its user's state when it was read from the
+    database: {} for a new instance, None when a field was deferred.
+    """
+    if instance.pk is None:
+        return {}
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return None
+    return state(*(values[field] for field in fields))
+
+
+def _stored(instance, *fields) -> dict | None:
+    if instance.pk is None or instance._state.adding:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values(
+        *fields
+    ).first()
+
+
+# The old state is carried over from when the row was read, so saves
+# and deletes (including cascades) add no SELECT; it is only read back
+# for instances loaded with the fields deferred.
+@receiver(post_init, sender=Borrowing)
+def remember_loan_state(sender, instance, **kwargs) -> None:
+    instance._stored_account_state = _loaded_state(
+        instance, loan_state, "is_active"
+    )
+
+
+@receiver(pre_save, sender=Borrowing)
+@receiver(pre_delete, sender=Borrowing)
+def read_loan_state(sender, instance, **kwargs) -> None:
+    if instance._stored_account_state is not None:
+        return
+    stored = _stored(instance, "is_active")
+    instance._stored_account_state = (
+        loan_state(stored["is_active"]) if stored else {}
+    )
+
+
+@receiver(post_save, sender=Borrowing)
+def update_loan_state(sender, instance, **kwargs) -> None:
+    new = loan_state(instance.is_active)
+    deltas = StateDeltas()
+    deltas.change(instance.user_id, instance._stored_account_state, new)
+    AccountState.objects.add(deltas)
+    instance._stored_account_state = new
+
+
+@receiver(post_delete, sender=Borrowing)
+def release_loan_state(sender, instance, **kwargs) -> None:
+    deltas = StateDeltas()
+    deltas.add(instance.user_id, instance._stored_account_state, -1)
+    AccountState.objects.add(deltas)
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_state(sender, instance, **kwargs) -> None:
+    instance._stored_account_state = _loaded_state(
+        instance, payment_state, "status", "money_to_pay"
+    )
+
+
+@receiver(pre_save, sender=Payment)
+@receiver(pre_delete, sender=Payment)
+def read_payment_state(sender, instance, **kwargs) -> None:
+    if instance._stored_account_state is not None:
+        return
+    stored = _stored(instance, "status", "money_to_pay", "borrowing__user")
+    instance._stored_account_state = (
+        payment_state(stored["status"], stored["money_to_pay"])
+        if stored else {}
+    )
+    instance._stored_user_id = stored["borrowing__user"] if stored else None
+
+
+def _payment_user_id(payment) -> int:
+    if getattr(payment, "_stored_user_id", None):
+        return payment._stored_user_id
+    if Payment.borrowing.is_cached(payment):
+        return payment.borrowing.user_id
+    return Borrowing.objects.values_list("user_id", flat=True).get(
+        pk=payment.borrowing_id
+    )
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_state(sender, instance, **kwargs) -> None:
+    old = instance._stored_account_state
+    new = payment_state(instance.status, instance.money_to_pay)
+    instance._stored_account_state = new
+    if old == new:
+        return
+
+    deltas = StateDeltas()
+    deltas.change(_payment_user_id(instance), old, new)
+    AccountState.objects.add(deltas)
+
+
+@receiver(post_delete, sender=Payment)
+def release_payment_state(sender, instance, **kwargs) -> None:
+    old = instance._stored_account_state
+    if not old:
+        return
+
+    deltas = StateDeltas()
+    deltas.add(_payment_user_id(instance), old, -1)
+    AccountState.objects.add(deltas)
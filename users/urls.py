@@ -4,7 +4,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
-from users.views import CreateUserView, ManageUserView
+from users.views import CreateUserView, ManageUserView, UserBalanceView
 
 app_name = "users"
 
@@ -13,4 +13,5 @@ urlpatterns = [
     path("token/", TokenObtainPairView.as_view(), name="token_create"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("me/", ManageUserView.as_view(), name="manage"),
+    path("me/balance/", UserBalanceView.as_view(), name="balance"),
 ]
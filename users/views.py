@@ -1,7 +1,14 @@
+from decimal import Decimal
+
+from django.db.models import Sum
+from drf_spectacular.utils import extend_schema
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from users.serializers import UserSerializer
+from borrowings.models import ArchivedBorrowing, Borrowing
+from users.serializers import UserBalanceSerializer, UserSerializer
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -15,3 +22,28 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         return self.request.user
+
+
+class UserBalanceView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(responses=UserBalanceSerializer)
+    def get(self, request, *args, **kwargs) -> Response:
+        """
+        Rental and overdue fees accrued by the user's borrowings,
+        archived ones included, and the amount their unpaid payments
+        still owe. Archived loans are settled, so they owe nothing.
+        """
+        balance = Borrowing.objects.filter(user=request.user).balance()
+        archived = ArchivedBorrowing.objects.filter(
+            user=request.user
+        ).aggregate(
+            total_fees=Sum("total_fee", default=Decimal("0.00")),
+            overdue_fees=Sum("overdue_fee", default=Decimal("0.00")),
+        )
+        for field, amount in archived.items():
+            balance[field] += amount
+        balance["accrued_fees"] = (
+            balance["total_fees"] + balance["overdue_fees"]
+        )
+        return Response(UserBalanceSerializer(balance).data)